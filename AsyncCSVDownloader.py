@@ -0,0 +1,254 @@
+import asyncio
+import json
+import os
+import time
+import aiohttp
+
+from api_client import ApiClient, ApiHTTPError
+from polling_strategy import AdaptivePollingStrategy, get_polling_strategy
+from utils import extract_date, ensure_folder_exists
+from logs.logging_config import logger
+from tenacity import (
+    retry,
+    stop_after_attempt,
+    wait_exponential,
+    retry_if_exception_type,
+)
+
+
+class AsyncCSVDownloader:
+    """
+    Asynchronous version of CSVDownloader.
+    Download the CSV file for a given station and date range through a shared ApiClient.
+    Date range must be 1 year maximum.
+    """
+
+    def __init__(
+        self,
+        num_station: str,
+        date_start: str,
+        date_end: str,
+        client: ApiClient = None,
+        polling_strategy: AdaptivePollingStrategy = None,
+        chunk_size: int = 64 * 1024,
+    ):
+        """
+
+        :param num_station: Station number
+        :param date_start: Date range start. Date ISO format.
+        :param date_end: Date range end. Date ISO format.
+        :param client: Shared API client. If None, run() opens its own client.
+        :param polling_strategy: Delays between two polls. Default is the process-wide strategy.
+        :param chunk_size: Size in bytes of the chunks written to disk while downloading.
+        """
+        self.num_station = num_station
+        self.date_start = date_start
+        self.date_end = date_end
+        self.client = client
+        self.polling_strategy = polling_strategy or get_polling_strategy()
+        self.range_days = AdaptivePollingStrategy.get_range_days(date_start, date_end)
+        # Wall clock times, so that the order time can be saved in the ledger and resumed
+        self.ordered_at: float = None
+        self.last_pending_at: float = None
+        self.chunk_size = chunk_size
+        self.downloaded_bytes = 0
+        self.download_is_complete = False
+        self.save_path = (
+            f"data_meteo_histo/{num_station}/from{extract_date(date_start)}_"
+            f"to{extract_date(date_end)}.csv"
+        )
+
+    def get_command_path(self) -> str:
+        """
+        Get the API path used to order the CSV file for the station and date range.
+        :return:
+        """
+        return (
+            f"/public/DPClim/v1/commande-station/quotidienne?"
+            f"id-station={self.num_station}&date-deb-periode={self.date_start}&"
+            f"date-fin-periode={self.date_end}"
+        )
+
+    def get_file_path(self, command_number) -> str:
+        """
+        Get the API path used to download the CSV file of a command number.
+        :param command_number:
+        :return:
+        """
+        return f"/public/DPClim/v1/commande/fichier?id-cmde={command_number}"
+
+    @retry(
+        stop=stop_after_attempt(10),
+        wait=wait_exponential(
+            multiplier=1, min=2, max=60
+        ),  # Exponential backoff (2, 4, 8, ... max 60 seconds)
+        retry=retry_if_exception_type(
+            aiohttp.ClientError
+        ),  # Retry for request exceptions
+    )
+    async def get_command_number(self) -> bytes:
+        """
+        Get the command number for the given station and date range.
+        This command number will be used to download the CSV file.
+        :return:
+        """
+        return await self.order_csv()
+
+    async def order_csv(self) -> bytes:
+        """
+        Order once the CSV file for the given station and date range.
+        :return: The API response content holding the command number.
+        """
+        response = await self.client.get(self.get_command_path())
+        logger.info(f"Response Status Code:{response.status_code}")
+
+        if response.status_code == 202:
+            logger.info(
+                f"Request accepted for station {self.num_station} from "
+                f"{self.date_start} to {self.date_end}"
+            )
+            self.ordered_at = time.time()
+            self.last_pending_at = self.ordered_at
+            return response.content
+        else:
+            logger.error(f"Response Content: {response.content}")
+            raise ApiHTTPError(response.status_code, response.url, response.content)
+
+    def extract_command_number(self, api_response: bytes):
+        """
+        Extract the command number from the API response
+        :param api_response:
+        :return:
+        """
+        response_str = api_response.decode("utf-8")
+        response_dict = json.loads(response_str)
+        return response_dict["elaboreProduitAvecDemandeResponse"]["return"]
+
+    @retry(
+        stop=stop_after_attempt(10),
+        wait=wait_exponential(
+            multiplier=1, min=2, max=60
+        ),  # Exponential backoff (2, 4, 8, ... max 60 seconds)
+        retry=retry_if_exception_type(
+            aiohttp.ClientError
+        ),  # Retry for request exceptions
+    )
+    async def download_csv(self, command_number: int) -> str:
+        """
+        Download the CSV file for the given command number
+        :param command_number:
+        :return: Path of the saved file.
+        """
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.next_poll_delay(attempt))
+            save_path = await self.poll_csv(command_number)
+            attempt += 1
+            if save_path is not None:
+                return save_path
+
+    def next_poll_delay(self, attempt: int) -> float:
+        """
+        Get the delay before the next poll, from the latencies learned by the polling strategy.
+        :param attempt: Number of polls already sent for the command number.
+        :return: Delay in seconds.
+        """
+        if self.ordered_at is None:
+            self.ordered_at = time.time()
+        elapsed = time.time() - self.ordered_at
+        return self.polling_strategy.next_delay(self.range_days, elapsed, attempt)
+
+    async def poll_csv(self, command_number: int):
+        """
+        Ask once for the CSV file of the given command number and save it if it is ready.
+        :param command_number:
+        :return: Path of the saved file if the file is ready, None if production is still pending.
+        """
+        async with self.client.stream(self.get_file_path(command_number)) as response:
+            logger.info(f"Response Status Code:{response.status}")
+
+            if response.status == 204:
+                logger.info("Production encore en attente ou en cours.")
+                self.last_pending_at = time.time()
+                return None
+
+            elif response.status == 201:
+                # Without a pending poll since the order, the latency has no lower bound
+                if self.ordered_at is not None and self.last_pending_at is not None:
+                    self.polling_strategy.record_ready(
+                        self.range_days,
+                        self.last_pending_at - self.ordered_at,
+                        time.time() - self.ordered_at,
+                    )
+                await self.save_csv(response)
+                return self.save_path
+
+            else:
+                content = await response.read()
+                logger.error(f"Response Content: {content}")
+                raise ApiHTTPError(response.status, str(response.url), content)
+
+    async def save_csv(self, response: aiohttp.ClientResponse):
+        """
+        Stream the downloaded CSV file to the station folder.
+        Chunks are written to a temporary file renamed to save_path once complete, so that an
+        interrupted download never leaves a truncated CSV file at save_path.
+        :param response: Response whose body is the CSV file.
+        :return:
+        """
+        logger.info("Downloading file...")
+        station_folder = f"data_meteo_histo/{self.num_station}"
+        ensure_folder_exists(station_folder)
+
+        # Save the file to the station folder if it doesn't exist
+        if os.path.exists(self.save_path):
+            logger.info(f"File already exists at {self.save_path}")
+            self.download_is_complete = True
+            return
+
+        temporary_path = os.path.join(
+            station_folder, f".{os.path.basename(self.save_path)}.part"
+        )
+        self.downloaded_bytes = 0
+        try:
+            with open(temporary_path, "wb") as file:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    file.write(chunk)
+                    self.downloaded_bytes += len(chunk)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, self.save_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+        logger.info(
+            f"File downloaded successfully and saved to {self.save_path} "
+            f"({self.downloaded_bytes} bytes)"
+        )
+        self.download_is_complete = True
+
+    async def run(self):
+        """
+        Run the downloader.
+        Open a client for this download only if no shared client was given.
+        :return:
+        """
+        if self.client is None:
+            async with ApiClient() as client:
+                self.client = client
+                try:
+                    return await self.run()
+                finally:
+                    self.client = None
+
+        try:
+            command_number = self.extract_command_number(
+                await self.get_command_number()
+            )
+            await self.download_csv(command_number)
+        except aiohttp.ClientError as http_err:
+            logger.error(f"HTTP error occurred: {http_err}")
+        except Exception as err:
+            logger.error(f"An error occurred: {err}")
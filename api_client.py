@@ -0,0 +1,221 @@
+import aiohttp
+from contextlib import asynccontextmanager
+
+from config import API_KEY, BASE_URL
+from logs.logging_config import logger
+from rate_limiter import TokenBucketRateLimiter, get_rate_limiter, parse_retry_after
+from response_cache import CacheMissError, ResponseCache, get_response_cache
+
+
+class ApiHTTPError(aiohttp.ClientError):
+    """
+    Error raised when the API answers with an unexpected status code.
+    """
+
+    def __init__(self, status_code: int, url: str, content: bytes = b""):
+        """
+
+        :param status_code: HTTP status code of the response.
+        :param url: Requested URL.
+        :param content: Response content.
+        """
+        super().__init__(f"{status_code} Error for url: {url}")
+        self.status_code = status_code
+        self.url = url
+        self.content = content
+
+
+class ApiResponse:
+    """
+    Response of the API, fully read.
+    """
+
+    def __init__(self, status_code: int, content: bytes, headers: dict, url: str):
+        """
+
+        :param status_code: HTTP status code.
+        :param content: Response content.
+        :param headers: Response headers.
+        :param url: Requested URL.
+        """
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.url = url
+
+    def raise_for_status(self):
+        """
+        Raise an ApiHTTPError if the status code is a client or server error (4xx or 5xx).
+        :return:
+        """
+        if self.status_code >= 400:
+            raise ApiHTTPError(self.status_code, self.url, self.content)
+
+
+class ApiClient:
+    """
+    Asynchronous client of the Météo-France API.
+    All requests share one pooled keep-alive HTTP session and go through the process-wide
+    rate limiter. 429 responses pause every request for the Retry-After delay before the
+    request is sent again.
+    Use it as an async context manager :
+
+        async with ApiClient() as client:
+            response = await client.get(url)
+    """
+
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        api_key: str = API_KEY,
+        max_connections: int = 20,
+        timeout: float = 60,
+        rate_limiter: TokenBucketRateLimiter = None,
+        max_too_many_requests: int = 10,
+        cache: ResponseCache = None,
+    ):
+        """
+
+        :param base_url: API base URL. Can point to a local stand-in server.
+        :param api_key: API key.
+        :param max_connections: Maximum number of simultaneous connections of the pool.
+        :param timeout: Timeout in seconds to connect and between two reads of a response.
+        :param rate_limiter: Rate limiter of the requests. Default is the process-wide one.
+        :param max_too_many_requests: Maximum number of 429 responses accepted for one request.
+        :param cache: Cache of the responses requested with a cache_ttl. Default is the
+        process-wide one.
+        """
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.max_too_many_requests = max_too_many_requests
+        self.cache = cache
+        self.headers = {"accept": "*/*", "Authorization": f"Bearer {self.api_key}"}
+        self.session: aiohttp.ClientSession = None
+
+    async def __aenter__(self):
+        self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def open(self):
+        """
+        Open the pooled HTTP session. Must be called from a running event loop.
+        :return:
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=self.timeout, sock_read=self.timeout
+                ),
+            )
+
+    async def close(self):
+        """
+        Close the pooled HTTP session.
+        :return:
+        """
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def build_url(self, path: str) -> str:
+        """
+        Build the full URL of an API path.
+        :param path: Path like /public/DPClim/v1/... or a full URL.
+        :return:
+        """
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}{path}"
+
+    @asynccontextmanager
+    async def stream(self, path: str, headers: dict = None):
+        """
+        Send a GET request and give the response before its body is read.
+        The body can then be read by chunks with response.content.iter_chunked().
+        :param path: Path like /public/DPClim/v1/... or a full URL.
+        :param headers: Additional headers of the request.
+        :return: aiohttp.ClientResponse, released when the context exits.
+        """
+        if self.session is None:
+            self.open()
+
+        url = self.build_url(path)
+        rate_limiter = self.rate_limiter or get_rate_limiter()
+
+        for attempt in range(1, self.max_too_many_requests + 1):
+            await rate_limiter.acquire_async()
+            response = await self.session.get(url, headers=headers)
+            logger.debug(f"GET {url} -> {response.status}")
+
+            if response.status != 429 or attempt == self.max_too_many_requests:
+                break
+            response.release()
+            rate_limiter.block(parse_retry_after(response.headers.get("Retry-After")))
+
+        try:
+            yield response
+        finally:
+            response.release()
+
+    async def get(self, path: str, cache_ttl: float = None) -> ApiResponse:
+        """
+        Send a GET request and read the whole response.
+        With a cache_ttl, a cached response is returned without request while it is fresh, and
+        revalidated with its ETag or Last-Modified date once its TTL is over. In offline mode, the
+        cached response is returned whatever its age.
+        :param path: Path like /public/DPClim/v1/... or a full URL.
+        :param cache_ttl: Seconds during which the response is used from the cache. Responses
+        are not cached if None.
+        :return:
+        """
+        if cache_ttl is None:
+            async with self.stream(path) as response:
+                content = await response.read()
+                return ApiResponse(
+                    response.status, content, dict(response.headers), str(response.url)
+                )
+
+        url = self.build_url(path)
+        cache = self.cache or get_response_cache()
+        cached_response = cache.get(url)
+        if cached_response is not None and (cache.offline or cached_response.is_fresh):
+            cache.hits_count += 1
+            return self.from_cached_response(cached_response)
+        if cache.offline:
+            cache.misses_count += 1
+            raise CacheMissError(url)
+
+        validator_headers = (
+            cached_response.get_validator_headers() if cached_response else None
+        )
+        async with self.stream(path, validator_headers) as response:
+            content = await response.read()
+            api_response = ApiResponse(
+                response.status, content, dict(response.headers), str(response.url)
+            )
+
+        if api_response.status_code == 304 and cached_response is not None:
+            cache.revalidated_count += 1
+            cache.refresh(url, cache_ttl)
+            return self.from_cached_response(cached_response)
+        cache.misses_count += 1
+        if api_response.status_code == 200:
+            cache.put(url, 200, content, api_response.headers, cache_ttl)
+        return api_response
+
+    def from_cached_response(self, cached_response) -> ApiResponse:
+        return ApiResponse(
+            cached_response.status_code,
+            cached_response.content,
+            cached_response.headers,
+            cached_response.url,
+        )
@@ -0,0 +1,265 @@
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from logs.logging_config import logger
+from histo_schema import normalise_station_ids
+from histo_storage import (
+    PARQUET,
+    CSV,
+    PARQUET_COMPRESSION,
+    PARQUET_ROW_GROUP_SIZE,
+    get_file_format,
+    parse_histo_dates,
+    read_histo_columns,
+)
+
+CSV_CHUNK_SIZE = 200_000
+
+
+def load_mnemonic_to_label_mapping(description_file_path: str) -> dict:
+    """
+    Get the mapping mnemonic -> label of the weather variables from the description file.
+    :param description_file_path: Path to data/description_variables_meteo.csv
+    :return:
+    """
+    description_df = pd.read_csv(description_file_path, sep=";")
+    return dict(zip(description_df["Mnémonique"], description_df["Libellé"]))
+
+
+class ColumnPipeline:
+    """
+    Column transformations of a histo file applied in a single streaming pass.
+    Steps are resolved on the header first : only the columns needed by the output are read,
+    then every chunk is renamed and written once.
+
+        ColumnPipeline().rename(mapping).select(columns).normalise_names().run(input, output)
+
+    When no column is dropped and both files are CSV, only the header line is rewritten.
+    """
+
+    def __init__(self):
+        self.steps = []
+
+    def rename(self, mapping: dict):
+        """
+        Rename the columns found in the mapping.
+        :param mapping: Dictionary current name -> new name.
+        :return: The pipeline.
+        """
+        self.steps.append(("rename", dict(mapping)))
+        return self
+
+    def rename_using_description_file(self, description_file_path: str):
+        """
+        Rename the mnemonic columns to their label, from the description file.
+        :param description_file_path: Path to data/description_variables_meteo.csv
+        :return: The pipeline.
+        """
+        return self.rename(load_mnemonic_to_label_mapping(description_file_path))
+
+    def select(self, columns: list):
+        """
+        Keep only the given columns, in the given order.
+        :param columns: Column names at this step of the pipeline.
+        :return: The pipeline.
+        """
+        self.steps.append(("select", list(columns)))
+        return self
+
+    def normalise_names(self, old: str = " ", new: str = "_"):
+        """
+        Replace a substring in all the column names, spaces by underscores by default.
+        :param old:
+        :param new:
+        :return: The pipeline.
+        """
+        self.steps.append(("normalise", (old, new)))
+        return self
+
+    def resolve(self, input_columns: list) -> tuple:
+        """
+        Apply the steps to the column names only.
+        :param input_columns: Column names of the input file.
+        :return: (source columns to read, output column names), in the output order.
+        """
+        columns = [(column, column) for column in input_columns]
+        for step, argument in self.steps:
+            if step == "rename":
+                columns = [
+                    (source, argument.get(name, name)) for source, name in columns
+                ]
+            elif step == "select":
+                by_name = {name: source for source, name in columns}
+                missing_columns = [name for name in argument if name not in by_name]
+                if missing_columns:
+                    raise KeyError(f"Columns not found: {missing_columns}")
+                columns = [(by_name[name], name) for name in argument]
+            elif step == "normalise":
+                old, new = argument
+                columns = [(source, name.replace(old, new)) for source, name in columns]
+
+        source_columns = [source for source, _ in columns]
+        output_columns = [name for _, name in columns]
+        return source_columns, output_columns
+
+    def run(self, input_file_path: str, output_file_path: str) -> bool:
+        """
+        Apply the pipeline to a histo file. The output can be the input file.
+        :param input_file_path: Parquet or CSV file.
+        :param output_file_path: Parquet or CSV file.
+        :return:
+        """
+        input_columns = read_histo_columns(input_file_path)
+        source_columns, output_columns = self.resolve(input_columns)
+        input_format = get_file_format(input_file_path)
+        output_format = get_file_format(output_file_path)
+        temporary_path = output_file_path + ".tmp"
+        # The CSV writers append to the temporary file : a file left by a failed run is removed
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+        try:
+            if input_format == PARQUET and output_format == PARQUET:
+                self._run_parquet(
+                    input_file_path, temporary_path, source_columns, output_columns
+                )
+            elif input_format == CSV and output_format == CSV:
+                if source_columns == input_columns:
+                    self._rewrite_csv_header(
+                        input_file_path, temporary_path, output_columns
+                    )
+                else:
+                    self._run_csv(
+                        input_file_path, temporary_path, source_columns, output_columns
+                    )
+            else:
+                self._run_pandas(
+                    input_file_path,
+                    temporary_path,
+                    source_columns,
+                    output_columns,
+                    output_format,
+                )
+            os.replace(temporary_path, output_file_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+        logger.info(
+            f"Column pipeline applied to {input_file_path}, saved to {output_file_path}"
+        )
+        return True
+
+    @staticmethod
+    def _run_parquet(input_path, output_path, source_columns, output_columns):
+        parquet_file = pq.ParquetFile(input_path)
+        writer = None
+        try:
+            for batch in parquet_file.iter_batches(
+                batch_size=PARQUET_ROW_GROUP_SIZE, columns=source_columns
+            ):
+                table = pa.Table.from_batches([batch]).rename_columns(output_columns)
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        output_path, table.schema, compression=PARQUET_COMPRESSION
+                    )
+                writer.write_table(table)
+            if writer is None:
+                schema = parquet_file.schema_arrow
+                table = schema.empty_table().select(source_columns)
+                pq.write_table(table.rename_columns(output_columns), output_path)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    @staticmethod
+    def _rewrite_csv_header(input_path, output_path, output_columns):
+        with open(input_path, "r") as input_file, open(output_path, "w") as output:
+            input_file.readline()
+            output.write(";".join(output_columns) + "\n")
+            shutil.copyfileobj(input_file, output)
+
+    @staticmethod
+    def _run_csv(input_path, output_path, source_columns, output_columns):
+        # Values are copied as text : no decimal or date conversion
+        header = True
+        for chunk in pd.read_csv(
+            input_path,
+            sep=";",
+            usecols=source_columns,
+            dtype=str,
+            keep_default_na=False,
+            chunksize=CSV_CHUNK_SIZE,
+        ):
+            chunk = chunk[source_columns]
+            chunk.columns = output_columns
+            chunk.to_csv(output_path, sep=";", index=False, header=header, mode="a")
+            header = False
+        if header:
+            with open(output_path, "w") as output:
+                output.write(";".join(output_columns) + "\n")
+
+    @staticmethod
+    def _run_pandas(
+        input_path, output_path, source_columns, output_columns, output_format
+    ):
+        if get_file_format(input_path) == PARQUET:
+            batches = (
+                batch.to_pandas()
+                for batch in pq.ParquetFile(input_path).iter_batches(
+                    batch_size=PARQUET_ROW_GROUP_SIZE, columns=source_columns
+                )
+            )
+        else:
+            batches = pd.read_csv(
+                input_path,
+                sep=";",
+                decimal=",",
+                usecols=source_columns,
+                chunksize=CSV_CHUNK_SIZE,
+            )
+
+        writer = None
+        header = True
+        try:
+            for chunk in batches:
+                chunk = chunk[source_columns]
+                if "DATE" in chunk.columns:
+                    chunk["DATE"] = parse_histo_dates(chunk["DATE"])
+                if "POSTE" in chunk.columns:
+                    chunk["POSTE"] = normalise_station_ids(chunk["POSTE"])
+                chunk.columns = output_columns
+
+                if output_format == CSV:
+                    chunk.to_csv(
+                        output_path,
+                        sep=";",
+                        decimal=",",
+                        index=False,
+                        header=header,
+                        mode="a",
+                    )
+                    header = False
+                    continue
+
+                # Integer columns may hold missing values in later chunks
+                for column in chunk.columns:
+                    if pd.api.types.is_integer_dtype(chunk[column]):
+                        chunk[column] = chunk[column].astype("float64")
+                if writer is None:
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    writer = pq.ParquetWriter(
+                        output_path, table.schema, compression=PARQUET_COMPRESSION
+                    )
+                else:
+                    table = pa.Table.from_pandas(
+                        chunk, schema=writer.schema, preserve_index=False
+                    )
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
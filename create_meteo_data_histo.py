@@ -1,53 +1,286 @@
-import pandas as pd
 import os
 import re
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from config import PROJECT_ROOT
 from logs.logging_config import logger
+from column_pipeline import load_mnemonic_to_label_mapping
+from histo_dataset import (
+    read_histo_dataset_columns,
+    upsert_histo_dataset,
+    write_histo_dataset,
+)
+from histo_schema import (
+    DESCRIPTION_FILE_PATH,
+    apply_histo_schema,
+    get_arrow_type,
+    to_csv_dtypes,
+)
+from histo_storage import (
+    PARQUET,
+    HISTO_FILE_FORMAT,
+    PARQUET_COMPRESSION,
+    PARQUET_ROW_GROUP_SIZE,
+    append_histo_file,
+    get_file_format,
+    read_histo_columns,
+    read_histo_file,
+)
 
 
 def get_existing_station_files(root_directory: str) -> list:
     """
     Generate a list of all station historical data files that exist in the given root directory and its subdirectories.
+    When a station has both a Parquet and a CSV histo file, only the Parquet file is listed.
 
     :param root_directory: Path to the root directory containing subdirectories with station historical data files.
     :return: List of file paths to station historical data files.
     """
     station_files = []
-    pattern = re.compile(r".*_histo\.csv$")
+    pattern = re.compile(r"^(\d+)_histo\.(csv|parquet)$")
 
     for subdir, _, files in os.walk(root_directory):
         for file_name in files:
-            if pattern.match(file_name):
-                file_path = os.path.join(subdir, file_name)
-                station_files.append(file_path)
+            match = pattern.match(file_name)
+            if not match:
+                continue
+            if match.group(2) != HISTO_FILE_FORMAT and (
+                f"{match.group(1)}_histo.{HISTO_FILE_FORMAT}" in files
+            ):
+                continue
+            file_path = os.path.join(subdir, file_name)
+            station_files.append(file_path)
 
     return station_files
 
 
-def aggregate_station_files(station_file_paths: list, output_file_path: str) -> bool:
+def get_aggregated_schema(station_file_paths: list) -> pa.Schema:
     """
-    Aggregate all station historical data files into a single CSV file.
+    Reconcile the schemas of the station files from their headers, without reading their data.
+    Columns are kept in order of first appearance. Weather variables get their compact type from
+    the description file. Another column with different types across the Parquet files is stored
+    as float64, or as a string if one of the files has text in it. Columns only found in CSV files
+    are float64.
 
     :param station_file_paths: List of file paths to station historical data files.
-    :param output_file_path: Path to the output aggregated CSV file.
-    :return: True if aggregation is successful, False otherwise.
+    :return: Schema of the aggregated file.
     """
-    aggregated_df = pd.DataFrame()
-
+    column_types = {}
     for file_path in station_file_paths:
-        if os.path.exists(file_path):
-            df = pd.read_csv(file_path, sep=";", parse_dates=[1], dayfirst=True)
-            aggregated_df = pd.concat([aggregated_df, df], ignore_index=True)
+        if get_file_format(file_path) == PARQUET:
+            file_schema = pq.read_schema(file_path)
+            file_types = zip(file_schema.names, file_schema.types)
         else:
+            file_types = [(name, None) for name in read_histo_columns(file_path)]
+
+        for name, file_type in file_types:
+            known_type = column_types.get(name)
+            if name not in column_types or known_type is None:
+                column_types[name] = file_type
+            elif file_type is not None and file_type != known_type:
+                if pa.types.is_string(known_type) or pa.types.is_string(file_type):
+                    column_types[name] = pa.string()
+                else:
+                    column_types[name] = pa.float64()
+
+    fields = []
+    for name, column_type in column_types.items():
+        if name == "DATE":
+            column_type = pa.timestamp("ns")
+        elif name == "POSTE":
+            column_type = pa.string()
+        elif get_arrow_type(name) is not None:
+            column_type = get_arrow_type(name)
+        elif column_type is None:
+            column_type = pa.float64()
+        fields.append(pa.field(name, column_type))
+    return pa.schema(fields)
+
+
+def read_station_table(file_path: str, schema: pa.Schema) -> pa.Table:
+    """
+    Read a station historical data file and conform it to the aggregated schema.
+    Columns missing in the file are filled with nulls, empty lines are removed.
+
+    :param file_path: Path to a station historical data file.
+    :param schema: Schema of the aggregated file.
+    :return:
+    """
+    df = read_histo_file(file_path)
+    df.dropna(how="all", inplace=True)
+    df = df.reindex(columns=schema.names)
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def iter_station_tables(station_file_paths: list, schema: pa.Schema, workers: int):
+    """
+    Read the station files in order, parsing up to `workers` files at the same time in
+    separate processes. At most `workers` parsed files wait to be written.
+
+    :param station_file_paths:
+    :param schema:
+    :param workers: Number of processes. 1 reads the files in the current process.
+    :return: Generator of (file path, table).
+    """
+    if workers <= 1:
+        for file_path in station_file_paths:
+            yield file_path, read_station_table(file_path, schema)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for file_path in station_file_paths:
+            pending.append(
+                (file_path, executor.submit(read_station_table, file_path, schema))
+            )
+            if len(pending) >= workers:
+                next_path, future = pending.popleft()
+                yield next_path, future.result()
+        while pending:
+            next_path, future = pending.popleft()
+            yield next_path, future.result()
+
+
+def aggregate_station_files(
+    station_file_paths: list, output_file_path: str, workers: int = 1
+) -> bool:
+    """
+    Aggregate all station historical data files into a single file.
+    The format of the output file is given by its extension (Parquet or CSV).
+    Station files are appended one at a time, so the peak memory is bounded by the largest
+    station files being parsed, not by the whole dataset.
+
+    :param station_file_paths: List of file paths to station historical data files.
+    :param output_file_path: Path to the output aggregated file.
+    :param workers: Number of processes parsing the station files.
+    :return: True if aggregation is successful, False otherwise.
+    """
+    for file_path in station_file_paths:
+        if not os.path.exists(file_path):
             logger.error(f"File {file_path} does not exist.")
             return False
 
-    # Remove any empty lines
-    aggregated_df.dropna(how="all", inplace=True)
+    schema = get_aggregated_schema(station_file_paths)
+    output_format = get_file_format(output_file_path)
+    temporary_path = output_file_path + ".tmp"
 
-    # Save the aggregated DataFrame to the output CSV file
-    aggregated_df.to_csv(output_file_path, sep=";", index=False)
+    writer = None
+    if output_format == PARQUET:
+        writer = pq.ParquetWriter(
+            temporary_path, schema, compression=PARQUET_COMPRESSION
+        )
+    else:
+        with open(temporary_path, "w") as file:
+            file.write(";".join(schema.names) + "\n")
+
+    try:
+        for file_path, table in iter_station_tables(
+            station_file_paths, schema, workers
+        ):
+            if writer is not None:
+                writer.write_table(table, row_group_size=PARQUET_ROW_GROUP_SIZE)
+            else:
+                to_csv_dtypes(apply_histo_schema(table.to_pandas())).to_csv(
+                    temporary_path,
+                    sep=";",
+                    decimal=",",
+                    index=False,
+                    header=False,
+                    mode="a",
+                )
+            logger.info(f"{table.num_rows} rows of {file_path} aggregated")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    os.replace(temporary_path, output_file_path)
     logger.info(f"Aggregated station data saved to {output_file_path}")
 
     return True
+
+
+def aggregate_station_files_to_dataset(
+    station_file_paths: list,
+    dataset_path: str,
+    workers: int = 1,
+    column_mapping: dict = None,
+) -> bool:
+    """
+    Aggregate all station historical data files into a dataset partitioned by station and year.
+    The dataset is built next to the existing one, which is replaced at the end.
+
+    :param station_file_paths: List of file paths to station historical data files.
+    :param dataset_path: Folder of the dataset.
+    :param workers: Number of processes parsing the station files.
+    :param column_mapping: Dictionary column name -> name in the dataset, like the mnemonic -> label
+    mapping of the description file.
+    :return: True if aggregation is successful, False otherwise.
+    """
+    for file_path in station_file_paths:
+        if not os.path.exists(file_path):
+            logger.error(f"File {file_path} does not exist.")
+            return False
+
+    schema = get_aggregated_schema(station_file_paths)
+    column_mapping = column_mapping or {}
+    dataset_names = [column_mapping.get(name, name) for name in schema.names]
+    temporary_path = dataset_path + ".tmp"
+    if os.path.isdir(temporary_path):
+        shutil.rmtree(temporary_path)
+
+    for file_path, table in iter_station_tables(station_file_paths, schema, workers):
+        write_histo_dataset(table.rename_columns(dataset_names), temporary_path)
+        logger.info(f"{table.num_rows} rows of {file_path} aggregated")
+
+    if os.path.isdir(dataset_path):
+        shutil.rmtree(dataset_path)
+    os.replace(temporary_path, dataset_path)
+    logger.info(f"Aggregated station data saved to {dataset_path}")
+
+    return True
+
+
+def append_to_aggregated_file(df: pd.DataFrame, output_file_path: str) -> bool:
+    """
+    Append new rows of station files to an aggregated file without rebuilding it.
+    A partitioned dataset only gets the partitions of the new rows rewritten.
+    The aggregated file may use the labels of the description file as column names, with or
+    without spaces : the mnemonic columns of the station rows are renamed to match it.
+
+    :param df: New rows, with the columns of the station historical data files.
+    :param output_file_path: Path to the aggregated file, or folder of the partitioned dataset.
+    :return:
+    """
+    if df.empty:
+        return True
+    if os.path.isdir(output_file_path):
+        columns = set(read_histo_dataset_columns(output_file_path))
+    elif os.path.isfile(output_file_path):
+        columns = set(read_histo_columns(output_file_path))
+    else:
+        logger.error(f"Aggregated file {output_file_path} does not exist.")
+        return False
+
+    mapping = load_mnemonic_to_label_mapping(DESCRIPTION_FILE_PATH)
+    renamed_columns = {}
+    for column in df.columns:
+        label = mapping.get(column, column)
+        for candidate in (column, label, label.replace(" ", "_")):
+            if candidate in columns:
+                renamed_columns[column] = candidate
+                break
+
+    # Columns left out of the aggregated file, like in a filtered file, are not appended
+    df = df[list(renamed_columns)].rename(columns=renamed_columns)
+    if os.path.isdir(output_file_path):
+        upsert_histo_dataset(df, output_file_path)
+    else:
+        append_histo_file(df, output_file_path)
+    logger.info(f"{len(df)} rows appended to {output_file_path}")
+    return True
@@ -1,17 +1,34 @@
 import os
 import pandas as pd
-import time
 import re
 
 from config import PROJECT_ROOT
 from logs.logging_config import logger
-from CSVDownloader import CSVDownloader
+from data_quality import compute_quality_report
+from download_scheduler import DownloadScheduler, DownloadJob
+from download_ledger import get_download_ledger
+from create_meteo_data_histo import append_to_aggregated_file
+from date_range_planner import (
+    DEFAULT_PERIOD_START,
+    date_range_file_pattern,
+    plan_order_windows,
+    plan_station_order_windows,
+)
+from histo_storage import (
+    append_histo_file,
+    parse_histo_dates,
+    read_histo_file,
+    read_last_histo_date,
+)
 from utils import (
     extract_date,
-    convert_date_to_iso,
     from_station_number_to_histo_file_path,
+    find_station_histo_file_path,
     from_date_start_end_to_path_name,
+    get_all_stations_histo_dataset_path,
+    get_all_stations_histo_file_path,
     get_station_histo_df,
+    save_station_histo_df,
 )
 from tenacity import (
     retry,
@@ -26,16 +43,7 @@ from tenacity import (
 Création des données météo historiques pour une station : 1 fichier par année et par station
 
 ========================================================================================================================"""
-date_start_end = {
-    "2017-01-01T00%3A00%3A00Z": "2018-01-01T00%3A00%3A00Z",
-    "2018-01-01T00%3A00%3A00Z": "2019-01-01T00%3A00%3A00Z",
-    "2019-01-01T00%3A00%3A00Z": "2020-01-01T00%3A00%3A00Z",
-    "2020-01-01T00%3A00%3A00Z": "2021-01-01T00%3A00%3A00Z",
-    "2021-01-01T00%3A00%3A00Z": "2022-01-01T00%3A00%3A00Z",
-    "2022-01-01T00%3A00%3A00Z": "2023-01-01T00%3A00%3A00Z",
-    "2023-01-01T00%3A00%3A00Z": "2024-01-01T00%3A00%3A00Z",
-    "2024-01-01T00%3A00%3A00Z": "2024-09-11T00%3A00%3A00Z",
-}
+yearly_file_pattern = re.compile(r"^from\d{4}-\d{2}-\d{2}_to\d{4}-\d{2}-\d{2}\.csv$")
 
 
 @retry(
@@ -55,55 +63,116 @@ def download_weather_data_station_between_dates(
     :param date_end: Date ISO format
     :return:
     """
-    downloader = CSVDownloader(
-        num_station=station_number, date_start=date_start, date_end=date_end
-    )
+    if download_date_ranges(station_number, [(date_start, date_end)]):
+        logger.info(
+            f"Download successful for station {station_number} from {date_start} to {date_end}"
+        )
+        return True
+    return False
 
-    try:
-        downloader.run()
-        if downloader.download_is_complete:
-            logger.info(
-                f"Download successful for station {station_number} from {date_start} to {date_end}"
-            )
-            return True
 
+def download_date_ranges(num_station: str, date_ranges: list) -> bool:
+    """
+    Download the historical weather data files of a station for several date ranges at once.
+    Jobs are recorded in the download ledger : an order placed before a restart is downloaded
+    with its saved command number instead of being ordered again.
+    :param num_station:
+    :param date_ranges: List of (date_start, date_end) tuples. Date ISO format.
+    :return: True if all files are downloaded.
+    """
+    scheduler = DownloadScheduler(ledger=get_download_ledger())
+    for date_start, date_end in date_ranges:
+        scheduler.add_job(num_station, date_start, date_end)
+
+    try:
+        jobs = scheduler.run()
     except Exception as e:
         logger.error(
-            f"An unexpected error occurred while downloading data for station {station_number} from {date_start} to {date_end}: {e}"
+            f"An unexpected error occurred while downloading data for station {num_station}: {e}"
         )
-    return False
+        return False
+    return all(job.status == DownloadJob.DONE for job in jobs)
 
 
-def download_histo_per_station(num_station: str) -> bool:
+def download_histo_per_station(
+    num_station: str,
+    date_start: str = DEFAULT_PERIOD_START,
+    date_end: str = None,
+) -> bool:
     """
-    Loop to download all historical data files for a station.
-    Date ranges are defined in the date_start_end dictionary.
+    Download all historical data files for a station.
+    Only the dates not already on disk are ordered, in windows of 1 year maximum.
     :param num_station:
+    :param date_start: Period start. Date str format YYYY-MM-DD.
+    :param date_end: Period end, included. Date str format YYYY-MM-DD. Default is yesterday.
     :return:
     """
-    for date_start, date_end in date_start_end.items():
-        return download_weather_data_station_between_dates(
+    date_ranges = plan_station_order_windows(num_station, date_start, date_end)
+    if not date_ranges:
+        logger.info(f"Nothing to download for station {num_station}")
+        return True
+    return download_date_ranges(num_station, date_ranges)
+
+
+def download_histo_many_stations(
+    stations: list,
+    max_in_flight: int = 20,
+    date_start: str = DEFAULT_PERIOD_START,
+    date_end: str = None,
+) -> dict:
+    """
+    Download all historical data files for several stations at once.
+    Orders of all stations and date ranges are placed together and polled by a DownloadScheduler.
+    Only the dates not already on disk are ordered, in windows of 1 year maximum.
+    :param stations: List of station numbers.
+    :param max_in_flight: Maximum number of orders placed and not downloaded yet.
+    :param date_start: Period start. Date str format YYYY-MM-DD.
+    :param date_end: Period end, included. Date str format YYYY-MM-DD. Default is yesterday.
+    :return: Dictionary station number -> True if all files of the station are downloaded.
+    """
+    scheduler = DownloadScheduler(
+        max_in_flight=max_in_flight, ledger=get_download_ledger()
+    )
+    for num_station in stations:
+        for window_start, window_end in plan_station_order_windows(
             num_station, date_start, date_end
-        )
+        ):
+            scheduler.add_job(num_station, window_start, window_end)
 
+    stations_complete = {num_station: True for num_station in stations}
+    for job in scheduler.run():
+        if job.status != DownloadJob.DONE:
+            stations_complete[job.downloader.num_station] = False
 
-def verify_files_histo_all_exist(num_station: str) -> bool:
+    return stations_complete
+
+
+def verify_files_histo_all_exist(
+    num_station: str,
+    date_start: str = DEFAULT_PERIOD_START,
+    date_end: str = None,
+) -> bool:
     """
     Check if all historical weather data files exist for a station.
-    Date ranges are defined in the date_start_end dictionary.
+    Dates of the period not covered by the files on disk are downloaded together, resuming the
+    orders recorded in the download ledger.
     :param num_station:
+    :param date_start: Period start. Date str format YYYY-MM-DD.
+    :param date_end: Period end, included. Date str format YYYY-MM-DD. Default is yesterday.
     :return:
     """
-    for date_start, date_end in date_start_end.items():
-        file_path = (
-            f"data_meteo_histo/{num_station}/from{extract_date(date_start)}_"
-            f"to{extract_date(date_end)}.csv"
+    missing_date_ranges = plan_station_order_windows(num_station, date_start, date_end)
+    for missing_start, missing_end in missing_date_ranges:
+        logger.info(
+            f"Data from {extract_date(missing_start)} to {extract_date(missing_end)} "
+            f"does not exist for station {num_station}."
         )
-        if not os.path.isfile(file_path):
-            logger.info(f"File {file_path} does not exist.")
-            download_weather_data_station_between_dates(
-                num_station, date_start, date_end
-            )
+
+    if missing_date_ranges and not download_date_ranges(
+        num_station, missing_date_ranges
+    ):
+        logger.error(f"Some files for station {num_station} could not be downloaded.")
+        return False
 
     logger.info(f"All files for station {num_station} exist. Checking OK")
     return True
@@ -119,33 +188,38 @@ Agglomération des données météo historiques pour une station : 1 fichier par
 def aggregate_histo_data(num_station: str) -> bool:
     """
     Aggregate all historical weather data files for a station into a single file.
-    The final format is a CSV file : num_station_histo.csv
+    The final format is a Parquet file : num_station_histo.parquet
+    If the station already has a histo file, the date range files are merged into it : the
+    dates already stored are not downloaded again, so they must not be overwritten.
     :param num_station:
     :return:
     """
     station_folder = f"data_meteo_histo/{num_station}"
-    station_files = os.listdir(station_folder)
+    # Only complete downloads : temporary .part files of interrupted downloads are skipped
+    station_files = [
+        file for file in os.listdir(station_folder) if yearly_file_pattern.match(file)
+    ]
     station_files.sort()
+
+    if find_station_histo_file_path(num_station) is not None:
+        if not station_files:
+            logger.info(f"No new files to aggregate for station {num_station}")
+            return True
+        return add_date_to_histo_file(
+            [f"{station_folder}/{file}" for file in station_files], num_station
+        )
+
     if len(station_files) == 0:
         raise FileNotFoundError(
             f"No files found for station {num_station} in folder {station_folder}"
         )
 
-    # Create the output file
-    station_histo_file_path = from_station_number_to_histo_file_path(num_station)
-    with open(station_histo_file_path, "w") as output:
-        # Write the header
-        with open(f"{station_folder}/{station_files[0]}", "r") as first_file:
-            header = first_file.readline()
-            output.write(header)
-
-        # Write the data
-        for file in station_files:
-            with open(f"{station_folder}/{file}", "r") as input_file:
-                # Skip the header
-                input_file.readline()
-                for line in input_file:
-                    output.write(line)
+    # Read the files and write the station histo file in the canonical format
+    station_df = pd.concat(
+        [read_histo_file(f"{station_folder}/{file}") for file in station_files],
+        ignore_index=True,
+    )
+    station_histo_file_path = save_station_histo_df(station_df, num_station)
 
     logger.info(
         f"Aggregation complete for station {num_station}. File saved to {station_histo_file_path}"
@@ -182,24 +256,38 @@ def check_duplicated_dates(num_station: str) -> bool:
     return True
 
 
+def get_missing_dates(num_station: str, df: pd.DataFrame = None) -> pd.DatetimeIndex:
+    """
+    Get the missing dates between min date and max date of the final historical data file of a
+    station. Dates recorded as missing at the source in the download ledger are not returned.
+    :param num_station:
+    :param df: Station data histo, if already loaded.
+    :return:
+    """
+    if df is None:
+        df = get_station_histo_df(num_station)
+    dates = parse_histo_dates(df.iloc[:, 1])
+
+    date_range = pd.date_range(start=dates.min(), end=dates.max())
+    missing_dates = date_range[~date_range.isin(dates)]
+
+    missing_at_source = pd.to_datetime(
+        get_download_ledger().get_missing_dates(num_station)
+    )
+    return missing_dates[~missing_dates.isin(missing_at_source)]
+
+
 def check_missing_dates(num_station: str) -> bool:
     """
     Check for missing dates in the final historical data file of a station.
     Check for missing dates between min date and max date.
+    Dates recorded as missing at the source are not reported.
     :param num_station:
     :return:
     """
-    # Load station data histo file
-    df = get_station_histo_df(num_station)
-    dates = df.iloc[:, 1]
+    missing_dates = get_missing_dates(num_station)
     station_histo_file_path = from_station_number_to_histo_file_path(num_station)
 
-    # Check if dates are already in datetime format
-    if not pd.api.types.is_datetime64_any_dtype(dates):
-        dates = pd.to_datetime(dates, format="%Y-%m-%d", errors="coerce")
-    date_range = pd.date_range(start=dates.min(), end=dates.max())
-    missing_dates = date_range[~date_range.isin(dates)]
-
     # Check for missing dates
     if not missing_dates.empty:
         missing_dates = missing_dates.strftime("%Y-%m-%d").tolist()
@@ -215,32 +303,48 @@ def check_missing_dates(num_station: str) -> bool:
 def verify_data_quality_in_histo_files(num_station: str) -> bool:
     """
     Verify the quality of the final historical data files for a station.
-    Quality checks : duplicates and missing dates.
+    The station is loaded once and its quality report computed in one pass : duplicates, missing
+    dates, rate of missing values and out of range values. Duplicates are dropped and missing
+    dates downloaded, and the report is computed again only if the file was repaired.
+    The report is saved next to the station file.
     :param num_station:
     :return:
     """
-    station_histo_file_path = from_station_number_to_histo_file_path(num_station)
+    station_histo_file_path = find_station_histo_file_path(num_station)
 
-    if not os.path.isfile(station_histo_file_path):
-        logger.error(f"Aggregated file {station_histo_file_path} does not exist.")
+    if station_histo_file_path is None:
+        logger.error(f"Aggregated file of station {num_station} does not exist.")
         return False
 
-    # Check for duplicate dates
-    if not check_duplicated_dates(num_station):
-        drop_date_duplicates(num_station)
+    df = get_station_histo_df(num_station)
+    report = compute_quality_report(num_station, df)
 
-    # Check for missing dates
-    while not check_missing_dates(num_station):
+    # Dates still missing after the download are recorded as missing at the source
+    if report.duplicated_dates:
+        drop_date_duplicates(num_station, df)
+    if report.missing_dates:
         download_and_add_data_missing_dates(num_station)
-        time.sleep(3)
+    if report.duplicated_dates or report.missing_dates:
+        report = compute_quality_report(num_station)
+    report.save()
 
-    if check_duplicated_dates(num_station) and check_missing_dates(num_station):
+    for rule, invalid in report.out_of_range.items():
+        logger.warning(
+            f"{invalid['count']} values out of range ({rule}) in the file {station_histo_file_path}"
+        )
+
+    if report.is_ok:
         logger.info(
             f"Data quality check passed for files {station_histo_file_path}: No duplicate or missing dates."
         )
         return True
-    else:
-        return False
+
+    logger.error(
+        f"Data quality check failed for file {station_histo_file_path}: "
+        f"{len(report.duplicated_dates)} duplicated dates, "
+        f"{len(report.missing_dates)} missing dates"
+    )
+    return False
 
 
 """======================================================================================================================
@@ -250,24 +354,24 @@ def verify_data_quality_in_histo_files(num_station: str) -> bool:
 ==========================================================================================================================="""
 
 
-def drop_date_duplicates(station_number: str) -> bool:
+def drop_date_duplicates(station_number: str, df: pd.DataFrame = None) -> bool:
     """
     Drop duplicate dates in the final historical data file of a station.
     :param station_number:
+    :param df: Station data histo, if already loaded.
     :return:
     """
     # Load station data histo file
-    df = get_station_histo_df(station_number)
+    if df is None:
+        df = get_station_histo_df(station_number)
     dates = df.iloc[:, 1]
 
     # Check for duplicate dates
     duplicated_dates = dates[dates.duplicated()]
-    station_histo_file_path = from_station_number_to_histo_file_path(station_number)
-
     # Drop the duplicates
     if not duplicated_dates.empty:
         df.drop_duplicates(subset="DATE", inplace=True)
-        df.to_csv(station_histo_file_path, sep=";", index=False)
+        station_histo_file_path = save_station_histo_df(df, station_number)
         logger.info(f"Duplicates removed from file {station_histo_file_path}")
     return True
 
@@ -275,35 +379,33 @@ def drop_date_duplicates(station_number: str) -> bool:
 def add_date_to_histo_file(file_paths: list, station_number: str) -> bool:
     """
     Add the data from a list of files to the aggregated final historical data file of a station.
-    Add the data from files like from2017-01-01_to2018-01-01.csv to the final file 59343001_histo.csv
+    Add the data from files like from2017-01-01_to2018-01-01.csv to the final file 59343001_histo
+    All files are merged in a single pass : the final file is read and written once.
     :param file_paths:
     :param station_number:
     :return:
     """
-    histo_file = from_station_number_to_histo_file_path(station_number)
-
-    if not histo_file:
-        raise ValueError("No files provided for aggregation")
-
-    # Read the existing historical file into a DataFrame
-    if os.path.exists(histo_file):
-        histo_df = pd.read_csv(histo_file, sep=";", parse_dates=[1], dayfirst=True)
-    else:
-        histo_df = pd.DataFrame()
+    histo_file = find_station_histo_file_path(station_number)
 
-    # Append the data from all files
+    # Read the existing historical file and all files to add
+    dfs = []
+    if histo_file is not None:
+        dfs.append(read_histo_file(histo_file))
     for file_path in file_paths:
-        df = pd.read_csv(file_path, sep=";", parse_dates=[1], dayfirst=True)
-        histo_df = pd.concat([histo_df, df], ignore_index=True)
-        histo_df["DATE"] = pd.to_datetime(
-            histo_df["DATE"], format="%Y-%m-%d", errors="coerce"
-        )
+        dfs.append(read_histo_file(file_path))
+    if not dfs:
+        return True
 
-    # Remove any empty lines
+    histo_df = pd.concat(dfs, ignore_index=True)
+    histo_df["DATE"] = parse_histo_dates(histo_df["DATE"])
+
+    # Remove any empty lines and the dates downloaded twice
     histo_df.dropna(how="all", inplace=True)
+    histo_df.drop_duplicates(subset="DATE", keep="first", inplace=True)
+    histo_df.sort_values("DATE", inplace=True)
 
-    # Save the DataFrame back to the CSV file
-    histo_df.to_csv(histo_file, sep=";", index=False)
+    # Save the DataFrame back to the histo file
+    histo_file = save_station_histo_df(histo_df, station_number)
 
     logger.info(f"Aggregation complete. File saved to {histo_file}")
 
@@ -312,38 +414,56 @@ def add_date_to_histo_file(file_paths: list, station_number: str) -> bool:
 
 def download_and_add_data_missing_dates(num_station: str) -> bool:
     """
-    Download the missing data files for a station and add them to the aggregated final historical data file.
-    One file per missing date. One file is like from2017-01-01_to2017-01-01.csv
+    Download the missing data of a station and add it to the aggregated final historical data file.
+    Missing dates are merged into contiguous date ranges, each range is ordered once, and all the
+    downloaded files are added to the final file in a single pass.
+    Dates still missing afterwards are recorded as missing at the source in the download ledger,
+    so they are not ordered again.
     :param num_station:
     :return:
     """
     # Load station data histo file
     df = get_station_histo_df(num_station)
-    dates = df.iloc[:, 1]
+    missing_dates = get_missing_dates(num_station, df)
     station_histo_file_path = from_station_number_to_histo_file_path(num_station)
+    if missing_dates.empty:
+        return True
 
-    # Check if dates are already in datetime format
-    if not pd.api.types.is_datetime64_any_dtype(dates):
-        dates = pd.to_datetime(dates, format="%Y-%m-%d", errors="coerce")
-    date_range = pd.date_range(start=dates.min(), end=dates.max())
-    missing_dates = date_range[~date_range.isin(dates)]
-
-    if not missing_dates.empty:
-        for date in missing_dates:
-            date_iso = convert_date_to_iso(date.strftime("%Y-%m-%d"))
-
-            # Download the missing data
-            download_weather_data_station_between_dates(num_station, date_iso, date_iso)
+    # Order the missing dates by contiguous date ranges
+    period = pd.date_range(missing_dates.min(), missing_dates.max())
+    date_ranges = plan_order_windows(
+        period[0].strftime("%Y-%m-%d"),
+        period[-1].strftime("%Y-%m-%d"),
+        existing_dates=period[~period.isin(missing_dates)],
+    )
+    logger.info(
+        f"{len(missing_dates)} missing dates of station {num_station} ordered in "
+        f"{len(date_ranges)} date ranges"
+    )
+    download_date_ranges(num_station, date_ranges)
 
     # Add the missing data to the aggregated file
-    list_file_paths = [
-        from_date_start_end_to_path_name(
-            num_station, date_iso.strftime("%Y-%m-%d"), date_iso.strftime("%Y-%m-%d")
+    downloaded_dates = pd.DatetimeIndex([])
+    list_file_paths = []
+    for date_start, date_end in date_ranges:
+        file_path = from_date_start_end_to_path_name(
+            num_station, extract_date(date_start), extract_date(date_end)
         )
-        for date_iso in missing_dates
-    ]
+        if os.path.isfile(file_path):
+            list_file_paths.append(file_path)
+            downloaded_dates = downloaded_dates.append(
+                pd.date_range(extract_date(date_start), extract_date(date_end))
+            )
     add_date_to_histo_file(list_file_paths, num_station)
 
+    # Dates of downloaded ranges that are still missing do not exist at the source
+    still_missing = get_missing_dates(num_station)
+    missing_at_source = still_missing[still_missing.isin(downloaded_dates)]
+    if not missing_at_source.empty:
+        get_download_ledger().add_missing_dates(
+            num_station, missing_at_source.strftime("%Y-%m-%d").tolist()
+        )
+
     logger.info(
         f"Missing dates files downloaded and added to {station_histo_file_path}"
     )
@@ -351,6 +471,149 @@ def download_and_add_data_missing_dates(num_station: str) -> bool:
     return True
 
 
+"""=======================================================================================================================
+    Incremental update : download and append only the days after the last stored date
+========================================================================================================================"""
+
+
+def get_last_stored_date(num_station: str):
+    """
+    Get the last date stored in the final historical data file of a station.
+    :param num_station:
+    :return: Timestamp, None if the station has no historical data file.
+    """
+    histo_file_path = find_station_histo_file_path(num_station)
+    if histo_file_path is None:
+        return None
+    return read_last_histo_date(histo_file_path)
+
+
+def get_date_range_files_after(num_station: str, last_date: pd.Timestamp) -> list:
+    """
+    Get the downloaded date range files of a station ending after a date.
+    :param num_station:
+    :param last_date:
+    :return: List of file paths.
+    """
+    station_folder = PROJECT_ROOT + f"/data_meteo_histo/{num_station}"
+    if not os.path.isdir(station_folder):
+        return []
+
+    file_paths = []
+    for file in sorted(os.listdir(station_folder)):
+        match = date_range_file_pattern.match(file)
+        if match and pd.Timestamp(match.group(2)) > last_date:
+            file_paths.append(f"{station_folder}/{file}")
+    return file_paths
+
+
+def append_new_dates_to_histo_file(
+    num_station: str, last_date: pd.Timestamp
+) -> pd.DataFrame:
+    """
+    Append the downloaded dates after the last stored date to the final historical data file of
+    a station, without rewriting the stored dates. The merged date range files are deleted.
+    :param num_station:
+    :param last_date: Last date stored in the final historical data file.
+    :return: The appended rows.
+    """
+    file_paths = get_date_range_files_after(num_station, last_date)
+    if not file_paths:
+        return pd.DataFrame()
+
+    new_df = pd.concat(
+        [read_histo_file(file_path) for file_path in file_paths], ignore_index=True
+    )
+    new_df.dropna(how="all", inplace=True)
+    new_df = new_df[new_df["DATE"] > last_date]
+    new_df = new_df.drop_duplicates(subset="DATE").sort_values("DATE")
+
+    if not new_df.empty:
+        append_histo_file(new_df, find_station_histo_file_path(num_station))
+    for file_path in file_paths:
+        os.remove(file_path)
+
+    logger.info(
+        f"{len(new_df)} new dates appended to the histo file of station {num_station}"
+    )
+    return new_df
+
+
+def update_stations_histo(
+    stations: list,
+    max_in_flight: int = 20,
+    date_end: str = None,
+    update_all_stations_files: bool = True,
+) -> dict:
+    """
+    Incremental update of the historical data of several stations.
+    For each station, only the days after its last stored date are ordered. The new rows are
+    appended to the station historical data files and to the all stations files, existing data is
+    not rewritten. Stations without historical data file need the full creation first.
+    :param stations: List of station numbers.
+    :param max_in_flight: Maximum number of orders placed and not downloaded yet.
+    :param date_end: Period end, included. Date str format YYYY-MM-DD. Default is yesterday.
+    :param update_all_stations_files: Also append the new rows to the all stations files.
+    :return: Dictionary station number -> True if the station is up to date.
+    """
+    scheduler = DownloadScheduler(
+        max_in_flight=max_in_flight, ledger=get_download_ledger()
+    )
+    last_dates = {}
+    stations_updated = {}
+    for num_station in stations:
+        last_date = get_last_stored_date(num_station)
+        if last_date is None:
+            logger.warning(
+                f"No historical data file for station {num_station}: "
+                f"the full creation is needed before incremental updates"
+            )
+            stations_updated[num_station] = False
+            continue
+
+        last_dates[num_station] = last_date
+        stations_updated[num_station] = True
+        for window_start, window_end in plan_station_order_windows(
+            num_station,
+            (last_date + pd.Timedelta(days=1)).strftime("%Y-%m-%d"),
+            date_end,
+        ):
+            scheduler.add_job(num_station, window_start, window_end)
+
+    if scheduler.jobs:
+        for job in scheduler.run():
+            if job.status != DownloadJob.DONE:
+                stations_updated[job.downloader.num_station] = False
+
+    new_dfs = [
+        append_new_dates_to_histo_file(num_station, last_date)
+        for num_station, last_date in last_dates.items()
+    ]
+    new_dfs = [new_df for new_df in new_dfs if not new_df.empty]
+
+    if update_all_stations_files and new_dfs:
+        new_df = pd.concat(new_dfs, ignore_index=True)
+        for file_path in (
+            get_all_stations_histo_file_path(),
+            get_all_stations_histo_file_path(suffix="_col_filtered"),
+            get_all_stations_histo_dataset_path(),
+        ):
+            if os.path.exists(file_path):
+                append_to_aggregated_file(new_df, file_path)
+
+    return stations_updated
+
+
+def update_station_histo(num_station: str, date_end: str = None) -> bool:
+    """
+    Incremental update of the historical data of a station.
+    :param num_station:
+    :param date_end: Period end, included. Date str format YYYY-MM-DD. Default is yesterday.
+    :return:
+    """
+    return update_stations_histo([num_station], date_end=date_end)[num_station]
+
+
 """=======================================================================================================================
     Delete the year by year weather data files for a station
 ========================================================================================================================"""
@@ -371,9 +634,8 @@ def delete_yearly_files(num_station: str) -> bool:
             f"No files found for station {num_station} in folder {station_folder}"
         )
 
-    pattern = re.compile(r"^from\d{4}-\d{2}-\d{2}_to\d{4}-\d{2}-\d{2}\.csv$")
     for file in station_files:
-        if pattern.match(file):
+        if yearly_file_pattern.match(file):
             os.remove(f"{station_folder}/{file}")
 
     logger.info(f"Yearly files for station {num_station} deleted. Checking OK")
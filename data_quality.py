@@ -0,0 +1,292 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from config import PROJECT_ROOT
+from logs.logging_config import logger
+from download_ledger import get_download_ledger
+from utils import find_station_histo_file_path, get_station_histo_df
+
+"""=====================================================================================================
+    Data quality of the station historical data files
+====================================================================================================="""
+
+# Number of dates listed per out of range rule in a report
+MAX_REPORTED_DATES = 20
+
+# Out of range rules : name -> (columns needed, function df -> boolean mask of the invalid rows)
+RANGE_RULES = {
+    "TN > TX": (("TN", "TX"), lambda df: df["TN"] > df["TX"]),
+    "TM out of [TN, TX]": (
+        ("TN", "TM", "TX"),
+        lambda df: (df["TM"] < df["TN"]) | (df["TM"] > df["TX"]),
+    ),
+    "RR < 0": (("RR",), lambda df: df["RR"] < 0),
+    "UN > UX": (("UN", "UX"), lambda df: df["UN"] > df["UX"]),
+    "Humidity out of [0, 100]": (
+        ("UM",),
+        lambda df: (df["UM"] < 0) | (df["UM"] > 100),
+    ),
+    "Wind speed < 0": (("FFM",), lambda df: df["FFM"] < 0),
+    "FFM > FXI": (("FFM", "FXI"), lambda df: df["FFM"] > df["FXI"]),
+    "Daily duration out of [0, 1440] min": (
+        ("DG",),
+        lambda df: (df["DG"] < 0) | (df["DG"] > 1440),
+    ),
+    "Sunshine out of [0, 1440] min": (
+        ("INST",),
+        lambda df: (df["INST"] < 0) | (df["INST"] > 1440),
+    ),
+}
+
+
+def get_quality_report_path(num_station: str) -> str:
+    """
+    Get the path of the saved quality report of a station.
+    :param num_station:
+    :return:
+    """
+    return PROJECT_ROOT + f"/data_meteo_histo/{num_station}/{num_station}_quality.json"
+
+
+class QualityReport:
+    """
+    Quality of the final historical data file of a station : duplicated dates, missing dates,
+    rate of missing values per variable and out of range values.
+    The report records the size and modification time of the file it was computed on, so an
+    unchanged station does not need to be checked again.
+    """
+
+    def __init__(
+        self,
+        num_station: str,
+        file_signature: dict,
+        rows: int,
+        date_min: str = None,
+        date_max: str = None,
+        duplicated_dates: list = None,
+        missing_dates: list = None,
+        null_rates: dict = None,
+        out_of_range: dict = None,
+    ):
+        """
+
+        :param num_station:
+        :param file_signature: Path, size and modification time of the checked file.
+        :param rows: Number of rows of the file.
+        :param date_min: First date. Date str format YYYY-MM-DD.
+        :param date_max: Last date. Date str format YYYY-MM-DD.
+        :param duplicated_dates: Dates found more than once.
+        :param missing_dates: Dates missing between the first and the last date, excluding the
+        dates recorded as missing at the source.
+        :param null_rates: Dictionary variable -> rate of missing values.
+        :param out_of_range: Dictionary rule -> {"count": rows, "dates": first dates}.
+        """
+        self.num_station = str(num_station)
+        self.file_signature = file_signature
+        self.rows = rows
+        self.date_min = date_min
+        self.date_max = date_max
+        self.duplicated_dates = duplicated_dates or []
+        self.missing_dates = missing_dates or []
+        self.null_rates = null_rates or {}
+        self.out_of_range = out_of_range or {}
+
+    def __repr__(self):
+        return (
+            f"QualityReport(station={self.num_station}, rows={self.rows}, "
+            f"duplicated_dates={len(self.duplicated_dates)}, "
+            f"missing_dates={len(self.missing_dates)}, "
+            f"out_of_range={sum(rule['count'] for rule in self.out_of_range.values())})"
+        )
+
+    @property
+    def is_ok(self) -> bool:
+        """
+        No duplicated or missing dates. Out of range values are reported but do not fail the check.
+        """
+        return not self.duplicated_dates and not self.missing_dates
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, report: dict):
+        return cls(**report)
+
+    def save(self, file_path: str = None) -> str:
+        """
+        Save the report as JSON.
+        :param file_path: Default is the report path of the station.
+        :return: Path of the saved report.
+        """
+        if file_path is None:
+            file_path = get_quality_report_path(self.num_station)
+        temporary_path = file_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+        os.replace(temporary_path, file_path)
+        return file_path
+
+
+def get_file_signature(file_path: str, missing_at_source: list) -> dict:
+    """
+    Get what a report depends on : the station file, and the dates missing at the source.
+    :param file_path:
+    :param missing_at_source:
+    :return:
+    """
+    stat = os.stat(file_path)
+    return {
+        "path": file_path,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "missing_at_source": len(missing_at_source),
+    }
+
+
+def load_saved_report(num_station: str):
+    """
+    Load the saved quality report of a station.
+    :param num_station:
+    :return: The report, None if no report is saved.
+    """
+    file_path = get_quality_report_path(num_station)
+    if not os.path.isfile(file_path):
+        return None
+    with open(file_path, "r") as file:
+        return QualityReport.from_dict(json.load(file))
+
+
+def compute_quality_report(
+    num_station: str, df: pd.DataFrame = None, missing_at_source: list = None
+) -> QualityReport:
+    """
+    Compute the quality report of a station in one vectorised pass over its data.
+    :param num_station:
+    :param df: Station data histo, if already loaded. Loaded once otherwise.
+    :param missing_at_source: Dates recorded as missing at the source. Read from the download
+    ledger if None.
+    :return:
+    """
+    file_path = find_station_histo_file_path(num_station)
+    if file_path is None:
+        raise FileNotFoundError(f"No histo file found for station {num_station}")
+    if missing_at_source is None:
+        missing_at_source = get_download_ledger().get_missing_dates(num_station)
+    file_signature = get_file_signature(file_path, missing_at_source)
+    if df is None:
+        df = get_station_histo_df(num_station)
+
+    dates = df["DATE"]
+    if dates.dropna().empty:
+        return QualityReport(num_station, file_signature, rows=len(df))
+
+    duplicated = dates[dates.duplicated()].dropna().unique()
+    period = pd.date_range(dates.min(), dates.max())
+    missing = period[~period.isin(dates)]
+    missing = missing[~missing.isin(pd.to_datetime(missing_at_source))]
+
+    variables = [column for column in df.columns if column not in ("POSTE", "DATE")]
+    null_rates = df[variables].isna().mean().round(4).to_dict()
+
+    out_of_range = {}
+    for rule, (columns, is_invalid) in RANGE_RULES.items():
+        if not all(column in df.columns for column in columns):
+            continue
+        invalid = is_invalid(df).fillna(False).astype(bool)
+        if invalid.any():
+            out_of_range[rule] = {
+                "count": int(invalid.sum()),
+                "dates": dates[invalid]
+                .head(MAX_REPORTED_DATES)
+                .dt.strftime("%Y-%m-%d")
+                .tolist(),
+            }
+
+    return QualityReport(
+        num_station,
+        file_signature,
+        rows=len(df),
+        date_min=dates.min().strftime("%Y-%m-%d"),
+        date_max=dates.max().strftime("%Y-%m-%d"),
+        duplicated_dates=pd.DatetimeIndex(duplicated).strftime("%Y-%m-%d").tolist(),
+        missing_dates=missing.strftime("%Y-%m-%d").tolist(),
+        null_rates=null_rates,
+        out_of_range=out_of_range,
+    )
+
+
+def get_quality_report(
+    num_station: str, missing_at_source: list = None, use_saved: bool = True
+) -> QualityReport:
+    """
+    Get the quality report of a station. The saved report is used when the file has not changed,
+    otherwise the report is computed and saved.
+    :param num_station:
+    :param missing_at_source: Dates recorded as missing at the source. Read from the download
+    ledger if None.
+    :param use_saved: Use the saved report of an unchanged station.
+    :return:
+    """
+    file_path = find_station_histo_file_path(num_station)
+    if file_path is None:
+        raise FileNotFoundError(f"No histo file found for station {num_station}")
+    if missing_at_source is None:
+        missing_at_source = get_download_ledger().get_missing_dates(num_station)
+
+    if use_saved:
+        saved_report = load_saved_report(num_station)
+        if saved_report is not None and saved_report.file_signature == (
+            get_file_signature(file_path, missing_at_source)
+        ):
+            return saved_report
+
+    report = compute_quality_report(num_station, missing_at_source=missing_at_source)
+    report.save()
+    return report
+
+
+def check_stations_quality(
+    stations: list, workers: int = None, use_saved: bool = True
+) -> dict:
+    """
+    Get the quality reports of several stations, computed in parallel processes.
+    Stations whose file has not changed since their last report are not read.
+    :param stations: List of station numbers.
+    :param workers: Number of processes. Default is the number of CPUs.
+    :param use_saved: Use the saved reports of unchanged stations.
+    :return: Dictionary station number -> QualityReport. Stations without histo file or whose
+    check failed are not in the dictionary.
+    """
+    # The ledger is read here : its connection is not shared with the processes
+    ledger = get_download_ledger()
+    missing_at_source = {
+        num_station: ledger.get_missing_dates(num_station) for num_station in stations
+    }
+
+    reports = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            num_station: executor.submit(
+                get_quality_report,
+                num_station,
+                missing_at_source[num_station],
+                use_saved,
+            )
+            for num_station in stations
+        }
+        for num_station, future in futures.items():
+            try:
+                reports[num_station] = future.result()
+            except Exception as e:
+                logger.error(f"Quality check of station {num_station} failed: {e}")
+
+    failed = [report for report in reports.values() if not report.is_ok]
+    logger.info(
+        f"Quality checked for {len(reports)} stations, {len(failed)} with duplicated or "
+        f"missing dates"
+    )
+    return reports
@@ -0,0 +1,203 @@
+import os
+import re
+import pandas as pd
+from datetime import date, timedelta
+
+from config import PROJECT_ROOT
+from download_ledger import get_download_ledger
+from histo_storage import parse_histo_dates, read_histo_file
+from utils import convert_date_to_iso, extract_date, find_station_histo_file_path
+
+# Start of the historical data period downloaded by default
+DEFAULT_PERIOD_START = "2017-01-01"
+
+# Maximum length of an order of the API : 1 year
+MAX_WINDOW = pd.DateOffset(years=1)
+
+date_range_file_pattern = re.compile(
+    r"^from(\d{4}-\d{2}-\d{2})_to(\d{4}-\d{2}-\d{2})\.csv$"
+)
+
+"""=====================================================================================================
+    Dates already downloaded
+====================================================================================================="""
+
+
+def get_default_period_end() -> str:
+    """
+    Get the default end of the historical data period : yesterday, the last complete day.
+    :return: Date str format YYYY-MM-DD.
+    """
+    return (date.today() - timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def get_existing_dates(num_station: str) -> pd.DatetimeIndex:
+    """
+    Get the dates already downloaded for a station.
+    Dates come from the station historical data file and from the date range files
+    fromYYYY-MM-DD_toYYYY-MM-DD.csv of the station folder.
+    :param num_station:
+    :return: Sorted unique dates.
+    """
+    existing_dates = []
+
+    histo_file_path = find_station_histo_file_path(num_station)
+    if histo_file_path is not None:
+        dates = read_histo_file(histo_file_path, columns=["DATE"])["DATE"]
+        existing_dates.append(pd.DatetimeIndex(parse_histo_dates(dates).dropna()))
+
+    station_folder = PROJECT_ROOT + f"/data_meteo_histo/{num_station}"
+    if os.path.isdir(station_folder):
+        for file in os.listdir(station_folder):
+            match = date_range_file_pattern.match(file)
+            if match:
+                existing_dates.append(pd.date_range(match.group(1), match.group(2)))
+
+    if not existing_dates:
+        return pd.DatetimeIndex([])
+    return existing_dates[0].append(existing_dates[1:]).unique().sort_values()
+
+
+def get_dates_missing_in_file(
+    file_path: str, date_start: str, date_end: str
+) -> pd.DatetimeIndex:
+    """
+    Get the dates of an ordered date range that the downloaded file does not have : the station
+    was not open yet, or the dates are missing at the source.
+    :param file_path: Downloaded date range file.
+    :param date_start: Date range start. Date ISO format.
+    :param date_end: Date range end. Date ISO format.
+    :return: Sorted dates.
+    """
+    period = pd.date_range(extract_date(date_start), extract_date(date_end))
+    # The API answers an empty file when the station has no data in the date range
+    if os.path.getsize(file_path) == 0:
+        return period
+    dates = parse_histo_dates(read_histo_file(file_path, columns=["DATE"])["DATE"])
+    return period[~period.isin(dates)]
+
+
+"""=====================================================================================================
+    Order windows
+====================================================================================================="""
+
+
+def get_missing_date_runs(
+    date_start: str, date_end: str, existing_dates: pd.DatetimeIndex = None
+) -> list:
+    """
+    Get the runs of consecutive dates of a period that are not downloaded yet.
+    :param date_start: Period start. Date str format YYYY-MM-DD.
+    :param date_end: Period end, included. Date str format YYYY-MM-DD.
+    :param existing_dates: Dates already downloaded.
+    :return: List of (first date, last date) Timestamp tuples.
+    """
+    period = pd.date_range(date_start, date_end)
+    if existing_dates is not None and len(existing_dates) > 0:
+        period = period[~period.isin(existing_dates)]
+    if len(period) == 0:
+        return []
+
+    # A new run starts at each date that does not follow the previous one
+    run_starts = (period[1:] - period[:-1]) != pd.Timedelta(days=1)
+    start_positions = [0] + [i + 1 for i in run_starts.nonzero()[0]]
+    end_positions = [i - 1 for i in start_positions[1:]] + [len(period) - 1]
+    return [
+        (period[start], period[end])
+        for start, end in zip(start_positions, end_positions)
+    ]
+
+
+def merge_close_runs(runs: list, max_gap_days: int) -> list:
+    """
+    Merge runs of missing dates separated by at most max_gap_days downloaded dates.
+    Downloading again a few days costs less than placing one more order.
+    :param runs: List of (first date, last date) Timestamp tuples, sorted.
+    :param max_gap_days:
+    :return:
+    """
+    merged_runs = []
+    for run_start, run_end in runs:
+        if (
+            merged_runs
+            and (run_start - merged_runs[-1][1]).days - 1 <= max_gap_days
+            and run_end < merged_runs[-1][0] + MAX_WINDOW
+        ):
+            merged_runs[-1] = (merged_runs[-1][0], run_end)
+        else:
+            merged_runs.append((run_start, run_end))
+    return merged_runs
+
+
+def split_run_into_windows(run_start: pd.Timestamp, run_end: pd.Timestamp) -> list:
+    """
+    Split a run of dates into order windows of 1 year maximum.
+    :param run_start:
+    :param run_end:
+    :return: List of (first date, last date) Timestamp tuples.
+    """
+    windows = []
+    window_start = run_start
+    while window_start <= run_end:
+        window_end = min(run_end, window_start + MAX_WINDOW - pd.Timedelta(days=1))
+        windows.append((window_start, window_end))
+        window_start = window_end + pd.Timedelta(days=1)
+    return windows
+
+
+def plan_order_windows(
+    date_start: str = DEFAULT_PERIOD_START,
+    date_end: str = None,
+    existing_dates: pd.DatetimeIndex = None,
+    max_gap_days: int = 7,
+) -> list:
+    """
+    Get the minimum set of order windows covering the dates of a period not downloaded yet.
+    :param date_start: Period start. Date str format YYYY-MM-DD.
+    :param date_end: Period end, included. Date str format YYYY-MM-DD. Default is yesterday.
+    :param existing_dates: Dates already downloaded.
+    :param max_gap_days: Runs of missing dates separated by at most this number of downloaded
+    dates are ordered together.
+    :return: List of (date_start, date_end) tuples. Date ISO format.
+    """
+    if date_end is None:
+        date_end = get_default_period_end()
+
+    runs = get_missing_date_runs(date_start, date_end, existing_dates)
+    runs = merge_close_runs(runs, max_gap_days)
+
+    windows = []
+    for run_start, run_end in runs:
+        windows += split_run_into_windows(run_start, run_end)
+
+    return [
+        (
+            convert_date_to_iso(window_start.strftime("%Y-%m-%d")),
+            convert_date_to_iso(window_end.strftime("%Y-%m-%d")),
+        )
+        for window_start, window_end in windows
+    ]
+
+
+def plan_station_order_windows(
+    num_station: str,
+    date_start: str = DEFAULT_PERIOD_START,
+    date_end: str = None,
+) -> list:
+    """
+    Get the order windows of a station, skipping the dates already on disk and the dates
+    recorded as missing at the source in the download ledger, like the years before the
+    station opened : they are not ordered again once the date range files are deleted.
+    :param num_station:
+    :param date_start: Period start. Date str format YYYY-MM-DD.
+    :param date_end: Period end, included. Date str format YYYY-MM-DD. Default is yesterday.
+    :return: List of (date_start, date_end) tuples. Date ISO format.
+    """
+    missing_at_source = pd.DatetimeIndex(
+        get_download_ledger().get_missing_dates(num_station)
+    )
+    return plan_order_windows(
+        date_start,
+        date_end,
+        existing_dates=get_existing_dates(num_station).append(missing_at_source),
+    )
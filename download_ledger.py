@@ -0,0 +1,305 @@
+import sqlite3
+import threading
+import time
+
+from config import PROJECT_ROOT
+from logs.logging_config import logger
+
+DEFAULT_LEDGER_PATH = PROJECT_ROOT + "/data/download_ledger.db"
+
+PENDING = "pending"
+ORDERED = "ordered"
+DONE = "done"
+FAILED = "failed"
+
+# Dates missing at the source are ordered again after 30 days : observations can be published late
+DEFAULT_MISSING_DATES_TTL = 30 * 24 * 3600
+
+
+class DownloadLedger:
+    """
+    Durable record of the download jobs, stored in SQLite.
+    A job is keyed by (station, date_start, date_end) and records its status, command number,
+    attempts, downloaded bytes and timings. A command number saved before a crash lets the next
+    run download the ordered file instead of paying for a new order.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_LEDGER_PATH):
+        """
+
+        :param db_path: Path of the SQLite database file.
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS download_jobs (
+                    num_station TEXT NOT NULL,
+                    date_start TEXT NOT NULL,
+                    date_end TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    command_number TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    downloaded_bytes INTEGER,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    ordered_at REAL,
+                    completed_at REAL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (num_station, date_start, date_end)
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS download_jobs_status "
+                "ON download_jobs (status)"
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS missing_dates (
+                    num_station TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    recorded_at REAL NOT NULL,
+                    PRIMARY KEY (num_station, date)
+                )
+                """
+            )
+
+    def close(self):
+        self.connection.close()
+
+    def _execute(self, query: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        with self._lock, self.connection:
+            return self.connection.execute(query, parameters)
+
+    def add_job(self, num_station: str, date_start: str, date_end: str) -> dict:
+        """
+        Add a job to the ledger if it is not already recorded.
+        :param num_station: Station number
+        :param date_start: Date range start. Date ISO format.
+        :param date_end: Date range end. Date ISO format.
+        :return: The recorded job.
+        """
+        now = time.time()
+        self._execute(
+            "INSERT OR IGNORE INTO download_jobs "
+            "(num_station, date_start, date_end, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (str(num_station), date_start, date_end, PENDING, now, now),
+        )
+        return self.get_job(num_station, date_start, date_end)
+
+    def get_job(self, num_station: str, date_start: str, date_end: str):
+        """
+        Get a job from the ledger.
+        :param num_station:
+        :param date_start:
+        :param date_end:
+        :return: The recorded job as a dictionary, None if the job is unknown.
+        """
+        row = self._execute(
+            "SELECT * FROM download_jobs "
+            "WHERE num_station = ? AND date_start = ? AND date_end = ?",
+            (str(num_station), date_start, date_end),
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def get_jobs(self, status: str = None, num_station: str = None) -> list:
+        """
+        Get the jobs of the ledger, optionally filtered by status and station.
+        :param status:
+        :param num_station:
+        :return: List of jobs as dictionaries.
+        """
+        query = "SELECT * FROM download_jobs WHERE 1 = 1"
+        parameters = []
+        if status is not None:
+            query += " AND status = ?"
+            parameters.append(status)
+        if num_station is not None:
+            query += " AND num_station = ?"
+            parameters.append(str(num_station))
+        rows = self._execute(query, tuple(parameters)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_station_statuses(self, num_station: str) -> dict:
+        """
+        Get the status of every job of a station.
+        :param num_station:
+        :return: Dictionary (date_start, date_end) -> status.
+        """
+        return {
+            (job["date_start"], job["date_end"]): job["status"]
+            for job in self.get_jobs(num_station=num_station)
+        }
+
+    def mark_ordered(
+        self,
+        num_station: str,
+        date_start: str,
+        date_end: str,
+        command_number,
+        ordered_at: float = None,
+    ):
+        """
+        Record the command number of an accepted order.
+        :param num_station:
+        :param date_start:
+        :param date_end:
+        :param command_number:
+        :param ordered_at: Time the order was accepted. Default is now.
+        :return:
+        """
+        now = time.time()
+        self._execute(
+            "UPDATE download_jobs SET status = ?, command_number = ?, error = NULL, "
+            "ordered_at = ?, updated_at = ? "
+            "WHERE num_station = ? AND date_start = ? AND date_end = ?",
+            (
+                ORDERED,
+                str(command_number),
+                ordered_at or now,
+                now,
+                str(num_station),
+                date_start,
+                date_end,
+            ),
+        )
+
+    def mark_done(
+        self, num_station: str, date_start: str, date_end: str, downloaded_bytes: int
+    ):
+        """
+        Record a downloaded file.
+        :param num_station:
+        :param date_start:
+        :param date_end:
+        :param downloaded_bytes: Size of the downloaded file.
+        :return:
+        """
+        now = time.time()
+        self._execute(
+            "UPDATE download_jobs SET status = ?, downloaded_bytes = ?, error = NULL, "
+            "completed_at = ?, updated_at = ? "
+            "WHERE num_station = ? AND date_start = ? AND date_end = ?",
+            (DONE, downloaded_bytes, now, now, str(num_station), date_start, date_end),
+        )
+
+    def mark_pending(self, num_station: str, date_start: str, date_end: str):
+        """
+        Forget the command number of a job so that it is ordered again.
+        :param num_station:
+        :param date_start:
+        :param date_end:
+        :return:
+        """
+        self._execute(
+            "UPDATE download_jobs SET status = ?, command_number = NULL, "
+            "updated_at = ? "
+            "WHERE num_station = ? AND date_start = ? AND date_end = ?",
+            (PENDING, time.time(), str(num_station), date_start, date_end),
+        )
+
+    def record_failure(
+        self,
+        num_station: str,
+        date_start: str,
+        date_end: str,
+        error: Exception,
+        is_final: bool = False,
+    ):
+        """
+        Record a failed request for a job.
+        :param num_station:
+        :param date_start:
+        :param date_end:
+        :param error:
+        :param is_final: True if the job will not be retried.
+        :return:
+        """
+        query = "UPDATE download_jobs SET attempts = attempts + 1, error = ?, "
+        parameters = [str(error)]
+        if is_final:
+            query += "status = ?, "
+            parameters.append(FAILED)
+        query += (
+            "updated_at = ? WHERE num_station = ? AND date_start = ? AND date_end = ?"
+        )
+        parameters += [time.time(), str(num_station), date_start, date_end]
+        self._execute(query, tuple(parameters))
+        if is_final:
+            logger.error(
+                f"Download of station {num_station} from {date_start} to {date_end} "
+                f"marked as failed in the ledger"
+            )
+
+    def add_missing_dates(self, num_station: str, dates: list):
+        """
+        Record dates that the API does not have for a station, so they are not ordered again
+        until their record expires. A date recorded again is kept for a new TTL.
+        :param num_station:
+        :param dates: List of dates str format YYYY-MM-DD.
+        :return:
+        """
+        now = time.time()
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT INTO missing_dates (num_station, date, recorded_at) "
+                "VALUES (?, ?, ?) ON CONFLICT (num_station, date) "
+                "DO UPDATE SET recorded_at = excluded.recorded_at",
+                [(str(num_station), date, now) for date in dates],
+            )
+        logger.info(
+            f"{len(dates)} dates recorded as missing at the source for station {num_station}"
+        )
+
+    def get_missing_dates(
+        self, num_station: str, ttl: float = DEFAULT_MISSING_DATES_TTL
+    ) -> list:
+        """
+        Get the dates recorded as missing at the source for a station. Expired records are not
+        returned, so that these dates are ordered again.
+        :param num_station:
+        :param ttl: Seconds during which a record is used. All the records if None.
+        :return: List of dates str format YYYY-MM-DD.
+        """
+        recorded_after = time.time() - ttl if ttl is not None else 0.0
+        rows = self._execute(
+            "SELECT date FROM missing_dates WHERE num_station = ? AND recorded_at >= ? "
+            "ORDER BY date",
+            (str(num_station), recorded_after),
+        ).fetchall()
+        return [row["date"] for row in rows]
+
+    def clear_missing_dates(self, num_station: str = None) -> int:
+        """
+        Forget the dates recorded as missing at the source, so that they are ordered again.
+        :param num_station: Station whose records are deleted. All the stations if None.
+        :return: Number of deleted records.
+        """
+        if num_station is None:
+            cursor = self._execute("DELETE FROM missing_dates")
+        else:
+            cursor = self._execute(
+                "DELETE FROM missing_dates WHERE num_station = ?", (str(num_station),)
+            )
+        logger.info(f"{cursor.rowcount} dates missing at the source cleared")
+        return cursor.rowcount
+
+
+_download_ledger = None
+
+
+def get_download_ledger() -> DownloadLedger:
+    """
+    Get the ledger shared by the downloads of the process. Opened on first use.
+    :return:
+    """
+    global _download_ledger
+    if _download_ledger is None:
+        _download_ledger = DownloadLedger()
+    return _download_ledger
@@ -0,0 +1,333 @@
+import asyncio
+import os
+import time
+from collections import Counter
+
+import download_ledger
+from config import API_KEY, BASE_URL
+from api_client import ApiClient, ApiHTTPError
+from AsyncCSVDownloader import AsyncCSVDownloader
+from date_range_planner import get_dates_missing_in_file
+from download_ledger import DownloadLedger
+from logs.logging_config import logger
+
+"""=====================================================================================================
+    Download jobs
+====================================================================================================="""
+
+
+class DownloadJob:
+    """
+    One order of the CSV file of a station for a given date range.
+    """
+
+    PENDING = download_ledger.PENDING
+    ORDERED = download_ledger.ORDERED
+    DONE = download_ledger.DONE
+    FAILED = download_ledger.FAILED
+
+    def __init__(self, downloader: AsyncCSVDownloader):
+        """
+
+        :param downloader: Downloader of the station and date range.
+        """
+        self.downloader = downloader
+        self.status = DownloadJob.PENDING
+        self.command_number = None
+        self.attempts = 0
+        self.error = None
+        self.is_resumed = False
+
+    @property
+    def key(self) -> tuple:
+        return (
+            self.downloader.num_station,
+            self.downloader.date_start,
+            self.downloader.date_end,
+        )
+
+    def __repr__(self):
+        """
+        Return a string representation of the DownloadJob object.
+        """
+        return (
+            f"DownloadJob(num_station={self.downloader.num_station}, "
+            f"date_start={self.downloader.date_start}, "
+            f"date_end={self.downloader.date_end}, "
+            f"status={self.status}, "
+            f"command_number={self.command_number})"
+        )
+
+
+"""=====================================================================================================
+    Scheduler
+====================================================================================================="""
+
+
+class DownloadScheduler:
+    """
+    Download many CSV files at once from a single event loop.
+    The request rate is bounded by the process-wide rate limiter of the API client.
+    Orders are placed for several stations and date ranges, all pending command numbers are polled
+    together through one pooled API client, and each file is saved as soon as it is ready.
+    With a DownloadLedger, command numbers survive a restart : ordered jobs are polled again
+    instead of being ordered twice, and downloaded jobs are skipped.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 20,
+        retry_delay: float = 5,
+        max_attempts: int = 5,
+        max_poll_duration: float = 3600,
+        base_url: str = BASE_URL,
+        api_key: str = API_KEY,
+        ledger: DownloadLedger = None,
+    ):
+        """
+
+        :param max_in_flight: Maximum number of orders placed and not downloaded yet.
+        :param retry_delay: Seconds to wait before ordering again after a failed order.
+        :param max_attempts: Maximum number of failed requests for a job before giving up.
+        :param max_poll_duration: Seconds after which a command number still in production is
+        given up. The job is marked as failed in the ledger and ordered again by the next run.
+        :param base_url: API base URL. Can point to a local stand-in server.
+        :param api_key: API key.
+        :param ledger: Optional ledger where the jobs are recorded and resumed from.
+        """
+        self.max_in_flight = max_in_flight
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.max_poll_duration = max_poll_duration
+        self.base_url = base_url
+        self.api_key = api_key
+        self.ledger = ledger
+        self.jobs = []
+
+    def add_job(self, num_station: str, date_start: str, date_end: str) -> DownloadJob:
+        """
+        Add a download job to the scheduler.
+        :param num_station: Station number
+        :param date_start: Date range start. Date ISO format.
+        :param date_end: Date range end. Date ISO format.
+        :return:
+        """
+        downloader = AsyncCSVDownloader(
+            num_station=num_station,
+            date_start=date_start,
+            date_end=date_end,
+        )
+        job = DownloadJob(downloader)
+        self.jobs.append(job)
+
+        if self.ledger is not None:
+            record = self.ledger.add_job(num_station, date_start, date_end)
+            if record["status"] == DownloadJob.DONE and os.path.isfile(
+                downloader.save_path
+            ):
+                job.status = DownloadJob.DONE
+            elif record["status"] == DownloadJob.ORDERED and record["command_number"]:
+                job.status = DownloadJob.ORDERED
+                job.command_number = record["command_number"]
+                job.is_resumed = True
+                # Latencies are measured from the order, not from the restart
+                downloader.ordered_at = record["ordered_at"]
+        return job
+
+    def resume_jobs(self) -> list:
+        """
+        Add every job of the ledger that is not downloaded yet.
+        :return: List of the added jobs.
+        """
+        known_jobs = {job.key for job in self.jobs}
+        jobs = []
+        for status in (DownloadJob.ORDERED, DownloadJob.PENDING):
+            for record in self.ledger.get_jobs(status=status):
+                key = (record["num_station"], record["date_start"], record["date_end"])
+                if key not in known_jobs:
+                    jobs.append(self.add_job(*key))
+                    known_jobs.add(key)
+        logger.info(f"{len(jobs)} jobs resumed from the download ledger")
+        return jobs
+
+    def _record_failure(
+        self, job: DownloadJob, error: Exception, is_final: bool = False
+    ) -> bool:
+        """
+        Record a failed request for a job. The job is marked as failed after max_attempts.
+        :param job:
+        :param error:
+        :param is_final: Mark the job as failed whatever its number of attempts.
+        :return: True if the job can still be retried.
+        """
+        job.attempts += 1
+        job.error = error
+        logger.error(
+            f"Request failed for station {job.downloader.num_station} from "
+            f"{job.downloader.date_start} to {job.downloader.date_end} "
+            f"(attempt {job.attempts}/{self.max_attempts}): {error}"
+        )
+        is_final = is_final or job.attempts >= self.max_attempts
+        if self.ledger is not None:
+            self.ledger.record_failure(*job.key, error, is_final=is_final)
+        if is_final:
+            job.status = DownloadJob.FAILED
+            return False
+        return True
+
+    async def _order(self, job: DownloadJob) -> bool:
+        """
+        Place the order of a job.
+        :param job:
+        :return: True if the order is accepted.
+        """
+        while True:
+            try:
+                api_response = await job.downloader.order_csv()
+                job.command_number = job.downloader.extract_command_number(api_response)
+                job.status = DownloadJob.ORDERED
+                if self.ledger is not None:
+                    self.ledger.mark_ordered(
+                        *job.key, job.command_number, job.downloader.ordered_at
+                    )
+                return True
+            except Exception as err:
+                if not self._record_failure(job, err):
+                    return False
+                await asyncio.sleep(self.retry_delay)
+
+    async def _fetch(self, job: DownloadJob) -> bool:
+        """
+        Poll the command number of an ordered job until the file is ready, then save it.
+        :param job:
+        :return: True if the file is saved.
+        """
+        attempt = 0
+        poll_start = time.monotonic()
+        while True:
+            if time.monotonic() - poll_start > self.max_poll_duration:
+                # A command that never completes must not hold an in-flight slot for good
+                self._record_failure(
+                    job,
+                    TimeoutError(
+                        f"Command {job.command_number} still in production after "
+                        f"{self.max_poll_duration:.0f} s"
+                    ),
+                    is_final=True,
+                )
+                return False
+            await asyncio.sleep(job.downloader.next_poll_delay(attempt))
+            attempt += 1
+            try:
+                save_path = await job.downloader.poll_csv(job.command_number)
+            except ApiHTTPError as err:
+                # The command number saved before a restart may have expired
+                if job.is_resumed and 400 <= err.status_code < 500:
+                    return False
+                if not self._record_failure(job, err):
+                    return False
+                continue
+            except Exception as err:
+                if not self._record_failure(job, err):
+                    return False
+                continue
+
+            if save_path is not None:
+                job.status = DownloadJob.DONE
+                if self.ledger is not None:
+                    self.ledger.mark_done(*job.key, os.path.getsize(save_path))
+                    self._record_missing_dates(job, save_path)
+                return True
+
+    def _record_missing_dates(self, job: DownloadJob, save_path: str):
+        """
+        Record in the ledger the dates of a downloaded date range that the file does not have, so
+        that they are not ordered again once the date range file is deleted.
+        :param job:
+        :param save_path: Downloaded file.
+        :return:
+        """
+        try:
+            missing_dates = get_dates_missing_in_file(
+                save_path, job.downloader.date_start, job.downloader.date_end
+            )
+        except Exception as err:
+            logger.warning(f"Missing dates of {job} not recorded: {err}")
+            return
+        if not missing_dates.empty:
+            self.ledger.add_missing_dates(
+                job.downloader.num_station,
+                missing_dates.strftime("%Y-%m-%d").tolist(),
+            )
+
+    async def _run_job(self, job: DownloadJob, in_flight: asyncio.Semaphore):
+        """
+        Order and download the file of a job. At most max_in_flight jobs run this at once.
+        :param job:
+        :param in_flight:
+        :return:
+        """
+        async with in_flight:
+            if job.status == DownloadJob.DONE:
+                return
+            if job.status == DownloadJob.ORDERED and job.is_resumed:
+                if await self._fetch(job) or job.status == DownloadJob.FAILED:
+                    return
+                logger.info(f"Saved command number of {job} expired. Ordering again")
+                job.is_resumed = False
+                if self.ledger is not None:
+                    self.ledger.mark_pending(*job.key)
+
+            if await self._order(job):
+                await self._fetch(job)
+
+    async def run_async(
+        self, client: ApiClient = None, on_station_done: callable = None
+    ) -> list:
+        """
+        Run all the jobs until they are downloaded or failed.
+        :param client: Shared API client. If None, a client is opened for the run.
+        :param on_station_done: Optional function (num_station, is_complete) called from the event
+        loop as soon as all the jobs of a station are finished. is_complete is True if all the
+        files of the station are downloaded. It must not block.
+        :return: List of the jobs with their final status.
+        """
+        if client is None:
+            async with ApiClient(
+                self.base_url, self.api_key, max_connections=self.max_in_flight
+            ) as client:
+                return await self.run_async(client, on_station_done)
+
+        for job in self.jobs:
+            job.downloader.client = client
+
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        # Per station counters, updated as each job finishes
+        remaining_jobs = Counter(job.downloader.num_station for job in self.jobs)
+        failed_jobs = Counter()
+
+        async def run_job(job: DownloadJob):
+            await self._run_job(job, in_flight)
+            num_station = job.downloader.num_station
+            remaining_jobs[num_station] -= 1
+            if job.status != DownloadJob.DONE:
+                failed_jobs[num_station] += 1
+            if on_station_done is not None and remaining_jobs[num_station] == 0:
+                on_station_done(num_station, failed_jobs[num_station] == 0)
+
+        await asyncio.gather(*(run_job(job) for job in self.jobs))
+
+        done = [job for job in self.jobs if job.status == DownloadJob.DONE]
+        logger.info(
+            f"Download scheduler finished: {len(done)}/{len(self.jobs)} files downloaded"
+        )
+        return self.jobs
+
+    def run(self, on_station_done: callable = None) -> list:
+        """
+        Run all the jobs until they are downloaded or failed.
+        :param on_station_done: Optional function (num_station, is_complete) called as soon as all
+        the jobs of a station are finished.
+        :return: List of the jobs with their final status.
+        """
+        return asyncio.run(self.run_async(on_station_done=on_station_done))
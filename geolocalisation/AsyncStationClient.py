@@ -0,0 +1,194 @@
+import asyncio
+import json
+import aiohttp
+
+from api_client import ApiClient, ApiHTTPError
+from logs.logging_config import logger
+from response_cache import DEFAULT_TTL
+from tenacity import (
+    retry,
+    stop_after_attempt,
+    wait_exponential,
+    retry_if_exception_type,
+)
+
+
+class AsyncStationClient:
+    """
+    Asynchronous client to get the information of stations through a shared ApiClient.
+    Station metadata rarely changes : responses are kept in the response cache for cache_ttl
+    seconds, then revalidated.
+    """
+
+    def __init__(self, client: ApiClient = None, cache_ttl: float = DEFAULT_TTL):
+        """
+
+        :param client: Shared API client. If None, a client is opened for each call.
+        :param cache_ttl: Seconds during which a response is used from the cache.
+        """
+        self.client = client
+        self.cache_ttl = cache_ttl
+
+    def get_station_info_path(self, num_station: int) -> str:
+        """
+        Get the API path of the information of a station.
+        :param num_station:
+        :return:
+        """
+        return f"/public/DPClim/v1/information-station?id-station={num_station}"
+
+    async def get_station_info(self, num_station: int) -> bytes:
+        """
+        Get the station information.
+        :param num_station:
+        :return: JSON response content as bytes.
+        """
+        if self.client is None:
+            async with ApiClient() as client:
+                return await AsyncStationClient(
+                    client, self.cache_ttl
+                ).get_station_info(num_station)
+        return await self._fetch_station_info(num_station)
+
+    @retry(
+        stop=stop_after_attempt(10),
+        wait=wait_exponential(
+            multiplier=1, min=2, max=60
+        ),  # Exponential backoff (2, 4, 8, ... max 60 seconds)
+        retry=retry_if_exception_type(
+            aiohttp.ClientError
+        ),  # Retry for request exceptions
+    )
+    async def _fetch_station_info(self, num_station: int) -> bytes:
+        """
+        Request the station information with the shared client.
+        :param num_station:
+        :return: JSON response content as bytes.
+        """
+        response = await self.client.get(
+            self.get_station_info_path(num_station), self.cache_ttl
+        )
+
+        if response.status_code == 200:
+            logger.info(
+                f"Request accepted for getting information of " f"station {num_station}"
+            )
+            return response.content
+        else:
+            logger.error(f"Response Content: {response.content}")
+            raise ApiHTTPError(response.status_code, response.url, response.content)
+
+    async def get_stations_info(self, stations: list) -> dict:
+        """
+        Get the information of several stations concurrently.
+        :param stations: List of station numbers.
+        :return: Dictionary station number -> parsed JSON information. Stations in error are skipped.
+        """
+        if self.client is None:
+            async with ApiClient() as client:
+                return await AsyncStationClient(
+                    client, self.cache_ttl
+                ).get_stations_info(stations)
+
+        results = await asyncio.gather(
+            *(self.get_station_info(num_station) for num_station in stations),
+            return_exceptions=True,
+        )
+
+        stations_info = {}
+        for num_station, result in zip(stations, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"Failed to get information of station {num_station}: {result}"
+                )
+            else:
+                stations_info[num_station] = json.loads(result)
+        return stations_info
+
+    def get_departement_stations_path(self, num_departement: int) -> str:
+        """
+        Get the API path of the list of daily stations of a departement.
+        :param num_departement:
+        :return:
+        """
+        return (
+            f"/public/DPClim/v1/liste-stations/quotidienne?"
+            f"id-departement={num_departement}"
+        )
+
+    async def get_departement_stations(self, num_departement: int) -> bytes:
+        """
+        Get the information of the stations of a departement.
+        Contains station ids, longitude, latitude, altitude, name, etc.
+        :param num_departement:
+        :return: JSON response content as bytes.
+        """
+        if self.client is None:
+            async with ApiClient() as client:
+                return await AsyncStationClient(
+                    client, self.cache_ttl
+                ).get_departement_stations(num_departement)
+        return await self._fetch_departement_stations(num_departement)
+
+    @retry(
+        stop=stop_after_attempt(10),
+        wait=wait_exponential(
+            multiplier=1, min=2, max=60
+        ),  # Exponential backoff (2, 4, 8, ... max 60 seconds)
+        retry=retry_if_exception_type(
+            aiohttp.ClientError
+        ),  # Retry for request exceptions
+    )
+    async def _fetch_departement_stations(self, num_departement: int) -> bytes:
+        """
+        Request the information of the stations of a departement with the shared client.
+        :param num_departement:
+        :return: JSON response content as bytes.
+        """
+        response = await self.client.get(
+            self.get_departement_stations_path(num_departement), self.cache_ttl
+        )
+
+        if response.status_code == 200:
+            logger.info(
+                f"Successfully retrieved info of stations for departement {num_departement}"
+            )
+            return response.content
+        else:
+            logger.error(
+                f"Failed to retrieve info of stations for departement {num_departement}"
+            )
+            raise ApiHTTPError(response.status_code, response.url, response.content)
+
+    async def get_departements_stations(self, departements: list) -> dict:
+        """
+        Get the information of the stations of several departements concurrently.
+        The number of simultaneous requests is bounded by the connection pool and the rate limiter
+        of the client.
+        :param departements: List of departement numbers.
+        :return: Dictionary departement number -> parsed JSON list of stations. Departements in
+        error are skipped.
+        """
+        if self.client is None:
+            async with ApiClient() as client:
+                return await AsyncStationClient(
+                    client, self.cache_ttl
+                ).get_departements_stations(departements)
+
+        results = await asyncio.gather(
+            *(
+                self.get_departement_stations(num_departement)
+                for num_departement in departements
+            ),
+            return_exceptions=True,
+        )
+
+        departements_stations = {}
+        for num_departement, result in zip(departements, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"Failed to get stations of departement {num_departement}: {result}"
+                )
+            else:
+                departements_stations[num_departement] = json.loads(result)
+        return departements_stations
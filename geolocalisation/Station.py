@@ -1,16 +1,8 @@
-import requests
+import asyncio
 import json
 
-from config import API_KEY, BASE_URL
-from geolocalisation.utils_geolocalisation import (
-    from_station_info_to_name,
-    from_station_info_to_latitude,
-    from_station_info_to_longitude,
-    from_station_info_to_altitude,
-    from_station_info_to_lieuDit,
-    from_station_info_to_bassin,
-)
-from logs.logging_config import logger
+from geolocalisation.AsyncStationClient import AsyncStationClient
+from geolocalisation.utils_geolocalisation import parse_station_info
 
 
 class Station:
@@ -48,38 +40,25 @@ class Station:
     def get_station_info(self) -> json:
         """
         Get the station information.
+        Synchronous wrapper around AsyncStationClient.
         """
-        url = (
-            f"{BASE_URL}/public/DPClim/v1/"
-            f"information-station?"
-            f"id-station={self.num_station}"
+        station_info = asyncio.run(
+            AsyncStationClient().get_station_info(self.num_station)
         )
-
-        headers = {"accept": "*/*", "Authorization": f"Bearer {API_KEY}"}
-        response = requests.get(url, headers=headers)
-
-        if response.status_code == 200:
-            logger.info(
-                f"Request accepted for getting information of "
-                f"station {self.num_station}"
-            )
-            station_info = response.content
-            self.station_info = json.loads(station_info)
-            return station_info
-        else:
-            logger.error(f"Response Content: {response.content}")
-            response.raise_for_status()
+        self.station_info = json.loads(station_info)
+        return station_info
 
     def fill_station_info(self) -> str:
         """
-        Fill the station information.
+        Fill the station information. The JSON is parsed once for all the fields.
         """
-        self.name = from_station_info_to_name(self.station_info)
-        self.lieuDit = from_station_info_to_lieuDit(self.station_info)
-        self.bassin = from_station_info_to_bassin(self.station_info)
+        fields = parse_station_info(self.station_info)
+        self.name = fields["name"]
+        self.lieuDit = fields["lieuDit"]
+        self.bassin = fields["bassin"]
 
-        self.latitude = from_station_info_to_latitude(self.station_info)
-        self.longitude = from_station_info_to_longitude(self.station_info)
-        self.altitude = from_station_info_to_altitude(self.station_info)
+        self.latitude = fields["latitude"]
+        self.longitude = fields["longitude"]
+        self.altitude = fields["altitude"]
 
         pass
@@ -0,0 +1,242 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from geolocalisation.StationRegistry import StationRegistry, normalise_station_id
+from geolocalisation.StationSpatialIndex import StationSpatialIndex
+from logs.logging_config import logger
+from utils import find_station_histo_file_path, get_station_histo_df
+
+"""=====================================================================================================
+    Interpolation of the daily weather variables at any position, by inverse distance weighting
+    The weights of a set of positions are computed once, then all the days are interpolated at
+    once : weighted sums of the (positions, neighbours, days) values of the nearest stations
+===================================================================================================="""
+
+# Decrease of the temperature with the altitude, in °C per m
+DEFAULT_LAPSE_RATE = 0.0065
+
+# Variables corrected with the lapse rate
+TEMPERATURE_VARIABLES = ("TN", "TX", "TM", "TNTXM")
+
+# Distance under which a station is at the position, in km : avoids infinite weights
+MIN_DISTANCE_KM = 0.001
+
+# Maximum number of position x neighbour x day values computed at once, 32 MB of float64
+MAX_CHUNK_ELEMENTS = 4_000_000
+
+
+class StationInterpolator:
+    """
+    Inverse distance weighting of the station values at any position.
+    Each position uses its n_neighbours nearest stations with a weight 1 / distance ** power.
+    Stations without value on a day are left out and the weights of the others are normalised
+    again, so a missing value does not bias the result.
+    Temperatures can be corrected with a lapse rate : station values are brought to sea level
+    with their altitude, interpolated, then brought to the altitude of the position.
+    The weights are kept in a LRU cache per (positions, stations).
+    """
+
+    def __init__(
+        self,
+        registry: StationRegistry,
+        power: float = 2.0,
+        n_neighbours: int = 8,
+        max_distance_km: float = None,
+        lapse_rate: float = DEFAULT_LAPSE_RATE,
+        cache_size: int = 32,
+    ):
+        """
+
+        :param registry: Positions of the stations.
+        :param power: Power of the distance in the weights.
+        :param n_neighbours: Number of nearest stations used for a position.
+        :param max_distance_km: Stations further than this distance are not used.
+        :param lapse_rate: Decrease of the temperature with the altitude, in °C per m.
+        :param cache_size: Maximum number of weight sets kept in the cache.
+        """
+        self.registry = registry
+        self.power = power
+        self.n_neighbours = n_neighbours
+        self.max_distance_km = max_distance_km
+        self.lapse_rate = lapse_rate
+        self._get_weights_cached = lru_cache(maxsize=cache_size)(self._get_weights)
+
+    def __repr__(self):
+        return (
+            f"StationInterpolator(stations={len(self.registry)}, power={self.power}, "
+            f"n_neighbours={self.n_neighbours}, "
+            f"cache={self._get_weights_cached.cache_info()})"
+        )
+
+    def _get_weights(self, positions: bytes, station_ids: tuple) -> tuple:
+        """
+        Compute the weights of the nearest stations of positions.
+        :param positions: Bytes of a (2, n) float64 array of latitudes and longitudes.
+        :param station_ids: Stations that can be used.
+        :return: (indices, weights) arrays of shape (positions, n_neighbours). Indices of the
+        stations in station_ids.
+        """
+        latitudes, longitudes = np.frombuffer(positions).reshape(2, -1)
+        rows = [self.registry.get_index(num_station) for num_station in station_ids]
+        stations = self.registry.stations[rows]
+        index = StationSpatialIndex(stations["latitude"], stations["longitude"])
+
+        distances, indices = index.query_nearest(
+            latitudes, longitudes, k=self.n_neighbours
+        )
+        weights = np.maximum(distances, MIN_DISTANCE_KM) ** -self.power
+        if self.max_distance_km is not None:
+            weights[distances > self.max_distance_km] = 0.0
+        return indices, weights
+
+    def get_weights(self, latitudes, longitudes, station_ids: list) -> tuple:
+        """
+        Get the weights of the nearest stations of positions, from the cache if they were
+        already computed for the same positions and stations.
+        :param latitudes: Latitudes of the positions in degrees.
+        :param longitudes: Longitudes of the positions in degrees.
+        :param station_ids: Stations that can be used.
+        :return: (indices, weights) arrays of shape (positions, n_neighbours).
+        """
+        positions = np.stack(
+            [
+                np.atleast_1d(np.asarray(latitudes, dtype=np.float64)),
+                np.atleast_1d(np.asarray(longitudes, dtype=np.float64)),
+            ]
+        )
+        station_ids = tuple(normalise_station_id(s) for s in station_ids)
+        return self._get_weights_cached(positions.tobytes(), station_ids)
+
+    def clear_cache(self):
+        self._get_weights_cached.cache_clear()
+
+    def interpolate(
+        self,
+        values: pd.DataFrame,
+        latitudes,
+        longitudes,
+        altitudes=None,
+        lapse_rate: float = None,
+    ) -> pd.DataFrame:
+        """
+        Interpolate daily values of the stations at positions.
+        :param values: One column per station number, one row per day. NaN are missing values.
+        :param latitudes: Latitudes of the positions in degrees.
+        :param longitudes: Longitudes of the positions in degrees.
+        :param altitudes: Altitudes of the positions in m. Needed for the lapse rate correction.
+        :param lapse_rate: Lapse rate correction in °C per m. No correction if None or 0.
+        :return: One column per position, in the order given, one row per day. NaN when no
+        station near a position has a value on a day.
+        """
+        station_ids = [normalise_station_id(column) for column in values.columns]
+        known = np.array([num_station in self.registry for num_station in station_ids])
+        if not known.all():
+            logger.warning(
+                f"{int((~known).sum())} stations without position are not used"
+            )
+        station_ids = [s for s, is_known in zip(station_ids, known) if is_known]
+        # One contiguous row per station : the values of the nearest stations are gathered by row
+        station_values = np.ascontiguousarray(
+            values.loc[:, known].to_numpy(dtype=np.float64, na_value=np.nan).T
+        )
+
+        indices, weights = self.get_weights(latitudes, longitudes, station_ids)
+        n_positions, n_days = len(indices), station_values.shape[1]
+
+        correct_altitude = bool(lapse_rate) and altitudes is not None
+        if correct_altitude:
+            station_altitudes = np.array(
+                [
+                    self.registry.altitudes[self.registry.get_index(num_station)]
+                    for num_station in station_ids
+                ]
+            )
+            station_values = station_values + lapse_rate * station_altitudes[:, None]
+
+        present = ~np.isnan(station_values)
+        filled = np.where(present, station_values, 0.0)
+        present = present.astype(np.float64)
+
+        # Values of the nearest stations of a chunk of positions : (positions, neighbours, days)
+        interpolated = np.empty((n_positions, n_days))
+        chunk_size = max(1, MAX_CHUNK_ELEMENTS // max(1, indices.shape[1] * n_days))
+        for start in range(0, n_positions, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            chunk_indices, chunk_weights = indices[chunk], weights[chunk]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                interpolated[chunk] = np.einsum(
+                    "pn,pnd->pd", chunk_weights, filled[chunk_indices]
+                ) / np.einsum("pn,pnd->pd", chunk_weights, present[chunk_indices])
+
+        if correct_altitude:
+            altitudes = np.broadcast_to(
+                np.asarray(altitudes, dtype=np.float64), (n_positions,)
+            )
+            interpolated -= lapse_rate * altitudes[:, None]
+
+        return pd.DataFrame(interpolated.T, index=values.index)
+
+    def interpolate_variable(
+        self,
+        variable: str,
+        latitudes,
+        longitudes,
+        altitudes=None,
+        stations: list = None,
+        date_start: str = None,
+        date_end: str = None,
+    ) -> pd.DataFrame:
+        """
+        Interpolate a daily variable of the station histo files at positions.
+        Temperatures are corrected with the lapse rate when the altitudes are given.
+        :param variable: Mnemonic of the variable, like TX or RR.
+        :param latitudes: Latitudes of the positions in degrees.
+        :param longitudes: Longitudes of the positions in degrees.
+        :param altitudes: Altitudes of the positions in m.
+        :param stations: Stations used. Default is all the stations of the registry with a histo
+        file.
+        :param date_start: First date. Date str format YYYY-MM-DD.
+        :param date_end: Last date, included. Date str format YYYY-MM-DD.
+        :return: One column per position, one row per DATE.
+        """
+        values = get_stations_variable_df(
+            variable,
+            stations if stations is not None else self.registry.station_ids,
+            date_start,
+            date_end,
+        )
+        lapse_rate = self.lapse_rate if variable in TEMPERATURE_VARIABLES else None
+        return self.interpolate(values, latitudes, longitudes, altitudes, lapse_rate)
+
+
+def get_stations_variable_df(
+    variable: str, stations: list, date_start: str = None, date_end: str = None
+) -> pd.DataFrame:
+    """
+    Get a daily variable of several stations from their histo files. Only the DATE and the
+    variable columns are read.
+    :param variable: Mnemonic of the variable.
+    :param stations: Station numbers. Stations without histo file or without the variable are
+    skipped.
+    :param date_start: First date. Date str format YYYY-MM-DD.
+    :param date_end: Last date, included. Date str format YYYY-MM-DD.
+    :return: One column per station number, one row per DATE.
+    """
+    series = {}
+    for num_station in stations:
+        if find_station_histo_file_path(num_station) is None:
+            continue
+        try:
+            df = get_station_histo_df(num_station, columns=["DATE", variable])
+        except (KeyError, ValueError) as e:
+            logger.warning(f"No {variable} for station {num_station}: {e}")
+            continue
+        df = df.dropna(subset=["DATE"]).drop_duplicates(subset="DATE")
+        series[num_station] = df.set_index("DATE")[variable]
+
+    if not series:
+        return pd.DataFrame()
+    values = pd.DataFrame(series).sort_index()
+    return values.loc[date_start:date_end]
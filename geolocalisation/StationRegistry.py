@@ -0,0 +1,248 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+from geolocalisation.AsyncStationClient import AsyncStationClient
+from geolocalisation.Station import Station
+from geolocalisation.utils_geolocalisation import parse_station_info
+from histo_schema import normalise_station_id
+from logs.logging_config import logger
+
+"""=====================================================================================================
+    Registry of all the stations, stored in a NumPy structured array
+    Text fields are UTF-8 bytes of the width of the longest value : 50 000 stations use a few MB
+===================================================================================================="""
+
+TEXT_FIELDS = ("num_station", "name", "lieuDit", "bassin")
+POSITION_FIELDS = ("latitude", "longitude", "altitude")
+
+
+def to_bytes_array(values: list) -> np.ndarray:
+    """
+    Encode text values in UTF-8, in an array as wide as the longest value.
+    :param values: Text values. None and NaN are stored as empty text.
+    :return:
+    """
+    encoded = [
+        b"" if value is None or value != value else str(value).encode("utf-8")
+        for value in values
+    ]
+    width = max((len(value) for value in encoded), default=1) or 1
+    return np.array(encoded, dtype=f"S{width}")
+
+
+class StationRegistry:
+    """
+    Information of many stations : number, name, lieuDit, bassin, latitude, longitude, altitude
+    and whether the station is open. One row per station in a NumPy structured array, and a
+    dictionary station number -> row for lookups in O(1).
+    Positions are also given as arrays, for vectorised computations on all the stations.
+    """
+
+    def __init__(self, stations: np.ndarray):
+        """
+
+        :param stations: Structured array built by StationRegistry.from_records.
+        """
+        self.stations = stations
+        self.index = {
+            num_station.decode("utf-8"): i
+            for i, num_station in enumerate(stations["num_station"])
+        }
+
+    def __repr__(self):
+        return (
+            f"StationRegistry(stations={len(self)}, "
+            f"open={int(self.is_open.sum())}, "
+            f"nbytes={self.nbytes})"
+        )
+
+    def __len__(self):
+        return len(self.stations)
+
+    def __contains__(self, num_station) -> bool:
+        return normalise_station_id(num_station) in self.index
+
+    @classmethod
+    def from_records(cls, records: list):
+        """
+        Build a registry from station records. A station found twice keeps its last record.
+        :param records: List of dictionaries with num_station, name, lieuDit, bassin, latitude,
+        longitude, altitude and is_open. Missing fields are empty, NaN, or open.
+        :return:
+        """
+        records = list(
+            {
+                normalise_station_id(record["num_station"]): record
+                for record in records
+            }.items()
+        )
+        columns = {"num_station": [num_station for num_station, _ in records]}
+        for field in TEXT_FIELDS[1:]:
+            columns[field] = [record.get(field) for _, record in records]
+
+        arrays = {field: to_bytes_array(columns[field]) for field in TEXT_FIELDS}
+        for field in POSITION_FIELDS:
+            arrays[field] = np.array(
+                [record.get(field, np.nan) for _, record in records], dtype=np.float64
+            )
+        arrays["is_open"] = np.array(
+            [record.get("is_open", True) for _, record in records], dtype=bool
+        )
+
+        stations = np.empty(
+            len(records),
+            dtype=[(field, array.dtype) for field, array in arrays.items()],
+        )
+        for field, array in arrays.items():
+            stations[field] = array
+        return cls(stations)
+
+    @classmethod
+    def from_stations_csv(cls, csv_file: str = "data/stations.csv"):
+        """
+        Build the registry of the open stations of the stations CSV file.
+        The file has no lieuDit and bassin.
+        :param csv_file: File written by create_stations_catalog.
+        :return:
+        """
+        df = pd.read_csv(csv_file, dtype={"id_station": str})
+        records = [
+            {
+                "num_station": num_station,
+                "name": name,
+                "latitude": latitude,
+                "longitude": longitude,
+                "altitude": altitude,
+            }
+            for num_station, name, latitude, longitude, altitude in zip(
+                df["id_station"],
+                df["name"],
+                df["latitude"],
+                df["longitude"],
+                df["altitude"],
+            )
+        ]
+        logger.info(f"{len(records)} stations loaded from {csv_file}")
+        return cls.from_records(records)
+
+    @classmethod
+    def from_departements_stations(cls, departements_stations: dict):
+        """
+        Build a registry from the station lists of the departements.
+        :param departements_stations: Dictionary departement number -> parsed JSON list of
+        stations, as returned by AsyncStationClient.get_departements_stations.
+        :return:
+        """
+        return cls.from_records(
+            [
+                {
+                    "num_station": station["id"],
+                    "name": station["nom"],
+                    "latitude": station["lat"],
+                    "longitude": station["lon"],
+                    "altitude": station["alt"],
+                    "is_open": station["posteOuvert"],
+                }
+                for stations_data in departements_stations.values()
+                for station in stations_data
+            ]
+        )
+
+    @classmethod
+    def from_stations_info(cls, stations_info: dict):
+        """
+        Build a registry from the information of the stations. Each JSON is parsed once.
+        :param stations_info: Dictionary station number -> parsed JSON information, as returned
+        by AsyncStationClient.get_stations_info.
+        :return:
+        """
+        records = []
+        for num_station, station_info in stations_info.items():
+            try:
+                records.append(
+                    {"num_station": num_station, **parse_station_info(station_info)}
+                )
+            except (KeyError, IndexError, TypeError) as e:
+                logger.error(f"Invalid information of station {num_station}: {e}")
+        return cls.from_records(records)
+
+    @classmethod
+    def from_api(cls, stations: list):
+        """
+        Build a registry from the information of the stations requested concurrently.
+        Responses come from the response cache when they are cached.
+        :param stations: List of station numbers.
+        :return:
+        """
+        stations_info = asyncio.run(AsyncStationClient().get_stations_info(stations))
+        return cls.from_stations_info(stations_info)
+
+    @property
+    def nbytes(self) -> int:
+        return self.stations.nbytes
+
+    @property
+    def station_ids(self) -> list:
+        return list(self.index)
+
+    @property
+    def latitudes(self) -> np.ndarray:
+        return self.stations["latitude"]
+
+    @property
+    def longitudes(self) -> np.ndarray:
+        return self.stations["longitude"]
+
+    @property
+    def altitudes(self) -> np.ndarray:
+        return self.stations["altitude"]
+
+    @property
+    def is_open(self) -> np.ndarray:
+        return self.stations["is_open"]
+
+    def get_index(self, num_station) -> int:
+        """
+        Get the row of a station.
+        :param num_station:
+        :return:
+        """
+        num_station = normalise_station_id(num_station)
+        if num_station not in self.index:
+            raise KeyError(f"Station {num_station} is not in the registry")
+        return self.index[num_station]
+
+    def get(self, num_station) -> Station:
+        """
+        Get a station with its information filled, without request.
+        :param num_station:
+        :return:
+        """
+        row = self.stations[self.get_index(num_station)]
+        station = Station(int(row["num_station"]))
+        station.name = row["name"].decode("utf-8")
+        station.lieuDit = row["lieuDit"].decode("utf-8") or None
+        station.bassin = row["bassin"].decode("utf-8") or None
+        station.latitude = float(row["latitude"])
+        station.longitude = float(row["longitude"])
+        station.altitude = float(row["altitude"])
+        return station
+
+    def select(self, mask: np.ndarray):
+        """
+        Get the registry of some stations.
+        :param mask: Boolean array, one value per station.
+        :return:
+        """
+        return StationRegistry(self.stations[mask])
+
+    def open_stations(self):
+        return self.select(self.is_open)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        df = pd.DataFrame(self.stations)
+        for field in TEXT_FIELDS:
+            df[field] = df[field].str.decode("utf-8")
+        return df
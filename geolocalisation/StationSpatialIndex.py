@@ -0,0 +1,296 @@
+import numpy as np
+
+from geolocalisation.StationRegistry import StationRegistry
+
+"""=====================================================================================================
+    Spatial index of the stations : nearest stations, stations within a radius or a bounding box
+    Positions are unit vectors : the dot product of two positions gives their great-circle
+    distance, so a batch of queries against all stations is one matrix product
+===================================================================================================="""
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Maximum number of query x station values computed at once, 32 MB of float64
+MAX_CHUNK_ELEMENTS = 4_000_000
+
+
+def to_unit_vectors(latitudes, longitudes) -> np.ndarray:
+    """
+    Get the unit vectors of positions on the sphere.
+    :param latitudes: Latitudes in degrees.
+    :param longitudes: Longitudes in degrees.
+    :return: Array of shape (n, 3).
+    """
+    latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_latitudes = np.cos(latitudes)
+    return np.stack(
+        [
+            cos_latitudes * np.cos(longitudes),
+            cos_latitudes * np.sin(longitudes),
+            np.sin(latitudes),
+        ],
+        axis=-1,
+    )
+
+
+def dot_to_distance_km(dot: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distance of two positions from the dot product of their unit vectors.
+    :param dot:
+    :return: Distances in km.
+    """
+    return EARTH_RADIUS_KM * np.arccos(np.clip(dot, -1.0, 1.0))
+
+
+def haversine_distances(latitudes_1, longitudes_1, latitudes_2, longitudes_2):
+    """
+    Great-circle distances of pairs of positions, element-wise.
+    :param latitudes_1: Latitudes in degrees.
+    :param longitudes_1: Longitudes in degrees.
+    :param latitudes_2: Latitudes in degrees.
+    :param longitudes_2: Longitudes in degrees.
+    :return: Distances in km.
+    """
+    latitudes_1, longitudes_1, latitudes_2, longitudes_2 = map(
+        np.radians, (latitudes_1, longitudes_1, latitudes_2, longitudes_2)
+    )
+    a = (
+        np.sin((latitudes_2 - latitudes_1) / 2) ** 2
+        + np.cos(latitudes_1)
+        * np.cos(latitudes_2)
+        * np.sin((longitudes_2 - longitudes_1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class StationSpatialIndex:
+    """
+    Spatial index of stations, queried by batches of points.
+    Queries are computed against all the stations by chunks of points, so that memory stays
+    bounded whatever the number of points : 100 000 points against 5 000 stations is a few
+    matrix products.
+    """
+
+    def __init__(
+        self,
+        latitudes,
+        longitudes,
+        altitudes=None,
+        station_ids=None,
+        max_chunk_elements: int = MAX_CHUNK_ELEMENTS,
+    ):
+        """
+
+        :param latitudes: Latitudes of the stations in degrees.
+        :param longitudes: Longitudes of the stations in degrees.
+        :param altitudes: Altitudes of the stations in m. Needed to weight by altitude.
+        :param station_ids: Station numbers, in the order of the positions.
+        :param max_chunk_elements: Maximum number of point x station values computed at once.
+        """
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.altitudes = (
+            None if altitudes is None else np.asarray(altitudes, dtype=np.float64)
+        )
+        self.station_ids = (
+            np.arange(len(self.latitudes))
+            if station_ids is None
+            else np.asarray(station_ids)
+        )
+        self.max_chunk_elements = max_chunk_elements
+        self.vectors = to_unit_vectors(self.latitudes, self.longitudes)
+
+    def __repr__(self):
+        return f"StationSpatialIndex(stations={len(self)})"
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    @classmethod
+    def from_registry(cls, registry: StationRegistry, open_only: bool = True):
+        """
+        Build the index of the stations of a registry. Stations without position are skipped.
+        :param registry:
+        :param open_only: Index only the open stations.
+        :return:
+        """
+        mask = np.isfinite(registry.latitudes) & np.isfinite(registry.longitudes)
+        if open_only:
+            mask &= registry.is_open
+        stations = registry.stations[mask]
+        return cls(
+            stations["latitude"],
+            stations["longitude"],
+            stations["altitude"],
+            np.char.decode(stations["num_station"], "utf-8"),
+        )
+
+    def _iter_chunks(self, latitudes, longitudes, altitudes=None):
+        """
+        Split the points into chunks of at most max_chunk_elements point x station values.
+        :param latitudes:
+        :param longitudes:
+        :param altitudes:
+        :return: Generator of (slice of the points, unit vectors, altitudes).
+        """
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+        if altitudes is not None:
+            altitudes = np.broadcast_to(
+                np.asarray(altitudes, dtype=np.float64), latitudes.shape
+            )
+        chunk_size = max(1, self.max_chunk_elements // max(1, len(self)))
+        for start in range(0, len(latitudes), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            yield (
+                chunk,
+                to_unit_vectors(latitudes[chunk], longitudes[chunk]),
+                None if altitudes is None else altitudes[chunk],
+            )
+
+    def get_distances(
+        self, vectors: np.ndarray, altitudes=None, altitude_weight: float = 0.0
+    ) -> np.ndarray:
+        """
+        Distances of points to all the stations.
+        With an altitude weight, the distance is sqrt(d ** 2 + (altitude_weight * dz) ** 2),
+        where dz is the altitude difference in m.
+        :param vectors: Unit vectors of the points.
+        :param altitudes: Altitudes of the points in m.
+        :param altitude_weight: km counted per m of altitude difference.
+        :return: Array of shape (points, stations), in km.
+        """
+        distances = dot_to_distance_km(vectors @ self.vectors.T)
+        if altitude_weight and altitudes is not None and self.altitudes is not None:
+            altitude_differences = altitudes[:, np.newaxis] - self.altitudes
+            distances = np.hypot(distances, altitude_weight * altitude_differences)
+        return distances
+
+    def query_nearest(
+        self,
+        latitudes,
+        longitudes,
+        k: int = 1,
+        altitudes=None,
+        altitude_weight: float = 0.0,
+    ) -> tuple:
+        """
+        Get the k nearest stations of each point.
+        :param latitudes: Latitudes of the points in degrees.
+        :param longitudes: Longitudes of the points in degrees.
+        :param k: Number of stations per point.
+        :param altitudes: Altitudes of the points in m, to weight by altitude difference.
+        :param altitude_weight: km counted per m of altitude difference. 0.1 makes 100 m of
+        altitude difference as far as 10 km.
+        :return: (distances, indices) arrays of shape (points, k), sorted by distance. Distances
+        in km, indices of the stations in the index.
+        """
+        k = min(k, len(self))
+        n_points = np.atleast_1d(latitudes).shape[0]
+        weight_altitude = bool(
+            altitude_weight and altitudes is not None and self.altitudes is not None
+        )
+        distances = np.empty((n_points, k))
+        indices = np.empty((n_points, k), dtype=np.int64)
+
+        for chunk, vectors, chunk_altitudes in self._iter_chunks(
+            latitudes, longitudes, altitudes
+        ):
+            # Without altitude, the nearest stations have the largest dot products : the
+            # distances are only computed for the k selected stations
+            if weight_altitude:
+                scores = self.get_distances(vectors, chunk_altitudes, altitude_weight)
+            else:
+                scores = -(vectors @ self.vectors.T)
+            if k == 1:
+                nearest = np.argmin(scores, axis=1)[:, np.newaxis]
+            elif k < len(self):
+                nearest = np.argpartition(scores, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.broadcast_to(np.arange(len(self)), scores.shape)
+            nearest_scores = np.take_along_axis(scores, nearest, axis=1)
+            order = np.argsort(nearest_scores, axis=1)
+            indices[chunk] = np.take_along_axis(nearest, order, axis=1)
+            nearest_scores = np.take_along_axis(nearest_scores, order, axis=1)
+            distances[chunk] = (
+                nearest_scores
+                if weight_altitude
+                else dot_to_distance_km(-nearest_scores)
+            )
+        return distances, indices
+
+    def get_nearest_station_ids(
+        self, latitudes, longitudes, altitudes=None, altitude_weight: float = 0.0
+    ) -> np.ndarray:
+        """
+        Get the nearest station of each point.
+        :param latitudes: Latitudes of the points in degrees.
+        :param longitudes: Longitudes of the points in degrees.
+        :param altitudes: Altitudes of the points in m, to weight by altitude difference.
+        :param altitude_weight: km counted per m of altitude difference.
+        :return: Station numbers, one per point.
+        """
+        _, indices = self.query_nearest(
+            latitudes, longitudes, 1, altitudes, altitude_weight
+        )
+        return self.station_ids[indices[:, 0]]
+
+    def query_radius(self, latitudes, longitudes, radius_km: float) -> list:
+        """
+        Get the stations within a radius of each point.
+        :param latitudes: Latitudes of the points in degrees.
+        :param longitudes: Longitudes of the points in degrees.
+        :param radius_km: Radius in km.
+        :return: List of arrays of station indices, one per point, sorted by index.
+        """
+        min_dot = np.cos(min(radius_km / EARTH_RADIUS_KM, np.pi))
+        stations_in_radius = []
+        for chunk, vectors, _ in self._iter_chunks(latitudes, longitudes):
+            rows, columns = np.nonzero(vectors @ self.vectors.T >= min_dot)
+            n_points = len(vectors)
+            stations_in_radius.extend(
+                np.split(columns, np.searchsorted(rows, np.arange(1, n_points)))
+            )
+        return stations_in_radius
+
+    def query_bbox(
+        self, latitude_min, latitude_max, longitude_min, longitude_max
+    ) -> list:
+        """
+        Get the stations within bounding boxes. A box with longitude_min > longitude_max crosses
+        the antimeridian.
+        :param latitude_min: Minimum latitudes of the boxes in degrees.
+        :param latitude_max: Maximum latitudes of the boxes in degrees.
+        :param longitude_min: Minimum longitudes of the boxes in degrees.
+        :param longitude_max: Maximum longitudes of the boxes in degrees.
+        :return: List of arrays of station indices, one per box, sorted by index.
+        """
+        boxes = np.broadcast_arrays(
+            *(
+                np.atleast_1d(np.asarray(bound, dtype=np.float64))[:, np.newaxis]
+                for bound in (latitude_min, latitude_max, longitude_min, longitude_max)
+            )
+        )
+        latitude_min, latitude_max, longitude_min, longitude_max = boxes
+
+        stations_in_boxes = []
+        chunk_size = max(1, self.max_chunk_elements // max(1, len(self)))
+        for start in range(0, len(latitude_min), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            in_latitudes = (self.latitudes >= latitude_min[chunk]) & (
+                self.latitudes <= latitude_max[chunk]
+            )
+            crosses_antimeridian = longitude_min[chunk] > longitude_max[chunk]
+            after_min = self.longitudes >= longitude_min[chunk]
+            before_max = self.longitudes <= longitude_max[chunk]
+            in_longitudes = np.where(
+                crosses_antimeridian, after_min | before_max, after_min & before_max
+            )
+            rows, columns = np.nonzero(in_latitudes & in_longitudes)
+            stations_in_boxes.extend(
+                np.split(
+                    columns, np.searchsorted(rows, np.arange(1, len(in_latitudes)))
+                )
+            )
+        return stations_in_boxes
@@ -1,56 +1,25 @@
+import asyncio
 import csv
 import os
-import requests
 import json
 from typing import List, Dict, Any
 
-from config import BASE_URL, API_KEY
+from api_client import ApiClient
+from geolocalisation.AsyncStationClient import AsyncStationClient
 from logs.logging_config import logger
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_exponential,
-    retry_if_exception_type,
-)
-
-
-@retry(
-    stop=stop_after_attempt(10),
-    wait=wait_exponential(
-        multiplier=1, min=2, max=60
-    ),  # Exponential backoff (2, 4, 8, ... max 60 seconds)
-    retry=retry_if_exception_type(
-        requests.exceptions.RequestException
-    ),  # Retry for request exceptions
-)
+
+
 def get_json_info_stations_departement(num_departement: int) -> bytes:
     """
     Get the JSON output from the API for a specific departement.
     Get information of stations of a specific departement.
     Contains station ids, longitude, latitude, altitude, name, etc.
+    Synchronous wrapper around AsyncStationClient : the response is kept in the response cache.
     :rtype: object
     :param num_departement: The number of the departement.
     :return: JSON response content as bytes.
     """
-    url = (
-        f"{BASE_URL}/public/DPClim/v1/"
-        f"liste-stations/quotidienne?"
-        f"id-departement={num_departement}"
-    )
-
-    headers = {"accept": "*/*", "Authorization": f"Bearer {API_KEY}"}
-    response = requests.get(url, headers=headers)
-
-    if response.status_code == 200:
-        logger.info(
-            f"Successfully retrieved info of stations for departement {num_departement}"
-        )
-        return response.content
-    else:
-        logger.error(
-            f"Failed to retrieve info of stations for departement {num_departement}"
-        )
-        response.raise_for_status()
+    return asyncio.run(AsyncStationClient().get_departement_stations(num_departement))
 
 
 def load_json_from_bytes(json_bytes: bytes) -> List[Dict[str, Any]]:
@@ -75,33 +44,68 @@ def get_open_weather_stations(
     return stations_data
 
 
-def write_open_station_data_to_csv(stations_data: List[Dict[str, Any]], csv_file: str):
+CATALOG_COLUMNS = ["id_station", "name", "longitude", "latitude", "altitude"]
+
+
+def read_stations_catalog(csv_file: str) -> Dict[str, list]:
     """
-    Write station data to a CSV file.
-    :param stations_data: List of dictionaries containing station data.
-    :param csv_file: The name of the CSV file to create or update.
+    Read the rows of the stations CSV file.
+    :param csv_file:
+    :return: Dictionary station id -> row. Empty if the file does not exist.
     """
-    file_exists = os.path.isfile(csv_file)
+    if not os.path.isfile(csv_file):
+        return {}
+    with open(csv_file, mode="r", newline="") as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        return {row[0]: row for row in reader if row}
 
-    with open(csv_file, mode="a", newline="") as file:
-        writer = csv.writer(file)
 
-        if not file_exists:
-            writer.writerow(["id_station", "name", "longitude", "latitude", "altitude"])
+def to_catalog_rows(stations_data: List[Dict[str, Any]]) -> Dict[str, list]:
+    """
+    Get the rows of the open stations, deduplicated by station id.
+    :param stations_data: List of dictionaries containing station data.
+    :return: Dictionary station id -> row.
+    """
+    # Recuperation uniquement des stations ouvertes
+    stations_data = get_open_weather_stations(stations_data)
+    return {
+        str(station["id"]): [
+            station["id"],
+            station["nom"],
+            station["lon"],
+            station["lat"],
+            station["alt"],
+        ]
+        for station in stations_data
+    }
+
+
+def write_stations_catalog(rows: Dict[str, list], csv_file: str):
+    """
+    Write the stations CSV file at once : the file is written next to the catalog and then
+    renamed, so a reader never sees a partial catalog.
+    :param rows: Dictionary station id -> row.
+    :param csv_file:
+    """
+    temporary_file = csv_file + ".tmp"
+    with open(temporary_file, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(CATALOG_COLUMNS)
+        writer.writerows(rows.values())
+    os.replace(temporary_file, csv_file)
 
-        # Recuperation uniquement des stations ouvertes
-        stations_data = get_open_weather_stations(stations_data)
 
-        for station in stations_data:
-            writer.writerow(
-                [
-                    station["id"],
-                    station["nom"],
-                    station["lon"],
-                    station["lat"],
-                    station["alt"],
-                ]
-            )
+def write_open_station_data_to_csv(stations_data: List[Dict[str, Any]], csv_file: str):
+    """
+    Write station data to a CSV file.
+    Stations already in the file are updated instead of being added twice.
+    :param stations_data: List of dictionaries containing station data.
+    :param csv_file: The name of the CSV file to create or update.
+    """
+    rows = read_stations_catalog(csv_file)
+    rows.update(to_catalog_rows(stations_data))
+    write_stations_catalog(rows, csv_file)
 
 
 def create_or_update_csv_with_departement_stations_info(
@@ -127,3 +131,57 @@ def create_or_update_csv_with_departement_stations_info(
             f"Failed to update {csv_file} with departement {num_departement}. Error: {e}"
         )
         raise e
+
+
+async def get_stations_data_departements(
+    departements: list, max_connections: int = 20
+) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Get the information of the stations of several departements concurrently.
+    :param departements: List of departement numbers.
+    :param max_connections: Maximum number of simultaneous requests.
+    :return: Dictionary departement number -> list of stations. Departements in error are skipped.
+    """
+    async with ApiClient(max_connections=max_connections) as client:
+        return await AsyncStationClient(client).get_departements_stations(departements)
+
+
+def create_stations_catalog(
+    departements: list, csv_file: str = "data/stations.csv", max_connections: int = 20
+) -> int:
+    """
+    Create the CSV file of the open stations of several departements.
+    Departements are requested concurrently, within the rate limit of the API, and the file is
+    written once at the end, deduplicated by station id.
+    If some departements fail, the stations already in the file are kept, so a partial crawl does
+    not remove stations from the catalog.
+    :param departements: List of departement numbers.
+    :param csv_file: The name of the CSV file to create.
+    :param max_connections: Maximum number of simultaneous requests.
+    :return: Number of stations in the catalog.
+    """
+    stations_data_departements = asyncio.run(
+        get_stations_data_departements(departements, max_connections)
+    )
+    failed_departements = [
+        num_departement
+        for num_departement in departements
+        if num_departement not in stations_data_departements
+    ]
+
+    rows = {}
+    if failed_departements:
+        logger.warning(
+            f"Stations of departements {failed_departements} could not be retrieved, "
+            f"the stations already in {csv_file} are kept"
+        )
+        rows = read_stations_catalog(csv_file)
+    for stations_data in stations_data_departements.values():
+        rows.update(to_catalog_rows(stations_data))
+
+    write_stations_catalog(rows, csv_file)
+    logger.info(
+        f"{csv_file} written with {len(rows)} stations of "
+        f"{len(stations_data_departements)}/{len(departements)} departements"
+    )
+    return len(rows)
@@ -1,5 +1,5 @@
 from geolocalisation.create_station_geolocalisation_file import (
-    create_or_update_csv_with_departement_stations_info,
+    create_stations_catalog,
 )
 
 list_departements_francais = list(range(1, 96)) + [
@@ -13,7 +13,6 @@ list_departements_francais = list(range(1, 96)) + [
     987,
     988,
 ]
-list_all_departements = []
 
-for num_departement in list_departements_francais:
-    create_or_update_csv_with_departement_stations_info(num_departement)
+# All departements are requested concurrently, data/stations.csv is written once
+create_stations_catalog(list_departements_francais)
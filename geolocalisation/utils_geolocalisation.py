@@ -53,3 +53,21 @@ def from_station_info_to_altitude(station_info: dict) -> float:
     :return:
     """
     return station_info[0]["positions"][-1]["altitude"]
+
+
+def parse_station_info(station_info: dict) -> dict:
+    """
+    Get all the fields of a station from its information, in one pass.
+    :param station_info: Parsed JSON of the information-station endpoint.
+    :return: Dictionary with name, lieuDit, bassin, latitude, longitude and altitude.
+    """
+    info = station_info[0]
+    position = info["positions"][-1]
+    return {
+        "name": info["nom"],
+        "lieuDit": info["lieuDit"],
+        "bassin": info["bassin"],
+        "latitude": position["latitude"],
+        "longitude": position["longitude"],
+        "altitude": position["altitude"],
+    }
@@ -0,0 +1,235 @@
+import os
+import random
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from logs.logging_config import logger
+from histo_schema import apply_histo_schema, normalise_station_id
+from histo_storage import PARQUET_COMPRESSION, PARQUET_ROW_GROUP_SIZE
+
+"""=====================================================================================================
+    Historical data of all stations partitioned by station and year
+    Layout : dataset_path/POSTE=59343001/YEAR=2020/part-0.parquet
+====================================================================================================="""
+
+PARTITIONING_SCHEMA = pa.schema([("POSTE", pa.string()), ("YEAR", pa.int32())])
+
+
+def get_partitioning() -> ds.Partitioning:
+    """
+    Get the partitioning of the dataset : one folder per station, then one folder per year.
+    :return:
+    """
+    return ds.partitioning(PARTITIONING_SCHEMA, flavor="hive")
+
+
+def open_histo_dataset(dataset_path: str, stations: list = None) -> ds.Dataset:
+    """
+    Open a partitioned historical dataset. No data is read.
+    :param dataset_path: Folder of the dataset.
+    :param stations: Station numbers. Only the folders of these stations are listed, so opening
+    the dataset for a few stations does not depend on the number of stations. All stations if
+    None, or if the stations have no partition.
+    :return:
+    """
+    if not os.path.isdir(dataset_path):
+        raise FileNotFoundError(f"Dataset {dataset_path} does not exist.")
+
+    if stations is not None:
+        file_paths = []
+        for station in stations:
+            station_folder = os.path.join(
+                dataset_path, f"POSTE={normalise_station_id(station)}"
+            )
+            for folder, _, files in os.walk(station_folder):
+                file_paths += [
+                    os.path.join(folder, file)
+                    for file in sorted(files)
+                    if file.endswith(".parquet")
+                ]
+        if file_paths:
+            return ds.dataset(
+                file_paths,
+                format="parquet",
+                partitioning=get_partitioning(),
+                partition_base_dir=dataset_path,
+            )
+    return ds.dataset(dataset_path, format="parquet", partitioning=get_partitioning())
+
+
+def read_histo_dataset_columns(dataset_path: str) -> list:
+    """
+    Get the column names of a partitioned historical dataset, without the YEAR partition key.
+    :param dataset_path:
+    :return:
+    """
+    names = open_histo_dataset(dataset_path).schema.names
+    return ["POSTE"] + [name for name in names if name not in ("POSTE", "YEAR")]
+
+
+def add_year_column(table: pa.Table) -> pa.Table:
+    """
+    Add the YEAR partition key, computed from the DATE column.
+    :param table:
+    :return:
+    """
+    years = pc.year(table["DATE"]).cast(pa.int32())
+    if "YEAR" in table.column_names:
+        return table.set_column(table.schema.get_field_index("YEAR"), "YEAR", years)
+    return table.append_column("YEAR", years)
+
+
+def write_histo_dataset(table: pa.Table, dataset_path: str) -> bool:
+    """
+    Write rows to a partitioned historical dataset.
+    The partitions (station, year) of the rows are replaced, other partitions are not touched.
+    :param table: Rows with the POSTE and DATE columns.
+    :param dataset_path: Folder of the dataset.
+    :return:
+    """
+    table = add_year_column(table)
+    file_format = ds.ParquetFileFormat()
+    ds.write_dataset(
+        table,
+        dataset_path,
+        format=file_format,
+        partitioning=get_partitioning(),
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+        file_options=file_format.make_write_options(compression=PARQUET_COMPRESSION),
+        max_rows_per_group=PARQUET_ROW_GROUP_SIZE,
+    )
+    return True
+
+
+def upsert_histo_dataset(df: pd.DataFrame, dataset_path: str) -> bool:
+    """
+    Insert or update rows in a partitioned historical dataset.
+    Only the partitions (station, year) of the rows are read and rewritten. A row replaces the
+    stored row of the same station and date.
+    :param df: Rows with the POSTE and DATE columns. Columns not in the dataset are dropped.
+    :param dataset_path: Folder of the dataset.
+    :return:
+    """
+    if df.empty:
+        return True
+
+    df = apply_histo_schema(df, station_as_category=False)
+    df = df.assign(YEAR=df["DATE"].dt.year.astype("int32"))
+    if os.path.isdir(dataset_path):
+        dataset = open_histo_dataset(dataset_path)
+        schema = dataset.schema
+        partitions = df[["POSTE", "YEAR"]].drop_duplicates()
+        partition_filter = None
+        for poste, year in partitions.itertuples(index=False):
+            expression = (ds.field("POSTE") == normalise_station_id(poste)) & (
+                ds.field("YEAR") == int(year)
+            )
+            partition_filter = (
+                expression
+                if partition_filter is None
+                else partition_filter | expression
+            )
+        stored_df = apply_histo_schema(
+            dataset.to_table(filter=partition_filter).to_pandas(),
+            station_as_category=False,
+        )
+        df = pd.concat([stored_df, df.reindex(columns=schema.names)], ignore_index=True)
+        df = df.drop_duplicates(subset=["POSTE", "DATE"], keep="last")
+        table = pa.Table.from_pandas(
+            df.sort_values(["POSTE", "DATE"]), schema=schema, preserve_index=False
+        )
+    else:
+        table = pa.Table.from_pandas(
+            df.sort_values(["POSTE", "DATE"]), preserve_index=False
+        )
+
+    write_histo_dataset(table, dataset_path)
+    logger.info(f"{len(df)} rows written to the partitions of {dataset_path}")
+    return True
+
+
+def read_histo_dataset(
+    dataset_path: str,
+    stations: list = None,
+    date_start: str = None,
+    date_end: str = None,
+    columns: list = None,
+) -> pd.DataFrame:
+    """
+    Read a partitioned historical dataset.
+    Only the partitions of the requested stations and years are opened, only the requested columns
+    are read, and the row groups outside the date range are skipped.
+    :param dataset_path: Folder of the dataset.
+    :param stations: Station numbers. All stations if None.
+    :param date_start: First date, included. Date str format YYYY-MM-DD.
+    :param date_end: Last date, included. Date str format YYYY-MM-DD.
+    :param columns: Columns to read. All columns if None.
+    :return:
+    """
+    dataset = open_histo_dataset(dataset_path, stations)
+    if columns is None:
+        columns = read_histo_dataset_columns(dataset_path)
+
+    expression = None
+    conditions = []
+    if stations is not None:
+        conditions.append(
+            ds.field("POSTE").isin(
+                [normalise_station_id(station) for station in stations]
+            )
+        )
+    if date_start is not None:
+        date_start = pd.Timestamp(date_start)
+        conditions.append(ds.field("YEAR") >= date_start.year)
+        conditions.append(ds.field("DATE") >= date_start)
+    if date_end is not None:
+        date_end = pd.Timestamp(date_end)
+        conditions.append(ds.field("YEAR") <= date_end.year)
+        conditions.append(ds.field("DATE") <= date_end)
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    return apply_histo_schema(
+        dataset.to_table(columns=columns, filter=expression).to_pandas()
+    )
+
+
+def read_histo_dataset_sample(
+    dataset_path: str, n_rows: int, columns: list = None, seed: int = 0
+) -> pd.DataFrame:
+    """
+    Read a random sample of the partitions of a historical dataset.
+    Partitions (station, year) are drawn at random until they hold n_rows rows, and only these
+    partitions are read : the sample is spread over the stations and years without reading the
+    whole dataset.
+    :param dataset_path: Folder of the dataset.
+    :param n_rows: Minimum number of rows to read, if the dataset has them.
+    :param columns: Columns to read. All columns if None.
+    :param seed: Seed of the random draw, so that the same sample is read each time.
+    :return:
+    """
+    dataset = open_histo_dataset(dataset_path)
+    if columns is None:
+        columns = read_histo_dataset_columns(dataset_path)
+
+    fragments = list(dataset.get_fragments())
+    random.Random(seed).shuffle(fragments)
+    selected_paths = []
+    selected_rows = 0
+    for fragment in fragments:
+        if selected_rows >= n_rows:
+            break
+        selected_paths.append(fragment.path)
+        selected_rows += fragment.metadata.num_rows
+
+    sample = ds.dataset(
+        selected_paths,
+        schema=dataset.schema,
+        format="parquet",
+        partitioning=get_partitioning(),
+        partition_base_dir=dataset_path,
+    )
+    return apply_histo_schema(sample.to_table(columns=columns).to_pandas())
@@ -0,0 +1,173 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from config import PROJECT_ROOT
+from logs.logging_config import logger
+
+"""=====================================================================================================
+    Compact dtypes of the weather variables, from the units of the description file
+====================================================================================================="""
+
+DESCRIPTION_FILE_PATH = PROJECT_ROOT + "/data/description_variables_meteo.csv"
+
+BOOLEAN = "boolean"
+INT8 = "Int8"
+INT16 = "Int16"
+FLOAT32 = "float32"
+
+# Units with integer values by definition. Other units, like DEG C ET 1/10, are float32
+UNIT_DTYPES = {
+    "BOOLEEN": BOOLEAN,
+    "MINUTES": INT16,
+    "HEURES ET MINUTES": INT16,
+    "ROSE DE 360": INT16,
+    "OCTAS": INT8,
+}
+
+INTEGER_RANGES = {
+    INT8: (np.iinfo(np.int8).min, np.iinfo(np.int8).max),
+    INT16: (np.iinfo(np.int16).min, np.iinfo(np.int16).max),
+}
+
+ARROW_TYPES = {BOOLEAN: pa.bool_(), FLOAT32: pa.float32()}
+
+STATION_ID_LENGTH = 8
+
+
+@lru_cache(maxsize=None)
+def get_histo_dtypes(description_file_path: str = DESCRIPTION_FILE_PATH) -> dict:
+    """
+    Get the dtype of every weather variable from its unit in the description file.
+    Variables are found by mnemonic, label, and label with underscores instead of spaces. The
+    quality code Q<mnemonic> of a variable is Int8.
+    :param description_file_path: Path to data/description_variables_meteo.csv
+    :return: Dictionary column name -> pandas dtype.
+    """
+    description_df = pd.read_csv(description_file_path, sep=";")
+    dtypes = {}
+    for mnemonic, label, unit in zip(
+        description_df["Mnémonique"], description_df["Libellé"], description_df["Unité"]
+    ):
+        dtype = UNIT_DTYPES.get(str(unit).strip(), FLOAT32)
+        for name in (mnemonic, label, label.replace(" ", "_")):
+            dtypes[name] = dtype
+        dtypes[f"Q{mnemonic}"] = INT8
+    return dtypes
+
+
+def get_arrow_type(column: str):
+    """
+    Get the Parquet type of a weather variable in the aggregated files.
+    Integer variables are stored as float32 : a value out of the integer range in one station
+    file does not break the aggregation.
+    :param column:
+    :return: The arrow type, None if the column is not a weather variable.
+    """
+    dtype = get_histo_dtypes().get(column)
+    if dtype is None:
+        return None
+    return ARROW_TYPES.get(dtype, pa.float32())
+
+
+def normalise_station_id(num_station) -> str:
+    """
+    Station numbers have 8 digits : 1014002 is the station 01014002.
+    :param num_station:
+    :return:
+    """
+    return str(num_station).strip().zfill(STATION_ID_LENGTH)
+
+
+def normalise_station_ids(values: pd.Series) -> pd.Series:
+    """
+    Station numbers of a POSTE column as 8 digits strings. Numbers read as integers, from the
+    CSV files of the API or from older files, get back their leading zero.
+    :param values:
+    :return: Series of dtype string. Missing values are kept.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = values.cat.categories
+        normalised = normalise_station_ids(
+            pd.Series(categories, dtype=categories.dtype)
+        )
+        return values.map(dict(zip(categories, normalised))).astype("string")
+    if pd.api.types.is_float_dtype(values):
+        values = values.astype("Int64")
+    return values.astype("string").str.strip().str.zfill(STATION_ID_LENGTH)
+
+
+def to_integer_dtype(values: pd.Series, dtype: str) -> pd.Series:
+    """
+    Cast a column to a nullable integer dtype. Values that are not integers, or out of the range
+    of the dtype, keep the column as float32.
+    :param values:
+    :param dtype: INT8 or INT16.
+    :return:
+    """
+    numbers = pd.to_numeric(values, errors="coerce")
+    present = numbers.dropna()
+    low, high = INTEGER_RANGES[dtype]
+    if ((present % 1 == 0) & (present >= low) & (present <= high)).all():
+        return numbers.astype(dtype)
+    logger.warning(f"Column {values.name} does not fit {dtype}, kept as float32")
+    return numbers.astype(FLOAT32)
+
+
+def apply_histo_schema(
+    df: pd.DataFrame, station_as_category: bool = True
+) -> pd.DataFrame:
+    """
+    Cast the columns of a historical data DataFrame to their compact dtype : nullable boolean for
+    occurrences, Int16 or Int8 for integer units, float32 for measures, category for POSTE.
+    Station numbers are kept as 8 digits strings, like the station folders. Columns that are not
+    weather variables are not changed. The DataFrame given is not modified.
+    :param df:
+    :param station_as_category: Cast POSTE to category. Otherwise POSTE is string.
+    :return:
+    """
+    dtypes = get_histo_dtypes()
+    df = df.copy(deep=False)
+    for column in df.columns:
+        values = df[column]
+        if column == "POSTE":
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Only the categories are normalised, not every row
+                categories = normalise_station_ids(pd.Series(values.cat.categories))
+                if categories.is_unique:
+                    values = values.cat.rename_categories(categories.tolist())
+                    df[column] = (
+                        values if station_as_category else values.astype("string")
+                    )
+                    continue
+            values = normalise_station_ids(values)
+            df[column] = values.astype("category") if station_as_category else values
+            continue
+
+        dtype = dtypes.get(column)
+        if dtype is None or values.dtype == dtype:
+            continue
+        if dtype == BOOLEAN:
+            numbers = pd.to_numeric(values, errors="coerce")
+            df[column] = (numbers != 0).astype(BOOLEAN).mask(numbers.isna())
+        elif dtype in INTEGER_RANGES:
+            df[column] = to_integer_dtype(values, dtype)
+        else:
+            df[column] = pd.to_numeric(values, errors="coerce").astype(FLOAT32)
+    return df
+
+
+def to_csv_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Write the occurrences as 0 and 1 in CSV files, like the files of the API.
+    :param df:
+    :return:
+    """
+    boolean_columns = {
+        column: INT8 for column in df.columns if df[column].dtype == BOOLEAN
+    }
+    if not boolean_columns:
+        return df
+    return df.astype(boolean_columns)
@@ -0,0 +1,289 @@
+import os
+import random
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from logs.logging_config import logger
+from histo_schema import apply_histo_schema, to_csv_dtypes
+
+"""=====================================================================================================
+    Storage formats of the historical data files
+====================================================================================================="""
+
+PARQUET = "parquet"
+CSV = "csv"
+
+# Canonical format of the station histo files and of the all stations dataset
+HISTO_FILE_FORMAT = PARQUET
+
+PARQUET_COMPRESSION = "zstd"
+PARQUET_ROW_GROUP_SIZE = 100_000
+
+
+def get_file_format(file_path: str) -> str:
+    """
+    Get the storage format of a file from its extension.
+    :param file_path:
+    :return: PARQUET or CSV.
+    """
+    if file_path.endswith(".parquet"):
+        return PARQUET
+    return CSV
+
+
+def replace_file_format(file_path: str, file_format: str) -> str:
+    """
+    Change the extension of a file path to the extension of a storage format.
+    :param file_path:
+    :param file_format: PARQUET or CSV.
+    :return:
+    """
+    return os.path.splitext(file_path)[0] + f".{file_format}"
+
+
+"""=====================================================================================================
+    Dates
+====================================================================================================="""
+
+
+def parse_histo_dates(dates: pd.Series) -> pd.Series:
+    """
+    Parse the DATE column of a historical data file.
+    Dates can be already parsed, or written as YYYYMMDD or YYYY-MM-DD.
+    :param dates:
+    :return: Series of datetime64. Invalid dates are NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates
+    dates_str = dates.astype(str).str.strip()
+    parsed = pd.to_datetime(dates_str, format="%Y%m%d", errors="coerce")
+    not_parsed = parsed.isna()
+    if not_parsed.any():
+        parsed[not_parsed] = pd.to_datetime(
+            dates_str[not_parsed], format="%Y-%m-%d", errors="coerce"
+        )
+    return parsed
+
+
+"""=====================================================================================================
+    Read and write
+====================================================================================================="""
+
+
+def apply_filters(df: pd.DataFrame, filters: list) -> pd.DataFrame:
+    """
+    Keep the rows matching all the filters.
+    :param df:
+    :param filters: List of (column, operator, value) tuples. Operators: ==, !=, <, <=, >, >=, in.
+    :return:
+    """
+    if not filters:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for column, operator, value in filters:
+        values = df[column]
+        if operator == "in":
+            mask &= values.isin(value)
+        elif operator in ("=", "=="):
+            mask &= values == value
+        elif operator == "!=":
+            mask &= values != value
+        elif operator == "<":
+            mask &= values < value
+        elif operator == "<=":
+            mask &= values <= value
+        elif operator == ">":
+            mask &= values > value
+        elif operator == ">=":
+            mask &= values >= value
+        else:
+            raise ValueError(f"Unknown filter operator: {operator}")
+    return df[mask]
+
+
+def read_histo_file(
+    file_path: str, columns: list = None, filters: list = None
+) -> pd.DataFrame:
+    """
+    Read a historical data file, Parquet or CSV.
+    With Parquet, only the requested columns and the row groups that can match the filters are
+    read from disk. The DATE column is returned as datetime64, the weather variables with their
+    compact dtype.
+    :param file_path:
+    :param columns: Columns to read. All columns if None.
+    :param filters: List of (column, operator, value) tuples, like [("DATE", ">=", date)].
+    :return:
+    """
+    if get_file_format(file_path) == PARQUET:
+        df = pd.read_parquet(
+            file_path, engine="pyarrow", columns=columns, filters=filters or None
+        )
+        return apply_histo_schema(df)
+
+    df = pd.read_csv(file_path, sep=";", decimal=",", usecols=columns)
+    if "DATE" in df.columns:
+        df["DATE"] = parse_histo_dates(df["DATE"])
+    return apply_histo_schema(apply_filters(df, filters))
+
+
+def read_histo_file_sample(
+    file_path: str, n_rows: int, columns: list = None, seed: int = 0
+) -> pd.DataFrame:
+    """
+    Read a random sample of a historical data file.
+    With Parquet, row groups are drawn at random until they hold n_rows rows, and only these row
+    groups are read from disk. A CSV file is read whole, then sampled.
+    :param file_path:
+    :param n_rows: Minimum number of rows to read, if the file has them.
+    :param columns: Columns to read. All columns if None.
+    :param seed: Seed of the random draw, so that the same sample is read each time.
+    :return:
+    """
+    if get_file_format(file_path) != PARQUET:
+        df = read_histo_file(file_path, columns=columns)
+        return df.sample(n=min(n_rows, len(df)), random_state=seed)
+
+    parquet_file = pq.ParquetFile(file_path)
+    row_groups = list(range(parquet_file.num_row_groups))
+    random.Random(seed).shuffle(row_groups)
+    selected_row_groups = []
+    selected_rows = 0
+    for i in row_groups:
+        if selected_rows >= n_rows:
+            break
+        selected_row_groups.append(i)
+        selected_rows += parquet_file.metadata.row_group(i).num_rows
+
+    table = parquet_file.read_row_groups(sorted(selected_row_groups), columns=columns)
+    return apply_histo_schema(table.to_pandas())
+
+
+def write_histo_file(df: pd.DataFrame, file_path: str) -> bool:
+    """
+    Write a historical data file. The format is given by the extension of the file.
+    The weather variables are written with their compact dtype. The Parquet file is written to a temporary file first, then renamed.
+    :param df:
+    :param file_path:
+    :return:
+    """
+    df = apply_histo_schema(df, station_as_category=False)
+    temporary_path = file_path + ".tmp"
+    if get_file_format(file_path) == PARQUET:
+        df.to_parquet(
+            temporary_path,
+            engine="pyarrow",
+            index=False,
+            compression=PARQUET_COMPRESSION,
+            row_group_size=PARQUET_ROW_GROUP_SIZE,
+        )
+    else:
+        to_csv_dtypes(df).to_csv(temporary_path, sep=";", decimal=",", index=False)
+    os.replace(temporary_path, file_path)
+    return True
+
+
+def read_histo_columns(file_path: str) -> list:
+    """
+    Get the column names of a historical data file without reading its data.
+    :param file_path:
+    :return:
+    """
+    if get_file_format(file_path) == PARQUET:
+        return pq.read_schema(file_path).names
+    with open(file_path, "r") as file:
+        return file.readline().rstrip("\r\n").split(";")
+
+
+def read_last_histo_date(file_path: str):
+    """
+    Get the last DATE stored in a historical data file.
+    With Parquet, the date is read from the statistics of the row groups, without reading data.
+    :param file_path:
+    :return: Timestamp, None if the file has no date.
+    """
+    if get_file_format(file_path) == PARQUET:
+        metadata = pq.ParquetFile(file_path).metadata
+        if "DATE" in metadata.schema.names:
+            date_index = metadata.schema.names.index("DATE")
+            last_dates = []
+            for i in range(metadata.num_row_groups):
+                statistics = metadata.row_group(i).column(date_index).statistics
+                if statistics is None or not statistics.has_min_max:
+                    last_dates = None
+                    break
+                last_dates.append(pd.Timestamp(statistics.max))
+            if last_dates is not None:
+                return max(last_dates) if last_dates else None
+
+    dates = read_histo_file(file_path, columns=["DATE"])["DATE"].dropna()
+    return dates.max() if not dates.empty else None
+
+
+def append_histo_file(df: pd.DataFrame, file_path: str) -> bool:
+    """
+    Append rows to a historical data file. The rows are conformed to the columns of the file :
+    missing columns are empty, other columns are dropped.
+    A CSV file is appended in place. A Parquet file cannot be appended in place : its row groups
+    are copied one at a time to a new file followed by the new rows, so the existing data is
+    never loaded at once nor converted to pandas.
+    :param df:
+    :param file_path:
+    :return:
+    """
+    if not os.path.isfile(file_path):
+        return write_histo_file(df, file_path)
+
+    columns = read_histo_columns(file_path)
+    dropped_columns = [column for column in df.columns if column not in columns]
+    if dropped_columns:
+        logger.warning(
+            f"Columns {dropped_columns} are not in {file_path} and are not appended"
+        )
+    df = apply_histo_schema(df.reindex(columns=columns), station_as_category=False)
+
+    if get_file_format(file_path) != PARQUET:
+        to_csv_dtypes(df).to_csv(
+            file_path, sep=";", decimal=",", index=False, header=False, mode="a"
+        )
+        return True
+
+    parquet_file = pq.ParquetFile(file_path)
+    schema = parquet_file.schema_arrow
+    temporary_path = file_path + ".tmp"
+    with pq.ParquetWriter(
+        temporary_path, schema, compression=PARQUET_COMPRESSION
+    ) as writer:
+        for i in range(parquet_file.num_row_groups):
+            writer.write_table(parquet_file.read_row_group(i))
+        writer.write_table(
+            pa.Table.from_pandas(df, schema=schema, preserve_index=False),
+            row_group_size=PARQUET_ROW_GROUP_SIZE,
+        )
+    os.replace(temporary_path, file_path)
+    return True
+
+
+def convert_histo_file(input_file_path: str, output_file_path: str) -> bool:
+    """
+    Convert a historical data file to the format of the output file (Parquet or CSV export).
+    :param input_file_path:
+    :param output_file_path:
+    :return:
+    """
+    write_histo_file(read_histo_file(input_file_path), output_file_path)
+    logger.info(f"File {input_file_path} converted to {output_file_path}")
+    return True
+
+
+def export_histo_file_to_csv(file_path: str, csv_file_path: str = None) -> str:
+    """
+    Export a historical data file to CSV.
+    :param file_path:
+    :param csv_file_path: Output path. Default is the same path with the .csv extension.
+    :return: Path of the CSV file.
+    """
+    if csv_file_path is None:
+        csv_file_path = replace_file_format(file_path, CSV)
+    convert_histo_file(file_path, csv_file_path)
+    return csv_file_path
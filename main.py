@@ -1,14 +1,26 @@
 from config import PROJECT_ROOT
-from create_meteo_data_histo import get_existing_station_files, aggregate_station_files
+from create_meteo_data_histo import (
+    get_existing_station_files,
+    aggregate_station_files,
+    aggregate_station_files_to_dataset,
+)
 from create_station_meteo_data_histo import (
     download_histo_per_station,
     verify_files_histo_all_exist,
     aggregate_histo_data,
     verify_data_quality_in_histo_files,
     delete_yearly_files,
+    update_stations_histo,
 )
+from histo_storage import export_histo_file_to_csv
+from column_pipeline import ColumnPipeline, load_mnemonic_to_label_mapping
 from manage_meteo_data import rename_columns_stations_histo_file
-from utils import filter_columns_histo_file, delete_space_in_colnames_file
+from utils import (
+    get_all_stations_histo_dataset_path,
+    get_all_stations_histo_file_path,
+    get_correlation_matrices_file_path,
+)
+from visualisation.correlation_stats import compute_correlation_matrices
 
 """=====================================================================================================
     Create weather histo file of a given station
@@ -28,16 +40,38 @@ from utils import filter_columns_histo_file, delete_space_in_colnames_file
 # # Finish
 # delete_yearly_files(num_station)
 
+# Many stations at once, on every core : python station_batch_runner.py --departements 38 59
+
+"""=====================================================================================================
+    Nightly incremental update : only the days after the last stored date are downloaded
+===================================================================================================="""
+
+# stations = [num_station]
+# update_stations_histo(stations)
+
 """=====================================================================================================
     Create full histo file : Aggregate weather histo files of all stations
 ===================================================================================================="""
 
 root_directory = PROJECT_ROOT + "/data_meteo_histo/"
-output_file = PROJECT_ROOT + "/data_meteo_histo/stations_weather_data_histo.csv"
+output_file = get_all_stations_histo_file_path()
 
 station_files = get_existing_station_files(root_directory)
 aggregate_station_files(station_files, output_file)
-rename_columns_stations_histo_file()
+
+# Same data partitioned by station and year, columns named with the labels of the description file
+aggregate_station_files_to_dataset(
+    station_files,
+    get_all_stations_histo_dataset_path(),
+    column_mapping=load_mnemonic_to_label_mapping(
+        "data/description_variables_meteo.csv"
+    ),
+)
+
+# Correlation statistics of the visualisation app
+compute_correlation_matrices(
+    get_all_stations_histo_dataset_path(), get_correlation_matrices_file_path()
+)
 
 
 """=====================================================================================================
@@ -74,14 +108,19 @@ columns_to_keep_in_histo_file = [
     "HAUTEUR DE NEIGE TOMBEE EN 24H",
 ]
 
-input_histo_file = PROJECT_ROOT + "/data_meteo_histo/stations_weather_data_histo.csv"
-output_histo_file = (
-    PROJECT_ROOT + "/data_meteo_histo/stations_weather_data_histo_col_filtered.csv"
-)
-
+input_histo_file = get_all_stations_histo_file_path()
+output_histo_file = get_all_stations_histo_file_path(suffix="_col_filtered")
 
-filter_columns_histo_file(
-    input_histo_file, output_histo_file, columns_to_keep_in_histo_file
+# Rename, filter and normalise the column names in a single pass over the file.
+# Only the columns to keep are read.
+ColumnPipeline().rename_using_description_file(
+    "data/description_variables_meteo.csv"
+).select(columns_to_keep_in_histo_file).normalise_names(" ", "_").run(
+    input_histo_file, output_histo_file
 )
 
-delete_space_in_colnames_file(output_histo_file)
+# Labels in the all stations file, read by the visualisation app
+rename_columns_stations_histo_file()
+
+# Optional CSV export of the filtered histo file
+# export_histo_file_to_csv(output_histo_file)
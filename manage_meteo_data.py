@@ -1,4 +1,4 @@
-from utils import rename_columns_using_mapping
+from utils import rename_columns_using_mapping, get_all_stations_histo_file_path
 from logs.logging_config import logger
 
 
@@ -8,7 +8,7 @@ def rename_columns_stations_histo_file() -> bool:
     :return:
     """
     description_file_path = f"data/description_variables_meteo.csv"
-    histo_file_path = f"data_meteo_histo/stations_weather_data_histo.csv"
+    histo_file_path = get_all_stations_histo_file_path()
     rename_columns_using_mapping(description_file_path, histo_file_path)
 
     logger.info(f"Columns renamed in the stations weather data historical file.")
@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+from config import PROJECT_ROOT
+from utils import extract_date
+from logs.logging_config import logger
+
+# Latencies learned by the previous runs
+DEFAULT_HISTORY_PATH = PROJECT_ROOT + "/data/polling_latencies.json"
+
+# Upper bounds (in days) of the date range lengths whose production latencies are learned apart
+RANGE_DAYS_BUCKETS = [1, 7, 31, 92, 183, 366]
+
+
+class AdaptivePollingStrategy:
+    """
+    Polling delays of the commande/fichier endpoint learned from the observed production latencies.
+    Latencies are recorded per date range length bucket. The first poll is sent when half of the
+    past orders of the same bucket were ready, then delays grow exponentially from min_interval.
+    Without history, polling starts at min_interval and backs off.
+    A file is only known to be ready between the last poll answered 204 and the first poll
+    answered 201 : the recorded latency is the middle of this interval, so that the estimate
+    goes down when the server produces the files faster.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 1,
+        max_interval: float = 60,
+        backoff: float = 1.5,
+        max_history: int = 200,
+        history_file: str = None,
+    ):
+        """
+
+        :param min_interval: Shortest delay between two polls in seconds.
+        :param max_interval: Longest delay between two polls in seconds.
+        :param backoff: Growth factor of the delay after each poll.
+        :param max_history: Number of latencies kept per bucket.
+        :param history_file: JSON file where the latencies are saved between runs. Not saved if
+        None.
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_history = max_history
+        self.history_file = history_file
+        self._lock = threading.Lock()
+        self.latencies = {}
+
+        if history_file is not None and os.path.isfile(history_file):
+            try:
+                with open(history_file, "r") as file:
+                    self.latencies = {int(k): v for k, v in json.load(file).items()}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Polling history {history_file} not loaded: {e}")
+
+    @staticmethod
+    def get_range_days(date_start: str, date_end: str) -> int:
+        """
+        Get the number of days of a date range.
+        :param date_start: Date ISO format.
+        :param date_end: Date ISO format.
+        :return:
+        """
+        start = datetime.strptime(extract_date(date_start), "%Y-%m-%d")
+        end = datetime.strptime(extract_date(date_end), "%Y-%m-%d")
+        return (end - start).days + 1
+
+    @staticmethod
+    def get_bucket(range_days: int) -> int:
+        """
+        Get the bucket of a date range length.
+        :param range_days:
+        :return: Upper bound in days of the bucket.
+        """
+        for bucket in RANGE_DAYS_BUCKETS:
+            if range_days <= bucket:
+                return bucket
+        return RANGE_DAYS_BUCKETS[-1]
+
+    @staticmethod
+    def _percentile(values: list, q: float) -> float:
+        values = sorted(values)
+        index = min(len(values) - 1, int(q * len(values)))
+        return values[index]
+
+    def expected_latency(self, range_days: int):
+        """
+        Get the median production latency observed for a date range length.
+        :param range_days:
+        :return: Latency in seconds, None if nothing was observed yet.
+        """
+        with self._lock:
+            latencies = self.latencies.get(self.get_bucket(range_days))
+            if not latencies:
+                return None
+            return self._percentile(latencies, 0.5)
+
+    def next_delay(self, range_days: int, elapsed: float, attempt: int) -> float:
+        """
+        Get the delay before the next poll of an order.
+        :param range_days: Number of days of the ordered date range.
+        :param elapsed: Seconds since the order was accepted.
+        :param attempt: Number of polls already sent for the order.
+        :return: Delay in seconds.
+        """
+        expected = self.expected_latency(range_days)
+        if expected is not None and elapsed < expected:
+            delay = expected - elapsed
+        else:
+            delay = self.min_interval * self.backoff**attempt
+        return max(self.min_interval, min(delay, self.max_interval))
+
+    def record_ready(self, range_days: int, last_pending: float, first_ready: float):
+        """
+        Record the production latency of an order from the polls that bound it.
+        :param range_days: Number of days of the ordered date range.
+        :param last_pending: Seconds between the order and the last poll answered 204. 0 if the
+        first poll found the file ready.
+        :param first_ready: Seconds between the order and the first poll answered 201.
+        :return:
+        """
+        self.record_latency(range_days, (last_pending + first_ready) / 2)
+
+    def record_latency(self, range_days: int, latency: float):
+        """
+        Record the production latency of an order.
+        :param range_days: Number of days of the ordered date range.
+        :param latency: Seconds between the order and the file being ready.
+        :return:
+        """
+        bucket = self.get_bucket(range_days)
+        with self._lock:
+            latencies = self.latencies.setdefault(bucket, [])
+            latencies.append(latency)
+            del latencies[: -self.max_history]
+
+            if self.history_file is not None:
+                self._save_history()
+
+        logger.info(
+            f"Production latency {latency:.1f} s recorded for a {range_days} days order"
+        )
+
+    def _save_history(self):
+        """
+        Save the latencies to the history file. Written to a temporary file first, so that a
+        reader never sees a partial file. A failed save does not stop the download.
+        :return:
+        """
+        temporary_path = f"{self.history_file}.{os.getpid()}.tmp"
+        try:
+            with open(temporary_path, "w") as file:
+                json.dump(self.latencies, file)
+            os.replace(temporary_path, self.history_file)
+        except OSError as e:
+            logger.warning(f"Polling history not saved to {self.history_file}: {e}")
+
+    def get_latency_stats(self) -> dict:
+        """
+        Get the distribution of the observed latencies per date range length bucket.
+        :return: Dictionary bucket -> count, p50, p90 and max latency in seconds.
+        """
+        with self._lock:
+            return {
+                bucket: {
+                    "count": len(latencies),
+                    "p50": self._percentile(latencies, 0.5),
+                    "p90": self._percentile(latencies, 0.9),
+                    "max": max(latencies),
+                }
+                for bucket, latencies in sorted(self.latencies.items())
+                if latencies
+            }
+
+
+_polling_strategy = AdaptivePollingStrategy(history_file=DEFAULT_HISTORY_PATH)
+
+
+def get_polling_strategy() -> AdaptivePollingStrategy:
+    """
+    Get the polling strategy shared by all the downloaders of the process.
+    :return:
+    """
+    return _polling_strategy
@@ -0,0 +1,293 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from logs.logging_config import logger
+
+# Quota of the Météo-France public API : 50 requests per minute
+DEFAULT_MAX_REQUESTS_PER_MINUTE = 50
+DEFAULT_BURST = 5
+
+"""=====================================================================================================
+    Token bucket
+====================================================================================================="""
+
+
+class TokenBucketRateLimiter:
+    """
+    Token bucket limiting the aggregate request rate of the process.
+    Tokens are refilled at max_requests_per_minute / 60 per second, up to burst tokens.
+    A request reserves one token and waits for the debt if the bucket is empty, so waiting
+    requests are served in order without busy loops.
+    A 429 response blocks every request until its Retry-After delay has passed. Tokens are not
+    refilled during the block, and requests already waiting for their token are pushed after the
+    block in the same order.
+    """
+
+    def __init__(
+        self,
+        max_requests_per_minute: float = DEFAULT_MAX_REQUESTS_PER_MINUTE,
+        burst: int = DEFAULT_BURST,
+    ):
+        """
+
+        :param max_requests_per_minute: Maximum sustained number of requests in 60 seconds.
+        :param burst: Maximum number of requests sent at once after an idle period.
+        """
+        self.rate = max_requests_per_minute / 60
+        self.capacity = burst
+        self._lock = threading.Lock()
+        self.state = {
+            "tokens": float(burst),
+            "updated_at": self.clock(),
+            "blocked_at": 0.0,
+            "blocked_until": 0.0,
+        }
+
+        # Counters
+        self.requests_count = 0
+        self.throttled_count = 0
+        self.throttled_time = 0.0
+        self.too_many_requests_count = 0
+
+    def clock(self) -> float:
+        return time.monotonic()
+
+    @contextmanager
+    def _shared_state(self):
+        """
+        Give exclusive access to the bucket state.
+        :return:
+        """
+        with self._lock:
+            yield self.state
+
+    def _refill(self, state: dict, now: float):
+        """
+        Add the tokens earned since the last update. During a block, updated_at is the end of
+        the block and no token is earned.
+        :param state:
+        :param now:
+        :return:
+        """
+        if now <= state["updated_at"]:
+            return
+        elapsed = now - state["updated_at"]
+        state["tokens"] = min(self.capacity, state["tokens"] + elapsed * self.rate)
+        state["updated_at"] = now
+
+    def reserve(self) -> float:
+        """
+        Reserve one token for a request.
+        :return: Number of seconds to wait before sending the request.
+        """
+        with self._shared_state() as state:
+            now = self.clock()
+            self._refill(state, now)
+            state["tokens"] -= 1
+            # The debt is paid from updated_at, which is the end of the block during a block
+            wait = max(state["updated_at"] - now, 0.0)
+            if state["tokens"] < 0:
+                wait += -state["tokens"] / self.rate
+
+        with self._lock:
+            self.requests_count += 1
+            if wait > 0:
+                self.throttled_count += 1
+                self.throttled_time += wait
+        return wait
+
+    def get_block_delay(self, reserved_at: float, send_at: float) -> float:
+        """
+        Get the extra wait of a reserved request whose send time falls in a block started after
+        its reservation. The request keeps its place in the queue : it is sent after the block,
+        as long after the block end as it was after the block start.
+        :param reserved_at: Time of the reservation, from clock().
+        :param send_at: Time the request was going to be sent, from clock().
+        :return: Number of seconds to wait before sending the request.
+        """
+        with self._shared_state() as state:
+            now = self.clock()
+            blocked_at = state.get("blocked_at", 0.0)
+            blocked_until = state["blocked_until"]
+        if blocked_at <= reserved_at or now >= blocked_until:
+            return 0.0
+        return blocked_until + max(0.0, send_at - blocked_at) - now
+
+    def acquire(self):
+        """
+        Block the thread until a request can be sent.
+        :return:
+        """
+        reserved_at = self.clock()
+        wait = self.reserve()
+        while wait > 0:
+            time.sleep(wait)
+            # A 429 received while waiting also delays the requests already reserved
+            send_at = reserved_at + wait
+            wait = self.get_block_delay(reserved_at, send_at)
+            reserved_at = send_at
+
+    async def acquire_async(self):
+        """
+        Wait without blocking the event loop until a request can be sent.
+        :return:
+        """
+        reserved_at = self.clock()
+        wait = self.reserve()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            # A 429 received while waiting also delays the requests already reserved
+            send_at = reserved_at + wait
+            wait = self.get_block_delay(reserved_at, send_at)
+            reserved_at = send_at
+
+    def block(self, delay: float):
+        """
+        Block every request for delay seconds, after a 429 response.
+        The bucket is emptied so that requests do not burst when the block ends, and the debt of
+        the requests already reserved is paid after the block.
+        :param delay: Number of seconds to wait.
+        :return:
+        """
+        with self._shared_state() as state:
+            now = self.clock()
+            self._refill(state, now)
+            state["blocked_at"] = now
+            state["blocked_until"] = max(state["blocked_until"], now + delay)
+            state["tokens"] = min(state["tokens"], 0.0)
+            state["updated_at"] = state["blocked_until"]
+
+        with self._lock:
+            self.too_many_requests_count += 1
+        logger.warning(f"API quota reached. Requests paused for {delay:.1f} s")
+
+    def get_stats(self) -> dict:
+        """
+        Get the counters of the rate limiter.
+        :return:
+        """
+        with self._lock:
+            return {
+                "requests": self.requests_count,
+                "throttled_requests": self.throttled_count,
+                "throttled_time": self.throttled_time,
+                "too_many_requests": self.too_many_requests_count,
+            }
+
+
+class FileTokenBucketRateLimiter(TokenBucketRateLimiter):
+    """
+    Token bucket whose state is stored in a file, so that several processes share the same quota.
+    Access to the file is serialised with an exclusive lock (fcntl, POSIX only).
+    """
+
+    def __init__(
+        self,
+        state_file: str,
+        max_requests_per_minute: float = DEFAULT_MAX_REQUESTS_PER_MINUTE,
+        burst: int = DEFAULT_BURST,
+    ):
+        """
+
+        :param state_file: Path of the file holding the shared bucket state.
+        :param max_requests_per_minute: Maximum sustained number of requests in 60 seconds.
+        :param burst: Maximum number of requests sent at once after an idle period.
+        """
+        import fcntl
+
+        self._fcntl = fcntl
+        self.state_file = state_file
+        super().__init__(max_requests_per_minute, burst)
+
+    def clock(self) -> float:
+        # Wall clock, shared by all processes
+        return time.time()
+
+    @contextmanager
+    def _shared_state(self):
+        """
+        Give exclusive access to the bucket state stored in the file.
+        :return:
+        """
+        with self._lock, open(self.state_file, "a+") as file:
+            self._fcntl.flock(file, self._fcntl.LOCK_EX)
+            try:
+                file.seek(0)
+                content = file.read()
+                state = json.loads(content) if content else dict(self.state)
+                yield state
+                file.seek(0)
+                file.truncate()
+                file.write(json.dumps(state))
+                file.flush()
+                os.fsync(file.fileno())
+            finally:
+                self._fcntl.flock(file, self._fcntl.LOCK_UN)
+
+
+"""=====================================================================================================
+    Process-wide rate limiter
+====================================================================================================="""
+
+_rate_limiter = TokenBucketRateLimiter()
+
+
+def get_rate_limiter() -> TokenBucketRateLimiter:
+    """
+    Get the rate limiter shared by all the calls to the API.
+    :return:
+    """
+    return _rate_limiter
+
+
+def configure_rate_limiter(
+    max_requests_per_minute: float = DEFAULT_MAX_REQUESTS_PER_MINUTE,
+    burst: int = DEFAULT_BURST,
+    state_file: str = None,
+) -> TokenBucketRateLimiter:
+    """
+    Replace the rate limiter shared by all the calls to the API.
+    :param max_requests_per_minute: Maximum sustained number of requests in 60 seconds.
+    :param burst: Maximum number of requests sent at once after an idle period.
+    :param state_file: If given, the quota is shared with the other processes using the same file.
+    :return:
+    """
+    global _rate_limiter
+    if state_file is None:
+        _rate_limiter = TokenBucketRateLimiter(max_requests_per_minute, burst)
+    else:
+        _rate_limiter = FileTokenBucketRateLimiter(
+            state_file, max_requests_per_minute, burst
+        )
+    return _rate_limiter
+
+
+"""=====================================================================================================
+    Retry-After
+====================================================================================================="""
+
+
+def parse_retry_after(value: str, default: float = 60) -> float:
+    """
+    Get the delay in seconds of a Retry-After header.
+    The header holds either a number of seconds or an HTTP date.
+    :param value: Value of the Retry-After header. Can be None.
+    :param default: Delay used when the header is missing or invalid.
+    :return:
+    """
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_date = parsedate_to_datetime(value)
+        return max(0.0, retry_date.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,301 @@
+import json
+import sqlite3
+import threading
+import time
+
+from config import PROJECT_ROOT
+from logs.logging_config import logger
+
+DEFAULT_CACHE_PATH = PROJECT_ROOT + "/data/response_cache.db"
+
+# Station metadata rarely changes : cached responses are used for 1 day before revalidation
+DEFAULT_TTL = 24 * 3600
+
+# Maximum total size of the cached contents, the least recently used are evicted
+DEFAULT_MAX_SIZE_BYTES = 100 * 1024 * 1024
+
+# Headers kept with a cached response, by lower case name
+KEPT_HEADERS = {
+    "etag": "ETag",
+    "last-modified": "Last-Modified",
+    "content-type": "Content-Type",
+}
+
+
+class CacheMissError(Exception):
+    """
+    Error raised in offline mode when a response is not in the cache.
+    """
+
+    def __init__(self, url: str):
+        """
+
+        :param url: Requested URL.
+        """
+        super().__init__(f"Offline mode: no cached response for url: {url}")
+        self.url = url
+
+
+class CachedResponse:
+    """
+    Response stored in the cache, with its validators.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        status_code: int,
+        content: bytes,
+        headers: dict,
+        stored_at: float,
+        expires_at: float,
+    ):
+        """
+
+        :param url: Requested URL.
+        :param status_code: HTTP status code.
+        :param content: Response content.
+        :param headers: Response headers.
+        :param stored_at: Time the response was received or last revalidated.
+        :param expires_at: Time after which the response must be revalidated.
+        """
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+
+    def __repr__(self):
+        return (
+            f"CachedResponse(url={self.url}, status_code={self.status_code}, "
+            f"size={len(self.content)}, is_fresh={self.is_fresh})"
+        )
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def get_validator_headers(self) -> dict:
+        """
+        Get the headers of a conditional request : the server answers 304 Not Modified if the
+        cached response is still valid.
+        :return:
+        """
+        validator_headers = {}
+        if "ETag" in self.headers:
+            validator_headers["If-None-Match"] = self.headers["ETag"]
+        if "Last-Modified" in self.headers:
+            validator_headers["If-Modified-Since"] = self.headers["Last-Modified"]
+        return validator_headers
+
+
+class ResponseCache:
+    """
+    On-disk cache of API responses, stored in SQLite and keyed by URL.
+    A response is used without request until its TTL is over, then revalidated with its ETag or
+    Last-Modified date when the server gave one. The total size of the cache is bounded : the
+    least recently used responses are evicted.
+    In offline mode, cached responses are used whatever their age and no request is sent.
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_CACHE_PATH,
+        max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES,
+        offline: bool = False,
+    ):
+        """
+
+        :param db_path: Path of the SQLite database file.
+        :param max_size_bytes: Maximum total size of the cached contents.
+        :param offline: Never send requests, use the cached responses only.
+        """
+        self.db_path = db_path
+        self.max_size_bytes = max_size_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    status_code INTEGER NOT NULL,
+                    content BLOB NOT NULL,
+                    headers TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    stored_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+                "ON responses (accessed_at)"
+            )
+
+        # Counters
+        self.hits_count = 0
+        self.revalidated_count = 0
+        self.misses_count = 0
+
+    def __repr__(self):
+        return (
+            f"ResponseCache(db_path={self.db_path}, offline={self.offline}, "
+            f"hits={self.hits_count}, revalidated={self.revalidated_count}, "
+            f"misses={self.misses_count})"
+        )
+
+    def close(self):
+        self.connection.close()
+
+    def _execute(self, query: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        with self._lock, self.connection:
+            return self.connection.execute(query, parameters)
+
+    def get(self, url: str):
+        """
+        Get the cached response of a URL, fresh or not.
+        :param url:
+        :return: CachedResponse, None if the URL is not cached.
+        """
+        row = self._execute("SELECT * FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        self._execute(
+            "UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), url)
+        )
+        return CachedResponse(
+            row["url"],
+            row["status_code"],
+            row["content"],
+            json.loads(row["headers"]),
+            row["stored_at"],
+            row["expires_at"],
+        )
+
+    def put(
+        self,
+        url: str,
+        status_code: int,
+        content: bytes,
+        headers: dict,
+        ttl: float = DEFAULT_TTL,
+    ) -> CachedResponse:
+        """
+        Store the response of a URL, then evict the least recently used responses over the
+        maximum size.
+        :param url:
+        :param status_code:
+        :param content:
+        :param headers: Response headers. Only the validators and the content type are kept.
+        :param ttl: Seconds during which the response is used without request.
+        :return:
+        """
+        headers = {
+            KEPT_HEADERS[key.lower()]: value
+            for key, value in headers.items()
+            if key.lower() in KEPT_HEADERS
+        }
+        now = time.time()
+        self._execute(
+            """
+            INSERT OR REPLACE INTO responses
+                (url, status_code, content, headers, size, stored_at, expires_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                url,
+                status_code,
+                content,
+                json.dumps(headers),
+                len(content),
+                now,
+                now + ttl,
+                now,
+            ),
+        )
+        self.evict()
+        return CachedResponse(url, status_code, content, headers, now, now + ttl)
+
+    def refresh(self, url: str, ttl: float = DEFAULT_TTL):
+        """
+        Extend the TTL of a cached response revalidated by the server.
+        :param url:
+        :param ttl: Seconds during which the response is used without request.
+        :return:
+        """
+        now = time.time()
+        self._execute(
+            "UPDATE responses SET stored_at = ?, expires_at = ? WHERE url = ?",
+            (now, now + ttl, url),
+        )
+
+    def evict(self) -> int:
+        """
+        Delete the least recently used responses until the cache fits its maximum size.
+        :return: Number of deleted responses.
+        """
+        total_size = self._execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return 0
+
+        urls = []
+        for row in self._execute(
+            "SELECT url, size FROM responses ORDER BY accessed_at"
+        ).fetchall():
+            if total_size <= self.max_size_bytes:
+                break
+            urls.append(row["url"])
+            total_size -= row["size"]
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM responses WHERE url = ?", [(url,) for url in urls]
+            )
+        logger.info(f"{len(urls)} responses evicted from the response cache")
+        return len(urls)
+
+    def delete(self, url: str):
+        self._execute("DELETE FROM responses WHERE url = ?", (url,))
+
+    def clear(self):
+        self._execute("DELETE FROM responses")
+
+
+_response_cache = None
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Get the response cache shared by the API calls of the process. Opened on first use.
+    :return:
+    """
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
+
+
+def configure_response_cache(
+    db_path: str = DEFAULT_CACHE_PATH,
+    max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES,
+    offline: bool = False,
+) -> ResponseCache:
+    """
+    Replace the response cache shared by the API calls of the process.
+    :param db_path: Path of the SQLite database file.
+    :param max_size_bytes: Maximum total size of the cached contents.
+    :param offline: Never send requests, use the cached responses only.
+    :return:
+    """
+    global _response_cache
+    if _response_cache is not None:
+        _response_cache.close()
+    _response_cache = ResponseCache(db_path, max_size_bytes, offline)
+    return _response_cache
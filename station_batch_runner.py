@@ -0,0 +1,345 @@
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from config import PROJECT_ROOT
+from logs.logging_config import logger
+from create_station_meteo_data_histo import (
+    aggregate_histo_data,
+    delete_yearly_files,
+    verify_data_quality_in_histo_files,
+)
+from date_range_planner import DEFAULT_PERIOD_START, plan_station_order_windows
+from download_ledger import get_download_ledger
+from download_scheduler import DownloadScheduler
+from rate_limiter import configure_rate_limiter
+
+"""=====================================================================================================
+    Batch creation of the weather histo files of many stations
+    The downloads of all stations run in one event loop. As soon as all the files of a station are
+    downloaded, its aggregation and quality check run in a process pool.
+    python station_batch_runner.py --departements 38 59 --workers 8
+===================================================================================================="""
+
+STATIONS_FILE_PATH = PROJECT_ROOT + "/data/stations.csv"
+
+# Bucket state shared by the processes, so that the quota of the API is respected by all of them
+RATE_LIMITER_STATE_FILE = PROJECT_ROOT + "/data/rate_limiter_state.json"
+
+# Overseas departements have 3 digits : 971, 972, ..., 988
+OVERSEAS_DEPARTEMENT_PREFIXES = ("97", "98")
+
+
+def get_station_departement(num_station: str) -> int:
+    """
+    Get the departement of a station from its number : 38524001 is in the departement 38.
+    :param num_station: Station number, 8 digits.
+    :return:
+    """
+    num_station = str(num_station).zfill(8)
+    if num_station.startswith(OVERSEAS_DEPARTEMENT_PREFIXES):
+        return int(num_station[:3])
+    return int(num_station[:2])
+
+
+def filter_stations_by_departement(stations: list, departements: list) -> list:
+    """
+    Keep the stations of some departements.
+    :param stations: List of station numbers.
+    :param departements: List of departement numbers.
+    :return:
+    """
+    departements = {int(departement) for departement in departements}
+    return [
+        num_station
+        for num_station in stations
+        if get_station_departement(num_station) in departements
+    ]
+
+
+def load_station_ids(
+    stations_file: str = STATIONS_FILE_PATH, departements: list = None
+) -> list:
+    """
+    Get the station numbers of the stations file written by the geolocalisation module.
+    :param stations_file: CSV file with an id_station column.
+    :param departements: Optional list of departement numbers to keep.
+    :return: Unique station numbers, in the order of the file.
+    """
+    station_ids = pd.read_csv(stations_file, usecols=["id_station"], dtype=str)
+    station_ids = station_ids["id_station"].dropna().str.strip().str.zfill(8)
+    station_ids = list(dict.fromkeys(station_ids))
+
+    if departements:
+        station_ids = filter_stations_by_departement(station_ids, departements)
+    return station_ids
+
+
+class StationResult:
+    """
+    Outcome of the creation of the histo file of a station.
+    """
+
+    def __init__(
+        self,
+        num_station: str,
+        downloaded: bool = False,
+        aggregated: bool = False,
+        quality_ok: bool = False,
+        error: str = None,
+        duration: float = 0.0,
+    ):
+        """
+
+        :param num_station:
+        :param downloaded: All the files of the station are downloaded.
+        :param aggregated: The station histo file is written.
+        :param quality_ok: No duplicated or missing dates in the station histo file.
+        :param error: Message of the error that stopped the station, if any.
+        :param duration: Seconds spent in the aggregation and quality check.
+        """
+        self.num_station = num_station
+        self.downloaded = downloaded
+        self.aggregated = aggregated
+        self.quality_ok = quality_ok
+        self.error = error
+        self.duration = duration
+
+    def __repr__(self):
+        return (
+            f"StationResult(num_station={self.num_station}, "
+            f"downloaded={self.downloaded}, "
+            f"aggregated={self.aggregated}, "
+            f"quality_ok={self.quality_ok}, "
+            f"error={self.error})"
+        )
+
+    @property
+    def is_ok(self) -> bool:
+        return self.downloaded and self.aggregated and self.quality_ok
+
+
+def process_station(num_station: str, keep_yearly_files: bool = False) -> StationResult:
+    """
+    Aggregate the downloaded files of a station and check the quality of its histo file.
+    Run in a worker process : any error is returned in the result instead of stopping the batch.
+    :param num_station:
+    :param keep_yearly_files: Keep the date range files after the aggregation.
+    :return:
+    """
+    start = time.perf_counter()
+    result = StationResult(num_station, downloaded=True)
+    try:
+        # An existing histo file is merged with the new files instead of being replaced, and
+        # is not rewritten when there are no new files
+        result.aggregated = aggregate_histo_data(num_station)
+        result.quality_ok = verify_data_quality_in_histo_files(num_station)
+        if result.quality_ok and not keep_yearly_files:
+            delete_yearly_files(num_station)
+    except Exception as e:
+        logger.error(f"Processing of station {num_station} failed: {e}")
+        result.error = str(e)
+    result.duration = time.perf_counter() - start
+    return result
+
+
+class BatchProgress:
+    """
+    Progress of a batch of stations, logged as the downloads and the processing finish.
+    Updated from the event loop and from the threads of the process pool.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.downloaded = 0
+        self.processed = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (
+            f"BatchProgress(total={self.total}, downloaded={self.downloaded}, "
+            f"processed={self.processed}, failed={self.failed})"
+        )
+
+    def station_downloaded(self, num_station: str, is_complete: bool):
+        with self._lock:
+            self.downloaded += 1
+            logger.info(
+                f"[downloads {self.downloaded}/{self.total}] Station {num_station} "
+                f"{'downloaded' if is_complete else 'download failed'}"
+            )
+
+    def station_processed(self, result: StationResult):
+        with self._lock:
+            self.processed += 1
+            if not result.is_ok:
+                self.failed += 1
+            elapsed = time.perf_counter() - self.start
+            remaining = elapsed / self.processed * (self.total - self.processed)
+            logger.info(
+                f"[stations {self.processed}/{self.total}] Station {result.num_station} "
+                f"{'OK' if result.is_ok else 'failed'} in {result.duration:.1f} s, "
+                f"{self.failed} failed, elapsed {elapsed:.0f} s, remaining ~{remaining:.0f} s"
+            )
+
+
+def init_worker(rate_limiter_state_file: str):
+    """
+    Share the quota of the API with the other processes, for the downloads of missing dates.
+    :param rate_limiter_state_file:
+    :return:
+    """
+    configure_rate_limiter(state_file=rate_limiter_state_file)
+
+
+def run_station_batch(
+    stations: list,
+    workers: int = None,
+    max_in_flight: int = 20,
+    date_start: str = DEFAULT_PERIOD_START,
+    date_end: str = None,
+    keep_yearly_files: bool = False,
+) -> dict:
+    """
+    Create the histo files of many stations : download, aggregation, quality check, clean up.
+    The downloads of all stations share one scheduler. Each station is aggregated and checked in
+    a process pool as soon as its files are downloaded, while the other downloads go on.
+    A failed station does not stop the batch.
+    :param stations: List of station numbers.
+    :param workers: Number of processes. Default is the number of CPUs.
+    :param max_in_flight: Maximum number of orders placed and not downloaded yet.
+    :param date_start: Period start. Date str format YYYY-MM-DD.
+    :param date_end: Period end, included. Date str format YYYY-MM-DD. Default is yesterday.
+    :param keep_yearly_files: Keep the date range files after the aggregation.
+    :return: Dictionary station number -> StationResult.
+    """
+    stations = list(dict.fromkeys(str(num_station) for num_station in stations))
+    progress = BatchProgress(len(stations))
+    results = {}
+    futures = {}
+    configure_rate_limiter(state_file=RATE_LIMITER_STATE_FILE)
+
+    # Spawned workers open their own ledger connection and rate limiter
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(RATE_LIMITER_STATE_FILE,),
+    ) as executor:
+
+        def on_station_done(num_station: str, is_complete: bool):
+            progress.station_downloaded(num_station, is_complete)
+            if not is_complete:
+                results[num_station] = StationResult(
+                    num_station, error="Some files could not be downloaded"
+                )
+                progress.station_processed(results[num_station])
+                return
+            try:
+                future = executor.submit(
+                    process_station, num_station, keep_yearly_files
+                )
+            except Exception as e:
+                # Process pool broken by a crashed worker
+                logger.error(f"Processing of station {num_station} not started: {e}")
+                results[num_station] = StationResult(
+                    num_station, downloaded=True, error=str(e)
+                )
+                progress.station_processed(results[num_station])
+                return
+            future.add_done_callback(report_processed)
+            futures[num_station] = future
+
+        def report_processed(future):
+            # A worker that crashed is reported when its result is collected
+            if future.exception() is None:
+                progress.station_processed(future.result())
+
+        scheduler = DownloadScheduler(
+            max_in_flight=max_in_flight, ledger=get_download_ledger()
+        )
+        stations_to_download = set()
+        for num_station in stations:
+            for window_start, window_end in plan_station_order_windows(
+                num_station, date_start, date_end
+            ):
+                scheduler.add_job(num_station, window_start, window_end)
+                stations_to_download.add(num_station)
+
+        # Stations already downloaded are processed while the others download
+        for num_station in stations:
+            if num_station not in stations_to_download:
+                on_station_done(num_station, True)
+        if scheduler.jobs:
+            scheduler.run(on_station_done=on_station_done)
+
+        for num_station, future in futures.items():
+            try:
+                results[num_station] = future.result()
+            except Exception as e:
+                logger.error(f"Worker of station {num_station} failed: {e}")
+                results[num_station] = StationResult(
+                    num_station, downloaded=True, error=str(e)
+                )
+                progress.station_processed(results[num_station])
+
+    failed = [num_station for num_station in stations if not results[num_station].is_ok]
+    logger.info(
+        f"Batch finished: {len(stations) - len(failed)}/{len(stations)} stations OK "
+        f"in {time.perf_counter() - progress.start:.0f} s"
+    )
+    if failed:
+        logger.warning(f"Failed stations: {failed}")
+    return {num_station: results[num_station] for num_station in stations}
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(
+        description="Create the weather histo files of many stations."
+    )
+    parser.add_argument(
+        "--stations",
+        nargs="+",
+        help="Station numbers. Default is all the stations of the stations file.",
+    )
+    parser.add_argument("--stations-file", default=STATIONS_FILE_PATH)
+    parser.add_argument(
+        "--departements", nargs="+", type=int, help="Keep only these departements."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="Number of processes."
+    )
+    parser.add_argument("--max-in-flight", type=int, default=20)
+    parser.add_argument("--date-start", default=DEFAULT_PERIOD_START)
+    parser.add_argument("--date-end", default=None)
+    parser.add_argument("--keep-yearly-files", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.stations:
+        stations = args.stations
+        if args.departements:
+            stations = filter_stations_by_departement(stations, args.departements)
+    else:
+        stations = load_station_ids(args.stations_file, args.departements)
+    logger.info(f"Batch of {len(stations)} stations with {args.workers} workers")
+
+    results = run_station_batch(
+        stations,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        date_start=args.date_start,
+        date_end=args.date_end,
+        keep_yearly_files=args.keep_yearly_files,
+    )
+    return 0 if all(result.is_ok for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
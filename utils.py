@@ -5,6 +5,13 @@ from datetime import datetime
 
 from config import PROJECT_ROOT
 from logs.logging_config import logger
+from column_pipeline import ColumnPipeline
+from histo_storage import (
+    CSV,
+    HISTO_FILE_FORMAT,
+    read_histo_file,
+    write_histo_file,
+)
 
 """=====================================================================================================
 Date formats
@@ -63,18 +70,69 @@ Path names
 
 
 # Path to station histo file
-def from_station_number_to_histo_file_path(station_number: str) -> str:
+def from_station_number_to_histo_file_path(
+    station_number: str, file_format: str = HISTO_FILE_FORMAT
+) -> str:
     """
     Get the file path for the final historical data of a station.
     :param station_number:
+    :param file_format: Storage format of the file. Default is the canonical format (Parquet).
     :return:
     """
     file_path = (
-        PROJECT_ROOT + f"/data_meteo_histo/{station_number}/{station_number}_histo.csv"
+        PROJECT_ROOT
+        + f"/data_meteo_histo/{station_number}/{station_number}_histo.{file_format}"
     )
     return file_path
 
 
+def find_station_histo_file_path(station_number: str):
+    """
+    Get the path of the existing final historical data file of a station.
+    The canonical format is preferred. Files written as CSV before are still found.
+    :param station_number:
+    :return: The file path, None if the station has no histo file.
+    """
+    for file_format in (HISTO_FILE_FORMAT, CSV):
+        file_path = from_station_number_to_histo_file_path(station_number, file_format)
+        if os.path.isfile(file_path):
+            return file_path
+    return None
+
+
+# Path to the histo file of all stations
+def get_all_stations_histo_file_path(
+    file_format: str = HISTO_FILE_FORMAT, suffix: str = ""
+) -> str:
+    """
+    Get the file path for the aggregated historical data of all stations.
+    :param file_format: Storage format of the file. Default is the canonical format (Parquet).
+    :param suffix: Suffix of the file name, like _col_filtered.
+    :return:
+    """
+    return (
+        PROJECT_ROOT
+        + f"/data_meteo_histo/stations_weather_data_histo{suffix}.{file_format}"
+    )
+
+
+def get_all_stations_histo_dataset_path(suffix: str = "") -> str:
+    """
+    Get the folder of the historical data of all stations partitioned by station and year.
+    :param suffix: Suffix of the folder name, like _col_filtered.
+    :return:
+    """
+    return PROJECT_ROOT + f"/data_meteo_dataset/stations_weather_data_histo{suffix}"
+
+
+def get_correlation_matrices_file_path() -> str:
+    """
+    Get the file path of the correlation matrices of the weather variables.
+    :return:
+    """
+    return PROJECT_ROOT + "/data_meteo_dataset/correlation_matrices.parquet"
+
+
 # Path weather data per year
 def from_date_start_end_to_path_name(
     station_number: str, date_start: str, date_end: str
@@ -94,21 +152,36 @@ def from_date_start_end_to_path_name(
 
 
 """=====================================================================================================
-Dataframe CSV HISTO
+Dataframe HISTO
 ====================================================================================================="""
 
 
-def get_station_histo_df(station_number: str) -> pd.DataFrame:
+def get_station_histo_df(station_number: str, columns: list = None) -> pd.DataFrame:
     """
-    Get the historical data of a station from the CSV file.
+    Get the historical data of a station from its histo file (Parquet, or CSV written before).
     :param station_number:
+    :param columns: Columns to read. All columns if None.
     :return:
     """
-    file_path = from_station_number_to_histo_file_path(station_number)
-    df = pd.read_csv(file_path, sep=";", parse_dates=[1], dayfirst=True)
+    file_path = find_station_histo_file_path(station_number)
+    if file_path is None:
+        raise FileNotFoundError(f"No histo file found for station {station_number}")
+    df = read_histo_file(file_path, columns=columns)
     return df
 
 
+def save_station_histo_df(df: pd.DataFrame, station_number: str) -> str:
+    """
+    Save the historical data of a station to its histo file, in the canonical format.
+    :param df:
+    :param station_number:
+    :return: Path of the saved file.
+    """
+    file_path = from_station_number_to_histo_file_path(station_number)
+    write_histo_file(df, file_path)
+    return file_path
+
+
 """=====================================================================================================
     Weather data columns
 ====================================================================================================="""
@@ -121,39 +194,25 @@ def rename_columns_using_mapping(description_file_path: str, histo_file_path: st
     :param histo_file_path:
     :return:
     """
-    # Step 1: Read the description_variables_meteo.csv file to create a mapping
-    description_df = pd.read_csv(description_file_path, sep=";")
-    mnemonique_to_libelle = dict(
-        zip(description_df["Mnémonique"], description_df["Libellé"])
+    ColumnPipeline().rename_using_description_file(description_file_path).run(
+        histo_file_path, histo_file_path
     )
 
-    # Step 2: Read the 59343001_histo.csv file
-    histo_df = pd.read_csv(histo_file_path, sep=";")
-
-    # Step 3: Rename the columns in 59343001_histo.csv using the mapping
-    histo_df.rename(columns=mnemonique_to_libelle, inplace=True)
-
-    # Step 4: Save the updated DataFrame back to the CSV file
-    histo_df.to_csv(histo_file_path, sep=";", index=False)
-
 
 def filter_columns_histo_file(
     input_histo_file_path: str, output_histo_file_path: str, columns_to_keep: list
 ):
     """
     Filter the columns in the historical data file.
-    :param histo_file_path:
+    Only the columns to keep are read from the input file.
+    :param input_histo_file_path:
+    :param output_histo_file_path:
     :param columns_to_keep:
     :return:
     """
-    # Read the CSV file
-    df = pd.read_csv(input_histo_file_path, sep=";")
-
-    # Filter the columns
-    df = df[columns_to_keep]
-
-    # Save the updated DataFrame back to the CSV file
-    df.to_csv(output_histo_file_path, sep=";", index=False)
+    ColumnPipeline().select(columns_to_keep).run(
+        input_histo_file_path, output_histo_file_path
+    )
 
     logger.info(f"Columns filtered in {output_histo_file_path}")
 
@@ -162,11 +221,9 @@ def filter_columns_histo_file(
 
 def delete_space_in_colnames_file(file_path: str) -> None:
     """
-    Delete spaces in column names of a CSV file and save the changes.
-    :param file_path: Path to the CSV file.
+    Delete spaces in column names of a histo file (Parquet or CSV) and save the changes.
+    :param file_path: Path to the file.
     """
-    df = pd.read_csv(file_path, sep=";")
-    df.columns = df.columns.str.replace(" ", "_")
-    df.to_csv(file_path, sep=";", index=False)
+    ColumnPipeline().normalise_names(" ", "_").run(file_path, file_path)
 
     logger.info(f"Spaces deleted in column names of {file_path}")
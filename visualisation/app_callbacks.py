@@ -1,24 +1,40 @@
-import pandas as pd
+from functools import lru_cache
+
 from dash import Dash
 from dash.dependencies import Input, Output
 
-from visualisation.weather_data import filter_dataframe_by_poste
+from visualisation.correlation_stats import CorrelationMatrices
+from visualisation.downsampling import (
+    SCATTER_MAX_POINTS,
+    downsample_series,
+    sample_points,
+)
+from visualisation.weather_data_store import WeatherDataStore
+
 
+# Number of correlation figures kept in memory
+CORRELATION_FIGURE_CACHE_SIZE = 64
 
-def callbacks_app_visualisation(app: Dash, df: pd.DataFrame):
+
+def callbacks_app_visualisation(
+    app: Dash,
+    store: WeatherDataStore,
+    correlation_matrices: CorrelationMatrices = None,
+):
     @app.callback(
         Output("variable-graph", "figure"),
         [Input("station-id-dropdown", "value"), Input("variables-dropdown", "value")],
     )
     def update_variable_graph(station_id: str, variables: list):
-        # Load data for the selected station
-        filtered_df = filter_dataframe_by_poste(df, station_id)
-
-        # Create the figure for the selected variables
-        data = [
-            {"x": filtered_df.index, "y": filtered_df[var], "type": "line", "name": var}
-            for var in variables
-        ]
+        # Load only the selected variables of the selected station
+        variables = variables or []
+        filtered_df = store.get_station_df(station_id, variables)
+
+        # Create the figure for the selected variables, downsampled to the figure width
+        data = []
+        for var in variables:
+            series = downsample_series(filtered_df[var])
+            data.append({"x": series.index, "y": series, "type": "line", "name": var})
         variable_fig = {
             "data": data,
             "layout": {
@@ -28,20 +44,23 @@ def callbacks_app_visualisation(app: Dash, df: pd.DataFrame):
         }
         return variable_fig
 
-    @app.callback(
-        Output("correlation-graph", "figure"),
-        [
-            Input("correlation-variable1-dropdown", "value"),
-            Input("correlation-variable2-dropdown", "value"),
-        ],
-    )
-    def update_correlation_graph(corr_var1, corr_var2):
+    @lru_cache(maxsize=CORRELATION_FIGURE_CACHE_SIZE)
+    def build_correlation_figure(corr_var1: str, corr_var2: str, station_id) -> dict:
+        # Load only the two selected variables, and plot a sample of the points.
+        # For all stations, the sample is drawn when reading, not from the whole archive
+        columns = list(dict.fromkeys([corr_var1, corr_var2]))
+        if station_id is None:
+            df = store.get_all_stations_sample_df(columns, SCATTER_MAX_POINTS)
+        else:
+            df = store.get_station_df(station_id, columns)
+        df = sample_points(df[columns])
+
         # Create the figure for the correlation between the selected variables
-        correlation_fig = {
+        return {
             "data": [
                 {
-                    "x": df[corr_var1],
-                    "y": df[corr_var2],
+                    "x": df[corr_var1].tolist(),
+                    "y": df[corr_var2].tolist(),
                     "mode": "markers",
                     "name": f"{corr_var1} vs {corr_var2}",
                 }
@@ -52,4 +71,52 @@ def callbacks_app_visualisation(app: Dash, df: pd.DataFrame):
                 "yaxis": {"title": corr_var2},
             },
         }
-        return correlation_fig
+
+    @app.callback(
+        Output("correlation-statistics", "children"),
+        [
+            Input("correlation-variable1-dropdown", "value"),
+            Input("correlation-variable2-dropdown", "value"),
+            Input("correlation-scope-radio", "value"),
+            Input("station-id-dropdown", "value"),
+        ],
+    )
+    def update_correlation_statistics(corr_var1, corr_var2, scope, station_id):
+        if correlation_matrices is None:
+            return "Correlation statistics not computed."
+        if scope == "station" and station_id is None:
+            return "No station selected."
+        station_id = station_id if scope == "station" else None
+        correlations = correlation_matrices.get(corr_var1, corr_var2, station_id)
+        if not correlations:
+            return "No correlation statistics for these variables."
+        return ", ".join(
+            f"{method.capitalize()}: {correlation:.3f} ({count} days)"
+            for method, (correlation, count) in correlations.items()
+        )
+
+    @app.callback(
+        Output("correlation-graph", "figure"),
+        [
+            Input("correlation-variable1-dropdown", "value"),
+            Input("correlation-variable2-dropdown", "value"),
+            Input("correlation-scope-radio", "value"),
+            Input("station-id-dropdown", "value"),
+            Input("correlation-points-checklist", "value"),
+        ],
+    )
+    def update_correlation_graph(corr_var1, corr_var2, scope, station_id, show_points):
+        # The points are only loaded when asked, for a selected station in the station scope
+        if "show" not in (show_points or []) or (
+            scope == "station" and station_id is None
+        ):
+            return {
+                "data": [],
+                "layout": {
+                    "title": f"Correlation between {corr_var1} and {corr_var2}",
+                    "xaxis": {"title": corr_var1},
+                    "yaxis": {"title": corr_var2},
+                },
+            }
+        station_id = station_id if scope == "station" else None
+        return build_correlation_figure(corr_var1, corr_var2, station_id)
@@ -1,13 +1,11 @@
-import pandas as pd
-from dash import Dash, dcc, html
-from dash.dependencies import Input, Output
+from dash import dcc, html
 
-from visualisation.weather_data import get_unique_station_ids
+from visualisation.weather_data_store import WeatherDataStore
 
 
-def app_visualisation_layout(df: pd.DataFrame) -> html.Div:
-    station_ids = get_unique_station_ids(df)
-    columns = df.columns
+def app_visualisation_layout(store: WeatherDataStore) -> html.Div:
+    station_ids = store.station_ids
+    columns = store.variables
 
     return html.Div(
         [
@@ -59,6 +57,21 @@ def app_visualisation_layout(df: pd.DataFrame) -> html.Div:
                     ),
                 ]
             ),
+            dcc.RadioItems(
+                id="correlation-scope-radio",
+                options=[
+                    {"label": "All stations", "value": "all"},
+                    {"label": "Selected station", "value": "station"},
+                ],
+                value="all",
+                inline=True,
+            ),
+            html.Div(id="correlation-statistics"),
+            dcc.Checklist(
+                id="correlation-points-checklist",
+                options=[{"label": "Show the points", "value": "show"}],
+                value=[],
+            ),
             dcc.Graph(id="correlation-graph"),
         ]
     )
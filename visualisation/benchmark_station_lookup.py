@@ -0,0 +1,135 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from histo_dataset import write_histo_dataset
+from histo_storage import write_histo_file
+from visualisation.downsampling import downsample_series
+from visualisation.weather_data import filter_dataframe_by_poste
+from visualisation.weather_data_store import WeatherDataStore
+
+"""=====================================================================================================
+    Micro-benchmark of the station selection callback of the visualisation app
+    The callback reads the selected variables of one station through WeatherDataStore, then
+    downsamples them for the figure. Compared with a boolean scan of all the stations in memory.
+    dataset and file read from disk on each callback, cached reads from the cache of the store.
+    python -m visualisation.benchmark_station_lookup --stations 500 --days 2500
+===================================================================================================="""
+
+
+def make_weather_df(n_stations: int, n_days: int, n_variables: int) -> pd.DataFrame:
+    """
+    Build a synthetic DataFrame shaped like the all stations data, rows ordered by station.
+    :param n_stations:
+    :param n_days:
+    :param n_variables:
+    :return:
+    """
+    rng = np.random.default_rng(0)
+    station_ids = [f"{1_000_000 + i:08d}" for i in range(n_stations)]
+    dates = pd.date_range("2017-01-01", periods=n_days)
+    df = pd.DataFrame(
+        {
+            "POSTE": np.repeat(station_ids, n_days),
+            "DATE": np.tile(dates, n_stations),
+        }
+    )
+    for i in range(n_variables):
+        df[f"VARIABLE_{i}"] = rng.random(len(df)).astype("float32")
+    return df
+
+
+def time_callbacks(lookup, variables: list, station_ids: list) -> tuple:
+    """
+    Average latency of the station selection callback, in milliseconds.
+    :param lookup: Function station id -> DataFrame of the station indexed by DATE.
+    :param variables: Variables of the figure, downsampled after the lookup.
+    :param station_ids: Stations selected, one per simulated callback.
+    :return: (latency of the lookup, latency of the whole callback).
+    """
+    lookup_duration = 0.0
+    start = time.perf_counter()
+    for station_id in station_ids:
+        lookup_start = time.perf_counter()
+        station_df = lookup(station_id)
+        lookup_duration += time.perf_counter() - lookup_start
+        for var in variables:
+            downsample_series(station_df[var])
+    callback_duration = time.perf_counter() - start
+    return (
+        lookup_duration / len(station_ids) * 1000,
+        callback_duration / len(station_ids) * 1000,
+    )
+
+
+def run_benchmark(n_stations: int, n_days: int, n_variables: int, n_callbacks: int):
+    df = make_weather_df(n_stations, n_days, n_variables)
+    variables = [f"VARIABLE_{i}" for i in range(n_variables)]
+    station_ids = (
+        np.random.default_rng(1).choice(df["POSTE"].unique(), n_callbacks).tolist()
+    )
+    print(f"{len(df)} rows, {n_stations} stations, {n_callbacks} callbacks")
+
+    with tempfile.TemporaryDirectory() as folder:
+        dataset_path = os.path.join(folder, "dataset")
+        file_path = os.path.join(folder, "all_stations.parquet")
+        write_histo_dataset(
+            pa.Table.from_pandas(df, preserve_index=False), dataset_path
+        )
+        write_histo_file(df, file_path)
+
+        dataset_store = WeatherDataStore(dataset_path, file_path)
+        file_store = WeatherDataStore(os.path.join(folder, "no_dataset"), file_path)
+        cached_store = WeatherDataStore(dataset_path, file_path)
+        in_memory_df = df.set_index("DATE")
+
+        # Every selected station is read once, so that the cached lookups hit the cache
+        for station_id in set(station_ids):
+            cached_store.get_station_df(station_id, variables)
+
+        def cold_lookup(store: WeatherDataStore):
+            def lookup(station_id):
+                store.clear_cache()
+                return store.get_station_df(station_id, variables)
+
+            return lookup
+
+        results = {
+            "scan": time_callbacks(
+                lambda station_id: filter_dataframe_by_poste(in_memory_df, station_id),
+                variables,
+                station_ids,
+            ),
+            "dataset": time_callbacks(
+                cold_lookup(dataset_store), variables, station_ids
+            ),
+            "file": time_callbacks(cold_lookup(file_store), variables, station_ids),
+            "cached": time_callbacks(
+                lambda station_id: cached_store.get_station_df(station_id, variables),
+                variables,
+                station_ids,
+            ),
+        }
+    for name, (lookup_latency, callback_latency) in results.items():
+        print(
+            f"{name:>10}: lookup {lookup_latency:.3f} ms, "
+            f"callback {callback_latency:.3f} ms"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Latency of the station selection callback"
+    )
+    parser.add_argument("--stations", type=int, default=500)
+    parser.add_argument("--days", type=int, default=2500)
+    parser.add_argument("--variables", type=int, default=5)
+    parser.add_argument("--callbacks", type=int, default=200)
+    args = parser.parse_args()
+    run_benchmark(args.stations, args.days, args.variables, args.callbacks)
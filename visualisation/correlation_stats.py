@@ -0,0 +1,209 @@
+import os
+import numpy as np
+import pandas as pd
+
+from logs.logging_config import logger
+from histo_dataset import read_histo_dataset, read_histo_dataset_columns
+from histo_schema import normalise_station_id
+from histo_storage import write_histo_file, read_histo_file
+from visualisation.weather_data_store import station_partition_pattern
+
+"""=====================================================================================================
+    Correlation matrices of the weather variables, computed once when the dataset is built
+    Long format : POSTE (None for all stations), METHOD, VARIABLE_1, VARIABLE_2, CORRELATION, COUNT
+===================================================================================================="""
+
+PEARSON = "pearson"
+SPEARMAN = "spearman"
+
+# Key of the correlations of all stations in CorrelationMatrices
+ALL_STATIONS = "ALL"
+
+# Rows of all stations used for the Spearman correlation of all stations
+GLOBAL_SPEARMAN_SAMPLE_SIZE = 1_000_000
+
+
+def get_pairwise_sums(values: np.ndarray) -> dict:
+    """
+    Sums needed by the Pearson correlation of every pair of columns, on the rows where both
+    values exist. Sums of several blocks of rows add up : the correlation of all stations is
+    computed one station at a time.
+    :param values: 2-D array, one column per variable. NaN are missing values.
+    :return: Dictionary of k x k matrices count, x, y, xx, yy, xy. x is the column of the row,
+    y the column of the column.
+    """
+    present = (~np.isnan(values)).astype(float)
+    filled = np.nan_to_num(values)
+    return {
+        "count": present.T @ present,
+        "x": filled.T @ present,
+        "y": present.T @ filled,
+        "xx": (filled**2).T @ present,
+        "yy": present.T @ filled**2,
+        "xy": filled.T @ filled,
+    }
+
+
+def add_pairwise_sums(sums: dict, other_sums: dict) -> dict:
+    if sums is None:
+        return other_sums
+    return {key: sums[key] + other_sums[key] for key in sums}
+
+
+def pearson_from_sums(sums: dict) -> tuple:
+    """
+    Pearson correlation of every pair of columns from their pairwise sums.
+    :param sums: Output of get_pairwise_sums.
+    :return: (correlation matrix, count matrix). NaN when a pair has less than 2 rows or a
+    constant column.
+    """
+    count = sums["count"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = count * sums["xy"] - sums["x"] * sums["y"]
+        variance_x = count * sums["xx"] - sums["x"] ** 2
+        variance_y = count * sums["yy"] - sums["y"] ** 2
+        correlation = covariance / np.sqrt(variance_x * variance_y)
+    correlation[count < 2] = np.nan
+    return np.clip(correlation, -1, 1), count
+
+
+def matrix_to_rows(
+    matrix: np.ndarray, count: np.ndarray, variables: list, station, method: str
+) -> pd.DataFrame:
+    """
+    Long format of a correlation matrix, one row per pair of variables.
+    :param matrix:
+    :param count:
+    :param variables:
+    :param station: Station number, None for all stations.
+    :param method: PEARSON or SPEARMAN.
+    :return:
+    """
+    k = len(variables)
+    return pd.DataFrame(
+        {
+            "POSTE": pd.array([station] * k * k, dtype="string"),
+            "METHOD": method,
+            "VARIABLE_1": np.repeat(variables, k),
+            "VARIABLE_2": np.tile(variables, k),
+            "CORRELATION": matrix.ravel(),
+            "COUNT": count.ravel().astype(np.int64),
+        }
+    )
+
+
+def compute_correlation_matrices(
+    dataset_path: str,
+    output_file_path: str,
+    sample_size: int = GLOBAL_SPEARMAN_SAMPLE_SIZE,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Compute the Pearson and Spearman correlation matrices of the weather variables, for each
+    station and for all stations. The stations are read one at a time.
+    The Pearson correlation of all stations is exact. The Spearman correlation of all stations is
+    computed on a random sample of the rows, since ranks cannot be summed by station.
+    :param dataset_path: Folder of the partitioned dataset.
+    :param output_file_path: Parquet file of the matrices.
+    :param sample_size: Number of rows of the sample for the Spearman correlation of all stations.
+    :param seed:
+    :return: The matrices in long format.
+    """
+    variables = [
+        column
+        for column in read_histo_dataset_columns(dataset_path)
+        if column not in ("POSTE", "DATE")
+    ]
+    station_ids = sorted(
+        normalise_station_id(match.group(1))
+        for match in map(station_partition_pattern.match, os.listdir(dataset_path))
+        if match
+    )
+    total_rows = 0
+    rng = np.random.default_rng(seed)
+    keep_probability = 1.0
+
+    matrices = []
+    global_sums = None
+    samples = []
+    for station_id in station_ids:
+        df = read_histo_dataset(dataset_path, stations=[station_id], columns=variables)
+        values = df[variables].to_numpy(dtype=float, na_value=np.nan)
+        total_rows += len(values)
+
+        sums = get_pairwise_sums(values)
+        global_sums = add_pairwise_sums(global_sums, sums)
+        pearson, count = pearson_from_sums(sums)
+        matrices.append(matrix_to_rows(pearson, count, variables, station_id, PEARSON))
+
+        spearman = df[variables].corr(method=SPEARMAN).to_numpy()
+        matrices.append(
+            matrix_to_rows(spearman, count, variables, station_id, SPEARMAN)
+        )
+
+        # Every row is kept in the sample with the same probability, halved when the sample
+        # grows over twice its size
+        samples.append(values[rng.random(len(values)) < keep_probability])
+        if sum(len(sample) for sample in samples) > 2 * sample_size:
+            pooled = np.concatenate(samples)
+            samples = [pooled[rng.random(len(pooled)) < 0.5]]
+            keep_probability /= 2
+
+    if global_sums is not None:
+        pearson, count = pearson_from_sums(global_sums)
+        matrices.append(matrix_to_rows(pearson, count, variables, None, PEARSON))
+
+        pooled = np.concatenate(samples)
+        if len(pooled) > sample_size:
+            pooled = pooled[rng.choice(len(pooled), size=sample_size, replace=False)]
+        spearman = pd.DataFrame(pooled, columns=variables).corr(method=SPEARMAN)
+        sample_count = get_pairwise_sums(pooled)["count"]
+        matrices.append(
+            matrix_to_rows(spearman.to_numpy(), sample_count, variables, None, SPEARMAN)
+        )
+
+    matrices_df = pd.concat(matrices, ignore_index=True)
+    write_histo_file(matrices_df, output_file_path)
+    logger.info(
+        f"Correlation matrices of {len(station_ids)} stations and {total_rows} rows "
+        f"saved to {output_file_path}"
+    )
+    return matrices_df
+
+
+class CorrelationMatrices:
+    """
+    Precomputed correlation matrices, indexed for an instant lookup of a pair of variables.
+    """
+
+    def __init__(self, file_path: str):
+        """
+
+        :param file_path: Parquet file written by compute_correlation_matrices.
+        """
+        self.file_path = file_path
+        df = read_histo_file(file_path)
+        df["POSTE"] = df["POSTE"].astype("string").fillna(ALL_STATIONS).astype(object)
+        self.correlations = df.set_index(
+            ["METHOD", "POSTE", "VARIABLE_1", "VARIABLE_2"]
+        ).sort_index()
+
+    def __repr__(self):
+        return f"CorrelationMatrices(file_path={self.file_path}, pairs={len(self.correlations)})"
+
+    def get(self, variable_1: str, variable_2: str, station=None) -> dict:
+        """
+        Get the correlations of a pair of variables.
+        :param variable_1:
+        :param variable_2:
+        :param station: Station number, None for all stations.
+        :return: Dictionary method -> (correlation, count). Empty if the pair is unknown.
+        """
+        station = ALL_STATIONS if station is None else normalise_station_id(station)
+        correlations = {}
+        for method in (PEARSON, SPEARMAN):
+            key = (method, station, variable_1, variable_2)
+            if key in self.correlations.index:
+                row = self.correlations.loc[key]
+                correlations[method] = (row["CORRELATION"], int(row["COUNT"]))
+        return correlations
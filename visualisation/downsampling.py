@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+"""=====================================================================================================
+    Downsampling of the figures data : the size of the payload sent to the browser does not grow
+    with the history
+===================================================================================================="""
+
+# Width of the plot area in pixels : more points per line than pixels are not visible
+FIGURE_WIDTH = 1200
+
+# Maximum number of points of a scatter figure
+SCATTER_MAX_POINTS = 20_000
+
+LTTB = "lttb"
+MIN_MAX = "min_max"
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets : select the points that keep the visual shape of a line.
+    The first and last points are kept. Each bucket keeps the point forming the largest triangle
+    with the point kept in the previous bucket and the mean of the next bucket.
+    :param x: Sorted x values, as numbers.
+    :param y: y values, without NaN.
+    :param n_out: Number of points to keep.
+    :return: Sorted indices of the kept points.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        mean_x = x[next_start:next_end].mean()
+        mean_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - mean_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (mean_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def min_max_indices(y: np.ndarray, n_buckets: int) -> np.ndarray:
+    """
+    Keep the minimum and the maximum of each bucket of consecutive points, and the first and
+    last points. Peaks are never lost.
+    :param y: y values. NaN are ignored.
+    :param n_buckets: Number of buckets, 2 points are kept per bucket.
+    :return: Sorted indices of the kept points.
+    """
+    n = len(y)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+
+    values = pd.Series(y)
+    buckets = values.groupby(np.arange(n) * n_buckets // n)
+    indices = np.concatenate(
+        [
+            [0, n - 1],
+            buckets.idxmin().dropna().to_numpy(dtype=np.int64),
+            buckets.idxmax().dropna().to_numpy(dtype=np.int64),
+        ]
+    )
+    return np.unique(indices)
+
+
+def downsample_series(
+    series: pd.Series, max_points: int = FIGURE_WIDTH, method: str = LTTB
+) -> pd.Series:
+    """
+    Downsample a time series for a line figure.
+    :param series: Series indexed by DATE.
+    :param max_points: Maximum number of points kept.
+    :param method: LTTB or MIN_MAX.
+    :return: The kept points of the series.
+    """
+    series = series.dropna()
+    if len(series) <= max_points:
+        return series
+
+    if method == MIN_MAX:
+        indices = min_max_indices(series.to_numpy(dtype=float), max_points // 2)
+    elif method == LTTB:
+        index = series.index
+        if isinstance(index, pd.DatetimeIndex):
+            x = index.asi8.astype(float)
+        else:
+            x = np.arange(len(series), dtype=float)
+        indices = lttb_indices(x, series.to_numpy(dtype=float), max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    return series.iloc[indices]
+
+
+def sample_points(
+    df: pd.DataFrame, max_points: int = SCATTER_MAX_POINTS, seed: int = 0
+) -> pd.DataFrame:
+    """
+    Random sample of the rows of a scatter figure. Rows with a missing value are not plotted.
+    The sample is the same for the same data : the figure does not change between two requests.
+    :param df: Columns of the scatter figure.
+    :param max_points: Maximum number of rows kept.
+    :param seed:
+    :return:
+    """
+    df = df.dropna()
+    if len(df) <= max_points:
+        return df
+    rng = np.random.default_rng(seed)
+    indices = np.sort(rng.choice(len(df), size=max_points, replace=False))
+    return df.iloc[indices]
@@ -1,29 +1,29 @@
-import pandas as pd
-from dash import Dash, dcc, html
-from dash.dependencies import Input, Output
+import os
 
+from dash import Dash
+
+from utils import get_correlation_matrices_file_path
 from visualisation.app_callbacks import callbacks_app_visualisation
 from visualisation.app_layout import app_visualisation_layout
-from visualisation.weather_data import load_histo_weather_data_all_stations
+from visualisation.correlation_stats import CorrelationMatrices
+from visualisation.weather_data_store import WeatherDataStore
 
-# Load the CSV data
-df = load_histo_weather_data_all_stations()
+# Only the station index is loaded at startup, station data is read on demand
+store = WeatherDataStore()
 
-# Ensure DATE is parsed and set as the index
-df["DATE"] = pd.to_datetime(df["DATE"])
-df.set_index("DATE", inplace=True)
+# Correlation statistics precomputed when the dataset is built
+correlation_matrices = None
+if os.path.isfile(get_correlation_matrices_file_path()):
+    correlation_matrices = CorrelationMatrices(get_correlation_matrices_file_path())
 
 # Initialize the Dash app
 app = Dash(__name__)
 
-# Get the list of columns for dropdown options
-columns = df.columns
-
 # Define the layout of the app
-app.layout = app_visualisation_layout(df)
+app.layout = app_visualisation_layout(store)
 
 # Define the callbacks for the app
-callbacks_app_visualisation(app, df)
+callbacks_app_visualisation(app, store, correlation_matrices)
 
 
 # Run the app
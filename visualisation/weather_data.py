@@ -2,31 +2,62 @@ import pandas as pd
 import os
 
 from config import PROJECT_ROOT
-from utils import from_station_number_to_histo_file_path
+from histo_dataset import read_histo_dataset
+from histo_schema import normalise_station_id
+from histo_storage import read_histo_file
+from utils import (
+    find_station_histo_file_path,
+    get_all_stations_histo_dataset_path,
+    get_all_stations_histo_file_path,
+)
 
 """=====================================================================================================
     Load data
 ===================================================================================================="""
 
 
-def load_histo_weather_data_all_stations() -> pd.DataFrame:
+def load_histo_weather_data_all_stations(
+    stations: list = None,
+    date_start: str = None,
+    date_end: str = None,
+    columns: list = None,
+) -> pd.DataFrame:
     """
-    Load the historical data of all stations.
+    Load the historical data of all stations, or only of some stations, dates and columns.
+    The dataset partitioned by station and year is read when it exists : only the matching
+    partitions and columns are loaded. Otherwise the aggregated file is read.
+    :param stations: Station numbers. All stations if None.
+    :param date_start: First date, included. Date str format YYYY-MM-DD.
+    :param date_end: Last date, included. Date str format YYYY-MM-DD.
+    :param columns: Columns to read. All columns if None.
     :return:
     """
-    file_path = PROJECT_ROOT + "/data_meteo_histo/stations_weather_data_histo.csv"
-    df = pd.read_csv(file_path, delimiter=";", decimal=",")
+    dataset_path = get_all_stations_histo_dataset_path()
+    if os.path.isdir(dataset_path):
+        return read_histo_dataset(dataset_path, stations, date_start, date_end, columns)
+
+    filters = []
+    if stations is not None:
+        filters.append(
+            ("POSTE", "in", [normalise_station_id(station) for station in stations])
+        )
+    if date_start is not None:
+        filters.append(("DATE", ">=", pd.Timestamp(date_start)))
+    if date_end is not None:
+        filters.append(("DATE", "<=", pd.Timestamp(date_end)))
+    file_path = get_all_stations_histo_file_path()
+    df = read_histo_file(file_path, columns=columns, filters=filters)
     return df
 
 
 def load_histo_weather_data_station(station_number: str) -> pd.DataFrame:
     """
-    Get the historical data of a station from the CSV file.
+    Get the historical data of a station from its histo file.
     :param station_number:
     :return:
     """
-    file_path = from_station_number_to_histo_file_path(station_number)
-    df = pd.read_csv(file_path, delimiter=";", decimal=",")
+    file_path = find_station_histo_file_path(station_number)
+    df = read_histo_file(file_path)
     return df
 
 
@@ -42,7 +73,7 @@ def get_all_stations_ids_retrieved() -> list:
     """
     # Get the list of all station numbers
     stations = os.listdir(PROJECT_ROOT + "/data_meteo_histo/")
-    stations = [int(station) for station in stations]
+    stations = [station for station in stations if station.isdigit()]
     return stations
 
 
@@ -0,0 +1,176 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from histo_dataset import (
+    read_histo_dataset,
+    read_histo_dataset_columns,
+    read_histo_dataset_sample,
+)
+from histo_schema import normalise_station_id
+from histo_storage import read_histo_columns, read_histo_file, read_histo_file_sample
+from utils import get_all_stations_histo_dataset_path, get_all_stations_histo_file_path
+
+station_partition_pattern = re.compile(r"^POSTE=(\d+)$")
+
+# Maximum memory of the DataFrames kept in the cache
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+class WeatherDataStore:
+    """
+    On demand access to the historical data of all stations for the visualisation app.
+    Only the station index and the column names are loaded when the store is created. The data of a
+    station is read from the partitioned dataset (or the aggregated file) when it is requested, with
+    only the requested columns, and kept in a LRU cache bounded by the memory of the DataFrames.
+    """
+
+    def __init__(
+        self,
+        dataset_path: str = None,
+        file_path: str = None,
+        cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+    ):
+        """
+
+        :param dataset_path: Folder of the partitioned dataset. Default is the all stations dataset.
+        :param file_path: Aggregated file, read when the dataset does not exist.
+        :param cache_max_bytes: Maximum memory of the DataFrames kept in the cache. A DataFrame
+        larger than this is read for each request and not cached.
+        """
+        if dataset_path is None:
+            dataset_path = get_all_stations_histo_dataset_path()
+        if file_path is None:
+            file_path = get_all_stations_histo_file_path()
+
+        self.dataset_path = dataset_path if os.path.isdir(dataset_path) else None
+        self.file_path = file_path
+        self.cache_max_bytes = cache_max_bytes
+
+        if self.dataset_path is not None:
+            self.station_ids = sorted(
+                normalise_station_id(match.group(1))
+                for match in map(
+                    station_partition_pattern.match, os.listdir(self.dataset_path)
+                )
+                if match
+            )
+            self.columns = read_histo_dataset_columns(self.dataset_path)
+        else:
+            self.station_ids = sorted(
+                read_histo_file(self.file_path, columns=["POSTE"])["POSTE"]
+                .dropna()
+                .unique()
+                .tolist()
+            )
+            self.columns = read_histo_columns(self.file_path)
+
+        # Weather variables, without the station and date keys
+        self.variables = [
+            column for column in self.columns if column not in ("POSTE", "DATE")
+        ]
+
+        # Cache key (station, columns) -> (DataFrame, bytes), least recently used first
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (
+            f"WeatherDataStore(source={self.dataset_path or self.file_path}, "
+            f"stations={len(self.station_ids)}, cached={len(self._cache)}, "
+            f"cache_bytes={self._cache_bytes})"
+        )
+
+    def _read(self, station_id, columns: tuple) -> pd.DataFrame:
+        read_columns = ["POSTE", "DATE"] + [
+            column for column in columns if column not in ("POSTE", "DATE")
+        ]
+        if self.dataset_path is not None:
+            stations = None if station_id is None else [station_id]
+            df = read_histo_dataset(
+                self.dataset_path, stations=stations, columns=read_columns
+            )
+        else:
+            filters = None if station_id is None else [("POSTE", "==", station_id)]
+            df = read_histo_file(self.file_path, columns=read_columns, filters=filters)
+        return df.set_index("DATE").sort_index()
+
+    def _read_cached(self, station_id, columns: tuple) -> pd.DataFrame:
+        """
+        Read from the cache, or from disk then keep the result in the cache. The least recently
+        used DataFrames are evicted until the cache fits its maximum memory.
+        :param station_id: Station number. All stations if None.
+        :param columns: Weather variables to read.
+        :return:
+        """
+        key = (station_id, columns)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key][0]
+
+        df = self._read(station_id, columns)
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.cache_max_bytes:
+            return df
+
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = (df, size)
+                self._cache_bytes += size
+            while self._cache_bytes > self.cache_max_bytes:
+                _, (_, evicted_size) = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted_size
+        return df
+
+    def get_station_df(self, station_id, columns: list) -> pd.DataFrame:
+        """
+        Get the data of a station, indexed by DATE.
+        The returned DataFrame is shared with the cache and must not be modified.
+        :param station_id: Station number. None when no station is selected.
+        :param columns: Weather variables to read.
+        :return: Empty DataFrame if no station is selected.
+        """
+        if station_id is None:
+            return pd.DataFrame(
+                columns=list(columns), index=pd.DatetimeIndex([], name="DATE")
+            )
+        return self._read_cached(normalise_station_id(station_id), tuple(columns))
+
+    def get_all_stations_df(self, columns: list) -> pd.DataFrame:
+        """
+        Get some weather variables of all stations, indexed by DATE.
+        The returned DataFrame is shared with the cache and must not be modified.
+        :param columns: Weather variables to read.
+        :return:
+        """
+        return self._read_cached(None, tuple(columns))
+
+    def get_all_stations_sample_df(self, columns: list, n_rows: int) -> pd.DataFrame:
+        """
+        Get some weather variables of a random sample of the rows of all stations, indexed by DATE.
+        Only the sampled partitions (or row groups of the aggregated file) are read from disk. The
+        sample is the same for each call.
+        :param columns: Weather variables to read.
+        :param n_rows: Minimum number of rows to read, if the data has them.
+        :return:
+        """
+        read_columns = ["POSTE", "DATE"] + [
+            column for column in columns if column not in ("POSTE", "DATE")
+        ]
+        if self.dataset_path is not None:
+            df = read_histo_dataset_sample(
+                self.dataset_path, n_rows, columns=read_columns
+            )
+        else:
+            df = read_histo_file_sample(self.file_path, n_rows, columns=read_columns)
+        return df.set_index("DATE").sort_index()
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0